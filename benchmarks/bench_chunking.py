@@ -0,0 +1,86 @@
+"""
+Chunker comparison: recursive 500/100 splitter vs the layout-aware chunker.
+
+For the sample lab report (OCR text) it reports vectors per document, embedded tokens
+(embedding cost), and retrieval quality with the offline hashing embedder: for every eval
+question, the share of its facts (e.g. "TOTAL CHOLESTEROL" together with "165") found
+inside a single retrieved chunk in the top k, and the context tokens those k chunks add
+to the prompt.
+
+Usage:
+    python -m benchmarks.bench_chunking [--pages 4] [--k 3] [--budgets 120,200,300]
+"""
+import argparse
+import json
+from pathlib import Path
+
+from langchain_core.documents import Document
+
+from server.reports.chunking import chunk_documents
+from server.utils import estimate_tokens
+from benchmarks.fakes import FakeEmbeddings, LocalIndex
+
+DATA_FILE = Path(__file__).parent / "data" / "lipid_profile_ocr.txt"
+
+# Each fact group must appear in one chunk for the chunk to answer that part of the question
+QUESTIONS = [
+    ("What is the total cholesterol level for Mrs. Priyani Almeda?", [["total cholesterol", "165"]]),
+    ("Are there any abnormal results in the lipid profile? Which ones are high?",
+     [["triglycerides", "244", "10 - 200"], ["vldl cholesterol", "48.8", "10 - 41"]]),
+    ("When was this sample collected and who referred the patient?",
+     [["collected", "05 dec, 2025"], ["referred", "kalubowila"]]),
+    ("What is the HDL to LDL ratio listed in the report?", [["hdl / ldl ratio", "0.6"]]),
+    ("Based on the target levels provided, is the LDL cholesterol considered optimal?",
+     [["ldl cholesterol", "71.2"], ["< 100mg/dl", "optimal"]]),
+]
+
+
+def evaluate(chunks: list, pages: int, k: int) -> dict:
+    embedder, index = FakeEmbeddings(), LocalIndex()
+    texts = [c.page_content for c in chunks]
+    index.upsert(vectors=[(str(i), v, {"text": t}) for i, (t, v) in enumerate(zip(texts, embedder.embed_documents(texts)))])
+
+    found, total, context_tokens = 0, 0, 0
+    for question, groups in QUESTIONS:
+        matches = index.query(embedder.embed_query(question), top_k=k, include_metadata=True)["matches"]
+        retrieved = [m["metadata"]["text"].lower() for m in matches]
+        context_tokens += sum(estimate_tokens(t) for t in retrieved)
+        for group in groups:
+            total += 1
+            found += any(all(fact in text for fact in group) for text in retrieved)
+
+    return {
+        "vectors_per_document": len(chunks),
+        "vectors_per_page": len(chunks) / pages,
+        "embedded_tokens": sum(estimate_tokens(t) for t in texts),
+        f"fact_recall@{k}": found / total,
+        f"context_tokens@{k}": context_tokens / len(QUESTIONS),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare chunkers on the sample lab report.")
+    parser.add_argument("--pages", type=int, default=4, help="Report pages (the sample page repeated)")
+    parser.add_argument("--k", type=int, default=3, help="Chunks retrieved per question")
+    parser.add_argument("--budgets", default="120,200,300", help="Layout chunker token budgets")
+    parser.add_argument("--output", help="Write results as JSON")
+    args = parser.parse_args()
+
+    text = DATA_FILE.read_text()
+    documents = [Document(page_content=text, metadata={"page": p}) for p in range(1, args.pages + 1)]
+
+    results = {"recursive 500/100": evaluate(chunk_documents(documents, chunker="recursive"), args.pages, args.k)}
+    for budget in (int(b) for b in args.budgets.split(",")):
+        chunks = chunk_documents(documents, chunker="layout", token_budget=budget)
+        results[f"layout {budget} tok"] = evaluate(chunks, args.pages, args.k)
+
+    for name, r in results.items():
+        print(f"{name:18s} {r['vectors_per_document']:3d} vectors ({r['vectors_per_page']:.1f}/page) | "
+              f"{r['embedded_tokens']:5d} embedded tokens | fact recall@{args.k} {r[f'fact_recall@{args.k}']:.2f} | "
+              f"context {r[f'context_tokens@{args.k}']:.0f} tok")
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
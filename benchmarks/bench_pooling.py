@@ -0,0 +1,133 @@
+"""
+Connection-reuse microbenchmark for the provider registry (server/config/services.py).
+
+Starts a local HTTPS stand-in for an embeddings API (self-signed certificate) and sends
+the same requests two ways:
+  - per-call client: a new HTTP client per request, as when an SDK object was built
+    per upload (every request pays a TCP + TLS handshake)
+  - shared pool:     one keep-alive pool reused by every request, as the registry does
+
+Usage:
+    python -m benchmarks.bench_pooling [--requests 200] [--threads 8]
+"""
+import argparse
+import datetime
+import json
+import ssl
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import httpx
+
+from server.config.services import HTTP_KEEPALIVE_SECONDS
+
+RESPONSE = json.dumps({"data": [{"embedding": [0.0] * 1536, "index": 0}]}).encode()
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    connections = 0
+    lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        with StandInHandler.lock:
+            StandInHandler.connections += 1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(RESPONSE)))
+        self.end_headers()
+        self.wfile.write(RESPONSE)
+
+    def log_message(self, *args):
+        pass
+
+
+def _self_signed_cert(directory: str) -> tuple:
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "localhost")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (x509.CertificateBuilder().subject_name(name).issuer_name(name).public_key(key.public_key())
+            .serial_number(x509.random_serial_number()).not_valid_before(now)
+            .not_valid_after(now + datetime.timedelta(days=1)).sign(key, hashes.SHA256()))
+
+    cert_path, key_path = Path(directory) / "cert.pem", Path(directory) / "key.pem"
+    cert_path.write_bytes(cert.public_bytes(serialization.Encoding.PEM))
+    key_path.write_bytes(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                           serialization.NoEncryption()))
+    return str(cert_path), str(key_path)
+
+
+def start_server(directory: str):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(*_self_signed_cert(directory))
+    server.socket = context.wrap_socket(server.socket, server_side=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"https://127.0.0.1:{server.server_address[1]}/v1/embeddings"
+
+
+def run(mode: str, url: str, n: int, threads: int) -> dict:
+    payload = {"input": "TOTAL CHOLESTEROL 165 mg/dL", "model": "text-embedding-3-small"}
+    limits = httpx.Limits(max_connections=threads, max_keepalive_connections=threads,
+                          keepalive_expiry=HTTP_KEEPALIVE_SECONDS)
+    shared = httpx.Client(verify=False, limits=limits) if mode == "shared" else None
+    latencies = []
+
+    def one(_):
+        start = time.perf_counter()
+        if shared is not None:
+            shared.post(url, json=payload).raise_for_status()
+        else:
+            with httpx.Client(verify=False) as client:
+                client.post(url, json=payload).raise_for_status()
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    StandInHandler.connections = 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(one, range(n)))
+    elapsed = time.perf_counter() - start
+    if shared is not None:
+        shared.close()
+
+    return {
+        "connections": StandInHandler.connections,
+        "throughput_rps": n / elapsed,
+        "p50_ms": statistics.median(latencies),
+        "p95_ms": sorted(latencies)[int(0.95 * (len(latencies) - 1))],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pooled vs per-call HTTP clients.")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        server, url = start_server(directory)
+        try:
+            for mode in ("per-call", "shared"):
+                r = run(mode, url, args.requests, args.threads)
+                print(f"{mode:9s}: {r['connections']:4d} TLS handshakes for {args.requests} requests | "
+                      f"{r['throughput_rps']:7.1f} req/s | p50={r['p50_ms']:.2f}ms p95={r['p95_ms']:.2f}ms")
+        finally:
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
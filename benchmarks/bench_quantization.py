@@ -0,0 +1,160 @@
+"""
+Embedding width and quantized storage: recall, latency and memory.
+
+Indexes the sample lab report for many patients (each copy with its own lab values)
+into the local index at several embedding widths and storage modes, then reports:
+
+  fact_recall@k   eval-set facts found in the top k chunks of the patient's report
+                  (doc-filtered, as /diagnosis/chat queries)
+  overlap@k       agreement with exact float32 search at full width, over all vectors
+  score ratio     reference (full-width float32) similarity of the returned top k over
+                  that of the exact top k; unlike overlap it does not penalise swapping
+                  near-duplicate chunks (the other patients' copies of the same template)
+  p50/p95 ms      unfiltered query latency (scan plus exact rescoring)
+  scan MB         memory held by the scan codes (full vectors stay on disk)
+
+Offline, narrower widths come from the hashing embedder with fewer buckets, a proxy for
+the shortened output of text-embedding-3 models; --live embeds with EMBED_MODEL at each
+width instead (needs OPENAI_API_KEY). The hashing embedder's vectors are sparse, so its
+sign bits carry less than a dense model's: offline binary results are pessimistic.
+
+Usage:
+    python -m benchmarks.bench_quantization [--reports 500] [--dims 384,256,128]
+        [--storages float32,int8,binary] [--live --dims 1536,512,256]
+"""
+import argparse
+import json
+import random
+import re
+import statistics
+import time
+from pathlib import Path
+
+import numpy as np
+from langchain_core.documents import Document
+
+from server.reports.chunking import chunk_documents
+from server.reports.local_index import LocalVectorIndex
+from benchmarks.fakes import FakeEmbeddings
+from benchmarks.bench_chunking import QUESTIONS, DATA_FILE
+
+NUMBER_RE = re.compile(r"\b\d+\.\d+\b|\b\d{2,3}\b")
+
+
+def build_corpus(reports: int, pages: int, seed: int = 7) -> list:
+    """[(vector id, doc_id, chunk text)]; report-0 is the sample as is, the rest vary its values."""
+    text = DATA_FILE.read_text()
+    rng = random.Random(seed)
+    corpus = []
+
+    def vary(m):
+        return str(round(float(m.group()) * rng.uniform(0.7, 1.3), 1))
+
+    for r in range(reports):
+        variant = text if r == 0 else NUMBER_RE.sub(vary, text)
+        documents = [Document(page_content=variant, metadata={"page": p}) for p in range(1, pages + 1)]
+        for i, chunk in enumerate(chunk_documents(documents)):
+            corpus.append((f"report-{r}-{i}", f"report-{r}", chunk.page_content))
+    return corpus
+
+
+def probe_queries(corpus: list, n: int, seed: int = 11) -> list:
+    """The eval questions plus n word windows cut from random chunks."""
+    rng = random.Random(seed)
+    queries = [q for q, _ in QUESTIONS]
+    for _ in range(n):
+        words = rng.choice(corpus)[2].split()
+        start = rng.randrange(max(1, len(words) - 8))
+        queries.append(" ".join(words[start:start + 8]))
+    return queries
+
+
+def make_embedder(dim: int, live: bool):
+    if live:
+        from server.config.services import get_embed_model, EMBED_MODEL
+        return get_embed_model(EMBED_MODEL, dim)
+    return FakeEmbeddings(dimension=dim)
+
+
+def evaluate(index: LocalVectorIndex, corpus_text: dict, question_vectors: list, probe_vectors: list,
+             reference: dict, k: int) -> dict:
+    found, total = 0, 0
+    for (question, groups), vector in zip(QUESTIONS, question_vectors):
+        matches = index.query(vector=vector, top_k=k, filter={"doc_id": "report-0"})["matches"]
+        retrieved = [corpus_text[m["id"]].lower() for m in matches]
+        for group in groups:
+            total += 1
+            found += any(all(fact in text for fact in group) for text in retrieved)
+
+    overlaps, ratios, latencies = [], [], []
+    for i, vector in enumerate(probe_vectors):
+        start = time.perf_counter()
+        matches = index.query(vector=vector, top_k=k)["matches"]
+        latencies.append((time.perf_counter() - start) * 1000)
+        scores = reference["scores"][i]
+        overlaps.append(len(reference["top"][i] & {m["id"] for m in matches}) / k)
+        ratios.append(sum(scores[reference["rows"][m["id"]]] for m in matches) / reference["best"][i])
+
+    ordered = sorted(latencies)
+    return {
+        f"fact_recall@{k}": found / total,
+        f"overlap@{k}": statistics.mean(overlaps),
+        "score_ratio": statistics.mean(ratios),
+        "p50_ms": ordered[len(ordered) // 2],
+        "p95_ms": ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))],
+        "scan_mb": index.memory_bytes() / (1024 * 1024),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare embedding widths and quantized storage modes.")
+    parser.add_argument("--reports", type=int, default=500, help="Patients' reports indexed")
+    parser.add_argument("--pages", type=int, default=4, help="Pages per report")
+    parser.add_argument("--dims", default="384,256,128", help="Embedding widths (the first is the reference)")
+    parser.add_argument("--storages", default="float32,int8,binary", help="Storage modes")
+    parser.add_argument("--queries", type=int, default=100, help="Probe queries for overlap and latency")
+    parser.add_argument("--k", type=int, default=3, help="Results per query")
+    parser.add_argument("--live", action="store_true", help="Embed with EMBED_MODEL (OpenAI) instead of the fake")
+    parser.add_argument("--output", help="Write results as JSON")
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.reports, args.pages)
+    corpus_text = {vid: text for vid, _, text in corpus}
+    queries = probe_queries(corpus, args.queries)
+    dims = [int(d) for d in args.dims.split(",")]
+    print(f"{len(corpus)} vectors, {len(queries)} probe queries")
+
+    results, reference = {}, None
+    for dim in dims:
+        embedder = make_embedder(dim, args.live)
+        vectors = embedder.embed_documents([text for _, _, text in corpus])
+        question_vectors = [embedder.embed_query(q) for q, _ in QUESTIONS]
+        probe_vectors = [embedder.embed_query(q) for q in queries]
+        if reference is None:
+            # Reference: exact search at the first (full) width
+            matrix = np.asarray(vectors, dtype=np.float32)
+            ids = [vid for vid, _, _ in corpus]
+            scores = [matrix @ np.asarray(v, dtype=np.float32) for v in probe_vectors]
+            top = [np.argsort(-s)[:args.k] for s in scores]
+            reference = {
+                "rows": {vid: i for i, vid in enumerate(ids)},
+                "scores": scores,
+                "top": [{ids[i] for i in t} for t in top],
+                "best": [float(s[t].sum()) for s, t in zip(scores, top)],
+            }
+
+        for storage in args.storages.split(","):
+            index = LocalVectorIndex(":memory:", storage=storage)
+            index.upsert([(vid, v, {"doc_id": doc_id}) for (vid, doc_id, _), v in zip(corpus, vectors)])
+            r = evaluate(index, corpus_text, question_vectors, probe_vectors, reference, args.k)
+            results[f"{dim}d {storage}"] = r
+            print(f"{dim:5d}d {storage:8s} | fact recall@{args.k} {r[f'fact_recall@{args.k}']:.2f} | "
+                  f"overlap@{args.k} {r[f'overlap@{args.k}']:.2f} | score ratio {r['score_ratio']:.3f} | "
+                  f"p50={r['p50_ms']:.2f}ms p95={r['p95_ms']:.2f}ms | scan {r['scan_mb']:.2f} MB")
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
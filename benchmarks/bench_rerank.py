@@ -0,0 +1,90 @@
+"""
+Latency benchmark for the local reranking stage (server/diagnosis/rerank.py).
+
+Runs fully offline on CPU: the sample lab report is chunked with the recursive
+500/100 splitter (CHUNKER=recursive), repeated over several pages to simulate over-fetched
+candidates, and every eval question is reranked repeatedly.
+
+Usage:
+    python -m benchmarks.bench_rerank [--candidates 20] [--runs 200]
+"""
+import argparse
+import random
+import statistics
+import time
+from pathlib import Path
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from server.diagnosis.rerank import select_passages
+from server.utils import estimate_tokens
+
+DATA_FILE = Path(__file__).parent / "data" / "lipid_profile_ocr.txt"
+
+QUESTIONS = [
+    "What is the total cholesterol level for Mrs. Priyani Almeda?",
+    "Are there any abnormal results in the lipid profile? Which ones are high?",
+    "When was this sample collected and who referred the patient?",
+    "What is the HDL to LDL ratio listed in the report?",
+    "Based on the target levels provided, is the LDL cholesterol considered optimal?",
+]
+
+
+def build_candidates(n: int, pages: int = 4, seed: int = 42) -> list:
+    """
+    Simulates an over-fetched result set for a multi-page report: every page repeats the
+    letterhead and reference tables (as real lab reports do), chunked 500/100 like the
+    recursive chunker (its overlap is what dedupe removes). Returns the n best matches by
+    a seeded similarity score.
+    """
+    text = DATA_FILE.read_text()
+    splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=100)
+
+    rng = random.Random(seed)
+    matches = []
+    for page in range(1, pages + 1):
+        for chunk in splitter.split_text(text):
+            matches.append({
+                "score": rng.uniform(0.2, 0.6),
+                "metadata": {"text": chunk, "source": "lipid.pdf", "page": page},
+            })
+
+    matches.sort(key=lambda m: m["score"], reverse=True)
+    return matches[:n]
+
+
+def percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    k = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[k]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the CPU reranking stage.")
+    parser.add_argument("--candidates", type=int, default=20)
+    parser.add_argument("--runs", type=int, default=200)
+    args = parser.parse_args()
+
+    matches = build_candidates(args.candidates)
+    baseline = matches[:5]
+    baseline_tokens = sum(estimate_tokens(m["metadata"]["text"]) for m in baseline)
+
+    timings = []
+    packed_tokens = []
+    for _ in range(args.runs):
+        for q in QUESTIONS:
+            start = time.perf_counter()
+            passages = select_passages(q, matches)
+            timings.append((time.perf_counter() - start) * 1000)
+            packed_tokens.append(sum(estimate_tokens(p["text"]) for p in passages))
+
+    print(f"Candidates per query : {len(matches)}")
+    print(f"Queries timed        : {len(timings)}")
+    print(f"Rerank latency (ms)  : p50={percentile(timings, 50):.2f} "
+          f"p95={percentile(timings, 95):.2f} max={max(timings):.2f}")
+    print(f"Context tokens       : top-5 baseline={baseline_tokens} "
+          f"reranked avg={statistics.mean(packed_tokens):.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Startup-time benchmark for the API.
+
+Measures, in fresh interpreters, how long `import server.main` takes and how long
+the app takes to import, run its lifespan startup and answer /health. No network
+is needed: clients are created lazily on first use.
+
+Usage:
+    python -m benchmarks.bench_startup [--runs 5]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+IMPORT_SNIPPET = """
+import time, json
+t = time.perf_counter()
+import server.main
+print(json.dumps({"import_s": time.perf_counter() - t}))
+"""
+
+STARTUP_SNIPPET = """
+import time, json
+t = time.perf_counter()
+from fastapi.testclient import TestClient
+import server.main
+with TestClient(server.main.app) as client:
+    assert client.get("/health").status_code == 200
+    print(json.dumps({"startup_s": time.perf_counter() - t}))
+"""
+
+HEAVY_MODULES = ["langchain_openai", "langchain_groq", "pinecone", "pytesseract", "pdf2image",
+                 "langchain_text_splitters", "langchain_community"]
+
+LOADED_SNIPPET = """
+import sys, json
+import server.main
+print(json.dumps({"loaded": [m for m in %r if m in sys.modules]}))
+""" % HEAVY_MODULES
+
+
+def run(snippet: str) -> dict:
+    env = {**os.environ, "SECRET_KEY": os.environ.get("SECRET_KEY", "bench-secret")}
+    out = subprocess.run([sys.executable, "-c", snippet], capture_output=True, text=True, env=env, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark API import and startup time.")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    imports = [run(IMPORT_SNIPPET)["import_s"] for _ in range(args.runs)]
+    startups = [run(STARTUP_SNIPPET)["startup_s"] for _ in range(args.runs)]
+    loaded = run(LOADED_SNIPPET)["loaded"]
+
+    print(f"import server.main     : median={statistics.median(imports):.3f}s max={max(imports):.3f}s")
+    print(f"startup + /health      : median={statistics.median(startups):.3f}s max={max(startups):.3f}s")
+    print(f"heavy SDKs at import   : {', '.join(loaded) or 'none'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,496 @@
+"""
+Offline performance suite for ingestion and chat.
+
+Every external service is replaced by the deterministic fakes in benchmarks/fakes.py
+(simulated latency is configurable), so results are reproducible and need no network.
+Each scenario runs in a fresh interpreter so its peak RSS is its own.
+
+Scenarios:
+  extraction         PDF text extraction (load_documents) on a multi-page text PDF
+  extraction_cached  the same, served from the extracted-text cache (a re-index)
+  ocr                OCR fallback on a scanned PDF (skipped without tesseract/poppler)
+  chunking           chunk_documents on the extracted pages
+  ingest             POST /reports/upload end to end (extract, lab values, chunk, embed, upsert, Mongo)
+  chat_single        POST /diagnosis/chat, one-turn questions from the eval set
+  chat_multi         POST /diagnosis/chat with two turns of history (adds the condense step)
+  chat_burst         chat_multi with each request sent --duplicates times at once (client retries)
+  chat_with_batch    chat_multi while --batch-load LLM calls of --batch-priority run back to back
+  longitudinal       POST /diagnosis/longitudinal across the patient's reports
+  doctor_lists       GET /diagnosis/pending and /diagnosis/by_patient_name
+  review_sync        GET /diagnosis/pending/changes (delta sync) while chat adds to the queue
+  verify_single      POST /diagnosis/verify, one record per request
+  verify_bulk        POST /diagnosis/verify/bulk, --bulk-size records per request
+  chat_summary       POST /diagnosis/chat, first-turn "summarize this report" questions (full RAG)
+  chat_summary_digest  the same, answered from digests generated at ingest (DIGEST_ENABLED)
+
+Usage:
+    python -m benchmarks.bench_suite [--scenarios chat_single,ingest] [--requests 50]
+        [--concurrency 8] [--embed-latency-ms 20] [--llm-latency-ms 300]
+        [--output results.json] [--baseline previous.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+DATA_FILE = Path(__file__).parent / "data" / "lipid_profile_ocr.txt"
+
+SCENARIOS = ["extraction", "extraction_cached", "ocr", "chunking", "ingest", "chat_single",
+             "chat_multi", "chat_burst", "chat_with_batch", "longitudinal", "doctor_lists", "review_sync",
+             "verify_single", "verify_bulk", "chat_summary", "chat_summary_digest"]
+
+QUESTIONS = [
+    "What is the total cholesterol level for Mrs. Priyani Almeda?",
+    "Are there any abnormal results in the lipid profile? Which ones are high?",
+    "When was this sample collected and who referred the patient?",
+    "What is the HDL to LDL ratio listed in the report?",
+    "Based on the target levels provided, is the LDL cholesterol considered optimal?",
+]
+
+SUMMARY_QUESTIONS = [
+    "Can you summarize this report?",
+    "Is there anything abnormal in my results?",
+    "What are the key findings of this lipid profile?",
+]
+
+PATIENT, DOCTOR = "bench_patient", "bench_doctor"
+
+
+# ---------- Fixtures ----------
+
+def make_text_pdf(path: Path, pages: list):
+    """Writes a minimal text PDF (Helvetica, one text line per source line)."""
+    def escape(line: str) -> str:
+        line = line.encode("latin-1", "replace").decode("latin-1")
+        return line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None,
+               "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for text in pages:
+        body = "BT /F1 9 Tf 11 TL 40 800 Td\n" + "".join(
+            f"({escape(line)}) Tj T*\n" for line in text.splitlines()) + "ET"
+        objects.append(f"<< /Length {len(body.encode('latin-1'))} >>\nstream\n{body}\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>")
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{obj}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += "".join(f"{o:010d} 00000 n \n" for o in offsets).encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    path.write_bytes(bytes(out))
+
+
+def make_scanned_pdf(path: Path, pages: list):
+    """Renders each page's text to a grayscale image and saves the images as a PDF."""
+    from PIL import Image, ImageDraw
+
+    images = []
+    for text in pages:
+        image = Image.new("L", (1240, 1754), 255)
+        draw = ImageDraw.Draw(image)
+        for i, line in enumerate(text.splitlines()):
+            draw.text((60, 60 + i * 24), line, fill=0, font_size=18)
+        images.append(image)
+    images[0].save(path, save_all=True, append_images=images[1:], resolution=150)
+
+
+def report_pages(n: int) -> list:
+    return [DATA_FILE.read_text()] * n
+
+
+# ---------- Measurement ----------
+
+def summarize(latencies_ms: list, wall_s: float, ops: int = None) -> dict:
+    ordered = sorted(latencies_ms)
+
+    def pct(p: float) -> float:
+        return ordered[min(len(ordered) - 1, int(round(p * (len(ordered) - 1))))]
+
+    ops = ops if ops is not None else len(ordered)
+    return {
+        "n": len(ordered),
+        "throughput_per_s": ops / wall_s if wall_s else 0.0,
+        "mean_ms": statistics.fmean(ordered),
+        "p50_ms": pct(0.50),
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+    }
+
+
+def time_serial(fn, n: int) -> dict:
+    fn()  # warm-up: lazy imports and first-call caches are not what we measure
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(n):
+        t = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - t) * 1000)
+    return summarize(latencies, time.perf_counter() - start)
+
+
+async def time_concurrent(make_request, n: int, concurrency: int) -> dict:
+    """Runs n requests, at most `concurrency` in flight; make_request(i) returns a response."""
+    slots = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i: int):
+        async with slots:
+            t = time.perf_counter()
+            response = await make_request(i)
+            latencies.append((time.perf_counter() - t) * 1000)
+            response.raise_for_status()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(n)))
+    return summarize(latencies, time.perf_counter() - start)
+
+
+# ---------- Scenarios (run in a child process) ----------
+
+class Bench:
+    def __init__(self, args, workdir: Path):
+        self.args = args
+        self.workdir = workdir
+        self.text_pdf = workdir / "lipid_profile.pdf"
+        make_text_pdf(self.text_pdf, report_pages(args.pages))
+
+    def setup_app(self):
+        import logging
+        import httpx
+        from server.main import app
+        from server.auth.jwt_handler import create_access_token
+        from benchmarks.fakes import install_fakes
+
+        logging.disable(logging.INFO)
+        a = self.args
+        self.fakes = install_fakes(a.embed_latency_ms, a.llm_latency_ms, a.vector_latency_ms, a.mongo_latency_ms,
+                                   a.fast_llm_latency_ms, a.llm_error_every)
+        for username, role in ((PATIENT, "patient"), (DOCTOR, "doctor")):
+            self.fakes["users_collection"].insert_one({"username": username, "password": "-", "role": role})
+        self.headers = {
+            role: {"Authorization": "Bearer " + create_access_token({"sub": username, "role": role})}
+            for username, role in ((PATIENT, "patient"), (DOCTOR, "doctor"))
+        }
+        self.client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench",
+                                        timeout=None)
+
+    async def upload(self):
+        files = [("files", (self.text_pdf.name, self.text_pdf.read_bytes(), "application/pdf"))]
+        return await self.client.post("/reports/upload", files=files, headers=self.headers["patient"])
+
+    async def seed_reports(self, n: int) -> list:
+        doc_ids = []
+        for _ in range(n):
+            response = await self.upload()
+            response.raise_for_status()
+            doc_ids.append(response.json()["doc_id"])
+        return doc_ids
+
+    # Library-level scenarios
+
+    def extraction(self):
+        from server.reports.extraction import load_documents
+        return time_serial(lambda: load_documents(str(self.text_pdf), self.text_pdf.name), self.args.requests)
+
+    def extraction_cached(self):
+        from server.reports import text_cache
+        from server.reports.extraction import load_documents
+        text_cache.TEXT_CACHE_ENABLED = True
+        text_cache.TEXT_CACHE_PATH = str(self.workdir / "extracted_text.sqlite")
+        # time_serial's warm-up call fills the cache
+        return time_serial(lambda: load_documents(str(self.text_pdf), self.text_pdf.name), self.args.requests)
+
+    def ocr(self):
+        if not (shutil.which("tesseract") and shutil.which("pdftoppm")):
+            return {"skipped": "tesseract/poppler not installed"}
+        from server.reports.extraction import load_documents
+        scanned = self.workdir / "scanned.pdf"
+        make_scanned_pdf(scanned, report_pages(self.args.pages))
+        return time_serial(lambda: load_documents(str(scanned), scanned.name), max(1, self.args.requests // 10))
+
+    def chunking(self):
+        from server.reports.extraction import load_documents
+        from server.reports.chunking import chunk_documents
+        documents = load_documents(str(self.text_pdf), self.text_pdf.name)
+        result = time_serial(lambda: chunk_documents(documents), self.args.requests)
+        result["chunks_per_document"] = len(chunk_documents(documents))
+        return result
+
+    # HTTP scenarios (full app, fake services)
+
+    async def ingest(self):
+        self.setup_app()
+        result = await time_concurrent(lambda i: self.upload(), self.args.requests, self.args.concurrency)
+        result["vectors"] = len(self.fakes["index"])
+        return result
+
+    async def chat_single(self):
+        self.setup_app()
+        doc_ids = await self.seed_reports(self.args.reports)
+
+        def request(i):
+            body = {"doc_id": doc_ids[i % len(doc_ids)],
+                    "messages": [{"role": "user", "content": QUESTIONS[i % len(QUESTIONS)]}]}
+            return self.client.post("/diagnosis/chat", json=body, headers=self.headers["patient"])
+        return await time_concurrent(request, self.args.requests, self.args.concurrency)
+
+    async def chat_multi(self, duplicates: int = 1):
+        if not hasattr(self, "client"):
+            self.setup_app()
+        doc_ids = await self.seed_reports(self.args.reports)
+
+        def request(i):
+            i //= duplicates
+            messages = [
+                {"role": "user", "content": QUESTIONS[(i + 1) % len(QUESTIONS)]},
+                {"role": "assistant", "content": f"The total cholesterol is {150 + i} mg/dL."},
+                {"role": "user", "content": "And is that within the normal range?"},
+            ]
+            body = {"doc_id": doc_ids[i % len(doc_ids)], "messages": messages}
+            return self.client.post("/diagnosis/chat", json=body, headers=self.headers["patient"])
+        return await time_concurrent(request, self.args.requests, self.args.concurrency)
+
+    async def chat_burst(self):
+        from server.diagnosis import coalesce
+        coalesce.COALESCE_ENABLED = True
+        # Consecutive requests are identical, so with --concurrency >= --duplicates they overlap
+        result = await self.chat_multi(self.args.duplicates)
+        result["pipeline_runs"] = len(self.fakes["diagnosis_collection"].find({"type": "chat"}))
+        return result
+
+    async def chat_with_batch(self):
+        # An evaluation run or bulk job sharing the LLM; --batch-priority interactive is the
+        # unprioritised baseline
+        from server.config.services import get_llm
+        from server.config.llm_dispatcher import call_llm, llm_priority
+        stop = asyncio.Event()
+        batch_calls = 0
+
+        async def batch_worker():
+            nonlocal batch_calls
+            with llm_priority(self.args.batch_priority):
+                while not stop.is_set():
+                    await call_llm(get_llm().invoke, "Summarise this lipid profile. " * 40, user="batch")
+                    batch_calls += 1
+
+        self.setup_app()
+        workers = [asyncio.create_task(batch_worker()) for _ in range(self.args.batch_load)]
+        try:
+            result = await self.chat_multi()
+        finally:
+            stop.set()
+            await asyncio.gather(*workers)
+        result["batch_calls"] = batch_calls
+        return result
+
+    async def longitudinal(self):
+        self.setup_app()
+        await self.seed_reports(self.args.reports)
+
+        def request(i):
+            body = {"doc_id": "all-reports",
+                    "messages": [{"role": "user", "content": "How have my cholesterol levels changed?"}]}
+            return self.client.post("/diagnosis/longitudinal", json=body, headers=self.headers["patient"])
+        return await time_concurrent(request, self.args.requests, self.args.concurrency)
+
+    async def seed_history(self):
+        doc_ids = await self.seed_reports(self.args.reports)
+        history = self.fakes["diagnosis_collection"]
+        for i in range(self.args.history):
+            history.insert_one({
+                "doc_id": doc_ids[i % len(doc_ids)], "requester": PATIENT, "question": QUESTIONS[i % len(QUESTIONS)],
+                "answer": "-", "sources": [], "timestamp": time.time() - 60 - i, "updated_at": time.time() - 60 - i,
+                "type": "chat", "verification_status": "pending", "doctor_note": None,
+            })
+        return doc_ids
+
+    async def doctor_lists(self):
+        self.setup_app()
+        await self.seed_history()
+
+        def request(i):
+            if i % 2:
+                return self.client.get("/diagnosis/by_patient_name", params={"patient_name": PATIENT},
+                                       headers=self.headers["doctor"])
+            return self.client.get("/diagnosis/pending", headers=self.headers["doctor"])
+        return await time_concurrent(request, self.args.requests, self.args.concurrency)
+
+    async def review_sync(self):
+        # Each doctor's dashboard rerun, after its first full load, as in client/app.py
+        self.setup_app()
+        doc_ids = await self.seed_history()
+        first = await self.client.get("/diagnosis/pending", headers=self.headers["doctor"])
+        cursor = float(first.headers["X-Review-Cursor"])
+        history = self.fakes["diagnosis_collection"]
+
+        def request(i):
+            if i % 10 == 0:
+                now = time.time()
+                history.insert_one({
+                    "doc_id": doc_ids[0], "requester": PATIENT, "question": QUESTIONS[0], "answer": "-",
+                    "sources": [], "timestamp": now, "updated_at": now, "type": "chat",
+                    "verification_status": "pending", "doctor_note": None,
+                })
+            return self.client.get("/diagnosis/pending/changes", params={"since": cursor},
+                                   headers=self.headers["doctor"])
+        return await time_concurrent(request, self.args.requests, self.args.concurrency)
+
+    async def verify(self, bulk_size: int):
+        self.setup_app()
+        await self.seed_history()
+        ids = [str(doc["_id"]) for doc in self.fakes["diagnosis_collection"].find({"verification_status": "pending"})]
+
+        def request(i):
+            items = [{"record_id": ids[(i * bulk_size + j) % len(ids)], "status": "approved", "note": "Routine"}
+                     for j in range(bulk_size)]
+            if bulk_size == 1:
+                return self.client.post("/diagnosis/verify", json=items[0], headers=self.headers["doctor"])
+            return self.client.post("/diagnosis/verify/bulk", json={"items": items}, headers=self.headers["doctor"])
+        result = await time_concurrent(request, self.args.requests, self.args.concurrency)
+        result["records_per_s"] = result["throughput_per_s"] * bulk_size
+        return result
+
+    async def verify_single(self):
+        return await self.verify(1)
+
+    async def verify_bulk(self):
+        return await self.verify(self.args.bulk_size)
+
+    async def chat_summary(self, digests: bool = False):
+        from server.reports import digest
+        digest.DIGEST_ENABLED = digests
+        self.setup_app()
+        doc_ids = await self.seed_reports(self.args.reports)
+        # Drained here rather than by the lifespan worker, so the timed requests all find one
+        while (job := digest.digest_jobs.pop()) is not None:
+            await digest.run_digest_job(job)
+        llm_calls = self.fakes["llm"].calls + self.fakes["fast_llm"].calls
+
+        def request(i):
+            body = {"doc_id": doc_ids[i % len(doc_ids)],
+                    "messages": [{"role": "user", "content": SUMMARY_QUESTIONS[i % len(SUMMARY_QUESTIONS)]}]}
+            return self.client.post("/diagnosis/chat", json=body, headers=self.headers["patient"])
+        result = await time_concurrent(request, self.args.requests, self.args.concurrency)
+        result["llm_calls"] = self.fakes["llm"].calls + self.fakes["fast_llm"].calls - llm_calls
+        return result
+
+    async def chat_summary_digest(self):
+        return await self.chat_summary(digests=True)
+
+
+def run_child(scenario: str, args) -> dict:
+    with tempfile.TemporaryDirectory() as workdir:
+        bench = Bench(args, Path(workdir))
+        result = getattr(bench, scenario)()
+        if asyncio.iscoroutine(result):
+            result = asyncio.run(result)
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    result["peak_rss_mb"] = peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+    return result
+
+
+# ---------- Parent ----------
+
+def run_scenario(scenario: str, argv: list) -> dict:
+    with tempfile.TemporaryDirectory() as upload_dir:
+        # Scenarios measure extraction and the chat pipeline themselves; extraction_cached
+        # and chat_burst opt back in to the text cache and request coalescing. One bench
+        # user drives every request, so per-user admission limits are off.
+        env = {**os.environ, "UPLOAD_DIR": upload_dir, "WARM_CLIENTS_ON_STARTUP": "false",
+               "TEXT_CACHE_ENABLED": "false", "COALESCE_ENABLED": "false", "ADMISSION_ENABLED": "false"}
+        env.setdefault("SECRET_KEY", "benchmark-secret")
+        proc = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_suite", "--child", scenario, *argv],
+            capture_output=True, text=True, env=env,
+        )
+    if proc.returncode != 0:
+        return {"error": proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "failed"}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def compare(results: dict, baseline_path: str):
+    baseline = json.loads(Path(baseline_path).read_text())["results"]
+    print(f"\nvs {baseline_path}:")
+    for scenario, r in results.items():
+        b = baseline.get(scenario, {})
+        if "p95_ms" in r and "p95_ms" in b:
+            print(f"  {scenario:17s} p95 {100 * (r['p95_ms'] / b['p95_ms'] - 1):+6.1f}%  "
+                  f"throughput {100 * (r['throughput_per_s'] / b['throughput_per_s'] - 1):+6.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline performance suite for ingestion and chat.")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma-separated subset")
+    parser.add_argument("--requests", type=int, default=50, help="Operations per scenario")
+    parser.add_argument("--concurrency", type=int, default=8, help="In-flight HTTP requests")
+    parser.add_argument("--pages", type=int, default=2, help="Pages per generated report")
+    parser.add_argument("--reports", type=int, default=5, help="Reports seeded before chat scenarios")
+    parser.add_argument("--history", type=int, default=500, help="Diagnosis records seeded for doctor lists")
+    parser.add_argument("--duplicates", type=int, default=3, help="Copies of each request in chat_burst")
+    parser.add_argument("--bulk-size", type=int, default=50, help="Records per request in verify_bulk")
+    parser.add_argument("--batch-load", type=int, default=16, help="Concurrent batch LLM calls in chat_with_batch")
+    parser.add_argument("--batch-priority", default="batch", help="Their dispatcher priority class")
+    parser.add_argument("--embed-latency-ms", type=float, default=20.0)
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0)
+    parser.add_argument("--vector-latency-ms", type=float, default=15.0)
+    parser.add_argument("--mongo-latency-ms", type=float, default=1.0)
+    parser.add_argument("--fast-llm-latency-ms", type=float, help="LLM_FAST_MODEL latency (default: as --llm-latency-ms)")
+    parser.add_argument("--llm-error-every", type=int, default=0, help="Fail every n-th call to the main model")
+    parser.add_argument("--output", help="Write results as JSON")
+    parser.add_argument("--baseline", help="Earlier --output file to compare p95/throughput against")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_child(args.child, args)))
+        return
+
+    child_argv = [a for a in sys.argv[1:]]
+    for flag in ("--output", "--baseline", "--scenarios"):
+        if flag in child_argv:
+            i = child_argv.index(flag)
+            del child_argv[i:i + 2]
+
+    results = {}
+    for scenario in args.scenarios.split(","):
+        r = results[scenario] = run_scenario(scenario, child_argv)
+        if "p50_ms" in r:
+            print(f"{scenario:17s} {r['throughput_per_s']:8.1f} ops/s | p50={r['p50_ms']:8.1f}ms "
+                  f"p95={r['p95_ms']:8.1f}ms p99={r['p99_ms']:8.1f}ms | peak RSS {r['peak_rss_mb']:.0f} MB"
+                  + (f" | {r['records_per_s']:.0f} records/s" if "records_per_s" in r else ""))
+        else:
+            print(f"{scenario:17s} {r.get('skipped') or r.get('error')}")
+
+    if args.output:
+        report = {
+            "timestamp": time.time(),
+            "python": platform.python_version(),
+            "config": {k: v for k, v in vars(args).items() if k not in ("output", "baseline", "child")},
+            "results": results,
+        }
+        Path(args.output).write_text(json.dumps(report, indent=2))
+        print(f"📄 Results written to {args.output}")
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Vector metadata layout: chunk text in the index vs ids only plus the local chunk store.
+
+Indexes the sample lab report for many patients both ways and reports metadata bytes
+per vector (index storage), query response bytes at the chat and longitudinal top_k,
+and retrieval latency (query, plus the batched chunk-store read for the compact layout).
+The index is the in-memory fake, so latency shows the local hydration cost; on Pinecone
+the response-size saving also comes off network transfer.
+
+Usage:
+    python -m benchmarks.bench_vector_payload [--reports 200] [--pages 4] [--runs 200]
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from langchain_core.documents import Document
+
+from server.reports import chunk_store
+from server.reports.chunking import chunk_documents
+from benchmarks.fakes import FakeEmbeddings, LocalIndex
+
+DATA_FILE = Path(__file__).parent / "data" / "lipid_profile_ocr.txt"
+
+QUESTIONS = [
+    "What is the total cholesterol level for Mrs. Priyani Almeda?",
+    "Are there any abnormal results in the lipid profile? Which ones are high?",
+    "When was this sample collected and who referred the patient?",
+    "What is the HDL to LDL ratio listed in the report?",
+    "Based on the target levels provided, is the LDL cholesterol considered optimal?",
+]
+
+
+def build(reports: int, pages: int) -> tuple:
+    """Returns (legacy index, compact index, embedder); both indexes hold the same vectors."""
+    embedder = FakeEmbeddings()
+    text = DATA_FILE.read_text()
+    documents = [Document(page_content=text, metadata={"page": p}) for p in range(1, pages + 1)]
+    chunks = chunk_documents(documents)
+    embeddings = embedder.embed_documents([c.page_content for c in chunks])
+
+    legacy, compact = LocalIndex(), LocalIndex()
+    for r in range(reports):
+        doc_id = f"report-{r}"
+        ids = [f"{doc_id}-v3-0-{i}" for i in range(len(chunks))]
+        metadatas = [
+            {"source": "lipid_profile.pdf", "doc_id": doc_id, "uploader": f"patient-{r % 50}",
+             "page": c.metadata["page"], "uploaded_at": 1733400000.0 + r, "index_version": 3}
+            for c in chunks
+        ]
+        legacy.upsert(vectors=[(vid, e, {**md, "text": c.page_content[:2000]})
+                               for vid, e, md, c in zip(ids, embeddings, metadatas, chunks)])
+        compact.upsert(vectors=list(zip(ids, embeddings, metadatas)))
+        chunk_store.put_many(ids, [c.page_content for c in chunks])
+    return legacy, compact, embedder
+
+
+def measure(index: LocalIndex, embedder, top_k: int, runs: int, hydrate: bool) -> dict:
+    sizes, latencies = [], []
+    vectors = [embedder.embed_query(q) for q in QUESTIONS]
+    for i in range(runs):
+        start = time.perf_counter()
+        response = index.query(vector=vectors[i % len(vectors)], top_k=top_k, include_metadata=True,
+                               filter={"doc_id": f"report-{i % 50}"} if top_k <= 5 else {"uploader": "patient-0"})
+        matches = response["matches"]
+        if hydrate:
+            matches = chunk_store.hydrate(matches)
+        latencies.append((time.perf_counter() - start) * 1000)
+        sizes.append(len(json.dumps(response)))
+        assert all(m["metadata"].get("text") for m in matches)
+    ordered = sorted(latencies)
+    return {
+        "response_bytes": statistics.mean(sizes),
+        "p50_ms": ordered[len(ordered) // 2],
+        "p95_ms": ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare vector metadata layouts.")
+    parser.add_argument("--reports", type=int, default=200, help="Reports indexed")
+    parser.add_argument("--pages", type=int, default=4, help="Pages per report")
+    parser.add_argument("--runs", type=int, default=200, help="Queries per measurement")
+    parser.add_argument("--output", help="Write results as JSON")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        chunk_store.CHUNK_STORE_PATH = os.path.join(tmp, "chunks.sqlite")
+        legacy, compact, embedder = build(args.reports, args.pages)
+
+        def metadata_bytes(index):
+            return statistics.mean(len(json.dumps(md)) for _, md in index._vectors.values())
+
+        results = {"vectors": len(compact), "store_bytes": os.path.getsize(chunk_store.CHUNK_STORE_PATH)}
+        for name, index, hydrate in (("text in metadata", legacy, False), ("chunk store", compact, True)):
+            results[name] = {"metadata_bytes_per_vector": metadata_bytes(index)}
+            for top_k in (5, 20):
+                results[name][f"top_{top_k}"] = measure(index, embedder, top_k, args.runs, hydrate)
+
+    print(f"{results['vectors']} vectors, chunk store {results['store_bytes'] / 1024:.0f} KB on disk")
+    for name in ("text in metadata", "chunk store"):
+        r = results[name]
+        print(f"{name:17s} {r['metadata_bytes_per_vector']:6.0f} B metadata/vector", end="")
+        for top_k in (5, 20):
+            q = r[f"top_{top_k}"]
+            print(f" | top_{top_k}: {q['response_bytes'] / 1024:5.1f} KB response, "
+                  f"p50={q['p50_ms']:.2f}ms p95={q['p95_ms']:.2f}ms", end="")
+        print()
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+"""
+Deterministic offline stand-ins for the external services, used by the benchmark suite.
+
+  - FakeEmbeddings:  feature-hashing embedder (same text -> same vector), simulated latency
+  - FakeChatModel:   LangChain chat model that echoes its prompt, latency grows with prompt size
+  - LocalIndex:      in-memory vector index with the subset of the Pinecone Index API we use
+  - FakeCollection:  in-memory MongoDB collection with the subset of the pymongo API we use
+  - FakeS3Client:    in-memory S3 bucket with the subset of the boto3 client API we use
+
+`install_fakes()` swaps all of them into the server modules; it must run before any request.
+The local chunk store is real, but moved to a temporary file.
+"""
+import copy
+import io
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from typing import Any, List, Optional
+
+import numpy as np
+from bson.objectid import ObjectId
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from server.reports.local_index import matches_filter as _matches
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+class FakeEmbeddings:
+    def __init__(self, dimension: int = 384, latency_ms: float = 0.0, ms_per_text: float = 0.0):
+        self.dimension = dimension
+        self.latency_ms = latency_ms
+        self.ms_per_text = ms_per_text
+
+    def _vector(self, text: str) -> List[float]:
+        vec = np.zeros(self.dimension, dtype=np.float32)
+        for token in TOKEN_RE.findall(text.lower()):
+            h = zlib.crc32(token.encode())
+            vec[h % self.dimension] += 1.0 if (h >> 16) & 1 else -1.0
+        norm = np.linalg.norm(vec)
+        return (vec / norm if norm else vec).tolist()
+
+    def _wait(self, n: int):
+        time.sleep((self.latency_ms + self.ms_per_text * n) / 1000)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self._wait(len(texts))
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        self._wait(1)
+        return self._vector(text)
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Replies with the start of the last message; sleeps latency_ms + ms_per_1k_tokens per 1k
+    prompt tokens. Every call fails after the sleep when error_every=1, every other with 2, etc.
+    """
+    latency_ms: float = 0.0
+    ms_per_1k_tokens: float = 0.0
+    error_every: int = 0
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        prompt_tokens = sum(len(str(m.content)) for m in messages) / 4
+        time.sleep((self.latency_ms + self.ms_per_1k_tokens * prompt_tokens / 1000) / 1000)
+        self.calls += 1
+        if self.error_every and self.calls % self.error_every == 0:
+            raise RuntimeError("fake provider error")
+        reply = " ".join(str(messages[-1].content).split())[:200]
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=reply))])
+
+
+class LocalIndex:
+    """Brute-force dot-product index; query/upsert/delete mirror pinecone.Index."""
+
+    def __init__(self, latency_ms: float = 0.0):
+        self.latency_ms = latency_ms
+        self._lock = threading.Lock()
+        self._vectors = {}
+
+    def upsert(self, vectors, **kwargs):
+        time.sleep(self.latency_ms / 1000)
+        with self._lock:
+            for vid, values, metadata in vectors:
+                self._vectors[vid] = (np.asarray(values, dtype=np.float32), dict(metadata))
+        return {"upserted_count": len(vectors)}
+
+    def delete(self, ids=None, **kwargs):
+        time.sleep(self.latency_ms / 1000)
+        with self._lock:
+            for vid in ids or []:
+                self._vectors.pop(vid, None)
+
+    def query(self, vector, top_k: int = 10, include_metadata: bool = False, filter: dict = None, **kwargs):
+        time.sleep(self.latency_ms / 1000)
+        with self._lock:
+            hits = [(vid, v, md) for vid, (v, md) in self._vectors.items() if _matches(md, filter)]
+        if not hits:
+            return {"matches": []}
+        scores = np.stack([v for _, v, _ in hits]) @ np.asarray(vector, dtype=np.float32)
+        order = np.argsort(-scores)[:top_k]
+        return {"matches": [
+            {"id": hits[i][0], "score": float(scores[i]),
+             "metadata": hits[i][2] if include_metadata else {}}
+            for i in order
+        ]}
+
+    def __len__(self):
+        return len(self._vectors)
+
+
+class FakeS3Client:
+    """Objects of any bucket in one dict; list_objects_v2 pages like S3 (sorted keys, MaxKeys)."""
+
+    def __init__(self, page_size: int = 1000):
+        self.page_size = page_size
+        self.objects = {}
+        self._lock = threading.Lock()
+
+    def put_object(self, Bucket: str, Key: str, Body: bytes):
+        with self._lock:
+            self.objects[(Bucket, Key)] = bytes(Body)
+
+    def get_object(self, Bucket: str, Key: str):
+        with self._lock:
+            return {"Body": io.BytesIO(self.objects[(Bucket, Key)])}
+
+    def delete_object(self, Bucket: str, Key: str):
+        with self._lock:
+            self.objects.pop((Bucket, Key), None)
+
+    def list_objects_v2(self, Bucket: str, Prefix: str = "", MaxKeys: int = None, ContinuationToken: str = None):
+        with self._lock:
+            keys = sorted(k for b, k in self.objects if b == Bucket and k.startswith(Prefix) and
+                          (ContinuationToken is None or k > ContinuationToken))
+        page = keys[:min(MaxKeys or self.page_size, self.page_size)]
+        listed = {"Contents": [{"Key": k} for k in page], "IsTruncated": len(page) < len(keys)}
+        if listed["IsTruncated"]:
+            listed["NextContinuationToken"] = page[-1]
+        return listed
+
+
+class _Result:
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+
+class FakeCursor(list):
+    def sort(self, key, direction: int = 1):
+        super().sort(key=lambda d: (d.get(key) is None, d.get(key)), reverse=direction < 0)
+        return self
+
+    def limit(self, n: int):
+        return FakeCursor(self[:n] if n else self)
+
+
+class FakeCollection:
+    def __init__(self, name: str, latency_ms: float = 0.0):
+        self.name = name
+        self.latency_ms = latency_ms
+        self._lock = threading.Lock()
+        self._docs = []
+
+    def _wait(self):
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+
+    @staticmethod
+    def _project(doc: dict, projection: Optional[dict]) -> dict:
+        doc = copy.deepcopy(doc)
+        if not projection:
+            return doc
+        include = [k for k, v in projection.items() if v and k != "_id"]
+        if include:
+            out = {k: doc[k] for k in include if k in doc}
+            if projection.get("_id", 1):
+                out["_id"] = doc["_id"]
+            return out
+        return {k: v for k, v in doc.items() if projection.get(k, 1)}
+
+    def find(self, flt: dict = None, projection: dict = None) -> FakeCursor:
+        self._wait()
+        with self._lock:
+            return FakeCursor(self._project(d, projection) for d in self._docs if _matches(d, flt))
+
+    def find_one(self, flt: dict = None, projection: dict = None) -> Optional[dict]:
+        found = self.find(flt, projection)
+        return found[0] if found else None
+
+    def count_documents(self, flt: dict = None) -> int:
+        return len(self.find(flt))
+
+    def insert_one(self, doc: dict) -> Any:
+        self._wait()
+        doc.setdefault("_id", ObjectId())
+        with self._lock:
+            self._docs.append(copy.deepcopy(doc))
+        return _Result(inserted_id=doc["_id"])
+
+    def insert_many(self, docs: list) -> Any:
+        self._wait()
+        for doc in docs:
+            doc.setdefault("_id", ObjectId())
+        with self._lock:
+            self._docs.extend(copy.deepcopy(d) for d in docs)
+        return _Result(inserted_ids=[d["_id"] for d in docs])
+
+    def update_one(self, flt: dict, update: dict, upsert: bool = False) -> Any:
+        self._wait()
+        with self._lock:
+            for doc in self._docs:
+                if _matches(doc, flt):
+                    doc.update(copy.deepcopy(update.get("$set", {})))
+                    return _Result(matched_count=1, modified_count=1)
+            if upsert:
+                doc = {k: v for k, v in flt.items() if not isinstance(v, dict)}
+                doc.update(copy.deepcopy(update.get("$set", {})))
+                doc.setdefault("_id", ObjectId())
+                self._docs.append(doc)
+                return _Result(matched_count=0, modified_count=0, upserted_id=doc["_id"])
+        return _Result(matched_count=0, modified_count=0)
+
+    def bulk_write(self, requests: list, ordered: bool = True) -> Any:
+        """UpdateOne requests only, applied in one simulated round trip."""
+        self._wait()
+        matched = 0
+        with self._lock:
+            for request in requests:
+                for doc in self._docs:
+                    if _matches(doc, request._filter):
+                        doc.update(copy.deepcopy(request._doc.get("$set", {})))
+                        matched += 1
+                        break
+        return _Result(matched_count=matched, modified_count=matched)
+
+    def delete_many(self, flt: dict) -> Any:
+        self._wait()
+        with self._lock:
+            keep = [d for d in self._docs if not _matches(d, flt)]
+            deleted = len(self._docs) - len(keep)
+            self._docs = keep
+        return _Result(deleted_count=deleted)
+
+    def create_index(self, *args, **kwargs):
+        return None
+
+
+COLLECTIONS = {
+    "users_collection": "users",
+    "reports_collection": "reports",
+    "diagnosis_collection": "diagnosis_history",
+    "lab_results_collection": "lab_results",
+    "digests_collection": "report_digests",
+}
+
+
+_TEMP_DIRS = []
+
+
+def install_fakes(embed_latency_ms: float = 0.0, llm_latency_ms: float = 0.0,
+                  vector_latency_ms: float = 0.0, mongo_latency_ms: float = 0.0,
+                  fast_llm_latency_ms: float = None, llm_error_every: int = 0) -> dict:
+    """
+    Routes every external call of the already-imported server modules to the fakes.
+    Returns the fakes so scenarios can seed and inspect them. The fast model (LLM_FAST_MODEL)
+    has its own fake (as slow as the main one unless fast_llm_latency_ms is given);
+    llm_error_every makes the main model fail every n-th call.
+    """
+    from server.config import services
+    from server.reports import chunk_store
+
+    # Kept for the life of the interpreter, then removed
+    chunk_dir = tempfile.TemporaryDirectory(prefix="medragnosis-chunks-")
+    _TEMP_DIRS.append(chunk_dir)
+    chunk_store.CHUNK_STORE_PATH = os.path.join(chunk_dir.name, "chunks.sqlite")
+
+    fakes = {
+        "index": LocalIndex(latency_ms=vector_latency_ms),
+        "embed_model": FakeEmbeddings(latency_ms=embed_latency_ms, ms_per_text=embed_latency_ms / 50),
+        "llm": FakeChatModel(latency_ms=llm_latency_ms, ms_per_1k_tokens=llm_latency_ms / 2,
+                             error_every=llm_error_every),
+    }
+    services.use_clients(**fakes)
+    fast_latency = llm_latency_ms if fast_llm_latency_ms is None else fast_llm_latency_ms
+    fakes["fast_llm"] = FakeChatModel(latency_ms=fast_latency, ms_per_1k_tokens=fast_latency / 2)
+    services.use_clients(llms={services.LLM_FAST_MODEL: fakes["fast_llm"]})
+
+    # Modules bind collections with `from ..config.db import x`, so each binding is replaced
+    collections = {attr: FakeCollection(name, mongo_latency_ms) for attr, name in COLLECTIONS.items()}
+    for name, module in list(sys.modules.items()):
+        if name == "server" or name.startswith("server."):
+            for attr, fake in collections.items():
+                if hasattr(module, attr):
+                    setattr(module, attr, fake)
+    fakes.update(collections)
+    return fakes
@@ -0,0 +1,219 @@
+import argparse
+import asyncio
+import csv
+import json
+import os
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import List
+
+from dotenv import load_dotenv
+from tqdm import tqdm
+
+load_dotenv()
+
+from server.reports.extraction import load_documents
+
+# Tasks scheduled at once; bounds memory when the archive has tens of thousands of files
+WINDOW_SIZE = 256
+# Checkpoint statuses that are not retried on resume ('empty' only with --retry-empty)
+FINISHED = ("done", "empty")
+
+
+def read_manifest(path: str, default_uploader: str = None) -> List[dict]:
+    """
+    Reads a CSV or JSONL manifest with a `path` and `uploader` per row
+    (optional: `doc_id`, `filename`). Relative paths are resolved against the manifest.
+    """
+    base = Path(path).parent
+    if path.endswith(".jsonl"):
+        with open(path) as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+    else:
+        with open(path, newline="") as f:
+            rows = list(csv.DictReader(f))
+
+    items = []
+    for row in rows:
+        file_path = Path(row["path"])
+        if not file_path.is_absolute():
+            file_path = base / file_path
+        uploader = row.get("uploader") or default_uploader
+        if not uploader:
+            raise ValueError(f"No uploader for {file_path} (add an 'uploader' column or pass --uploader)")
+        items.append({
+            "path": str(file_path),
+            "uploader": uploader,
+            "doc_id": row.get("doc_id") or None,
+            "filename": row.get("filename") or file_path.name,
+        })
+    return items
+
+
+def walk_directory(root: str, uploader: str = None) -> List[dict]:
+    """
+    Collects every PDF under `root`. Without --uploader, the first directory level
+    is the patient's username (archive/<username>/**/*.pdf).
+    """
+    items = []
+    root_path = Path(root)
+    for file_path in sorted(root_path.rglob("*")):
+        if not file_path.is_file() or file_path.suffix.lower() != ".pdf":
+            continue
+        owner = uploader or file_path.relative_to(root_path).parts[0]
+        if owner == file_path.name:
+            raise ValueError(f"{file_path} has no owner directory; pass --uploader")
+        items.append({"path": str(file_path), "uploader": owner, "doc_id": None, "filename": file_path.name})
+    return items
+
+
+def load_checkpoint(path: str) -> dict:
+    """
+    Source path -> last checkpoint entry. 'done' and 'empty' (no extractable text) entries are
+    skipped on resume; the others keep their doc_id, so a retry overwrites what the failed
+    attempt indexed.
+    """
+    state = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    state[entry["path"]] = entry
+    return state
+
+
+class Checkpoint:
+    """Append-only JSONL log of processed files, flushed per entry so a crash loses nothing."""
+
+    def __init__(self, path: str):
+        self.file = open(path, "a")
+
+    def write(self, **entry):
+        self.file.write(json.dumps(entry) + "\n")
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+async def ingest(items: List[dict], workers: int, concurrency: int, checkpoint: Checkpoint):
+    # Imported here so --dry-run and the worker processes never touch Pinecone/OpenAI
+    from server.config.db import reports_collection
+    from server.config.services import get_embed_model
+    from server.reports.vectorstore import index_documents, report_record
+    from server.reports.storage import get_storage, report_key
+    from server.reports.text_cache import file_sha256
+    from server.reports.digest import enqueue_digest, script_can_queue_digests
+
+    loop = asyncio.get_running_loop()
+    embed_model = get_embed_model()
+    storage = get_storage()
+    index_slots = asyncio.Semaphore(concurrency)
+    stats = {"done": 0, "empty": 0, "failed": 0, "chunks": 0}
+    queue_digests = script_can_queue_digests()
+    start = time.time()
+
+    pbar = tqdm(total=len(items), unit="file", desc="Ingesting")
+
+    async def process(item: dict, pool: ProcessPoolExecutor):
+        doc_id = item["doc_id"] or str(uuid.uuid4())
+        filename = item["filename"]
+        # Logged before any write, so a crash mid-file is retried under the same doc_id
+        checkpoint.write(path=item["path"], status="started", doc_id=doc_id)
+        try:
+            # 1. Extraction/OCR in a worker process
+            documents = await loop.run_in_executor(pool, load_documents, item["path"], filename)
+            if not documents:
+                stats["empty"] += 1
+                checkpoint.write(path=item["path"], status="empty", doc_id=doc_id)
+                return
+
+            # 2. Same file layout as POST /reports/upload, so /reports/view works
+            await storage.copy_from(report_key(doc_id, filename), item["path"])
+            sha256 = await asyncio.to_thread(file_sha256, item["path"])
+
+            # 3. Embedding/upsert, a bounded number of files at a time
+            uploaded_at = time.time()
+            async with index_slots:
+                indexed = await index_documents(
+                    documents, filename, doc_id, item["uploader"], uploaded_at, embed_model
+                )
+            if not indexed:
+                stats["empty"] += 1
+                checkpoint.write(path=item["path"], status="empty", doc_id=doc_id)
+                return
+
+            # An upsert, in case an earlier attempt stopped between this write and its checkpoint
+            await asyncio.to_thread(
+                reports_collection.update_one,
+                {"doc_id": doc_id, "filename": filename},
+                {"$set": report_record(doc_id, filename, item["uploader"], 0, uploaded_at, indexed, sha256)},
+                upsert=True
+            )
+            # Generated by the API servers' digest workers
+            if queue_digests:
+                await asyncio.to_thread(enqueue_digest, doc_id)
+            stats["done"] += 1
+            stats["chunks"] += indexed["num_chunks"]
+            checkpoint.write(path=item["path"], status="done", doc_id=doc_id)
+        except Exception as e:
+            stats["failed"] += 1
+            checkpoint.write(path=item["path"], status="failed", doc_id=doc_id, error=str(e))
+        finally:
+            elapsed = max(time.time() - start, 1e-6)
+            pbar.set_postfix(ok=stats["done"], failed=stats["failed"],
+                             chunks_per_s=f"{stats['chunks'] / elapsed:.1f}")
+            pbar.update(1)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for i in range(0, len(items), WINDOW_SIZE):
+            window = items[i:i + WINDOW_SIZE]
+            await asyncio.gather(*(process(item, pool) for item in window))
+
+    pbar.close()
+    elapsed = time.time() - start
+    print(f"✅ {stats['done']} ingested, {stats['empty']} without text, {stats['failed']} failed "
+          f"in {elapsed:.1f}s ({stats['done'] / max(elapsed, 1e-6):.2f} files/s, "
+          f"{stats['chunks'] / max(elapsed, 1e-6):.1f} chunks/s)")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-ingest an archive of PDF reports.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--dir", help="Directory of PDFs (archive/<username>/... unless --uploader is set)")
+    source.add_argument("--manifest", help="CSV or JSONL with path,uploader[,doc_id,filename] rows")
+    parser.add_argument("--uploader", help="Username that owns every file")
+    parser.add_argument("--checkpoint", default="bulk_ingest.checkpoint.jsonl",
+                        help="Progress log; re-running with the same file resumes")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="Extraction/OCR processes")
+    parser.add_argument("--concurrency", type=int, default=8, help="Files embedded/upserted concurrently")
+    parser.add_argument("--retry-empty", action="store_true",
+                        help="Also retry files that had no extractable text (e.g. after an OCR change)")
+    parser.add_argument("--dry-run", action="store_true", help="List what would be ingested and exit")
+    args = parser.parse_args()
+
+    items = read_manifest(args.manifest, args.uploader) if args.manifest else walk_directory(args.dir, args.uploader)
+
+    state = load_checkpoint(args.checkpoint)
+    finished = ("done",) if args.retry_empty else FINISHED
+    pending = [item for item in items if state.get(item["path"], {}).get("status") not in finished]
+    for item in pending:
+        item["doc_id"] = item["doc_id"] or state.get(item["path"], {}).get("doc_id")
+    print(f"📂 {len(items)} file(s) found, {len(items) - len(pending)} already processed, {len(pending)} to ingest.")
+
+    if args.dry_run or not pending:
+        return
+
+    checkpoint = Checkpoint(args.checkpoint)
+    try:
+        asyncio.run(ingest(pending, args.workers, args.concurrency, checkpoint))
+    finally:
+        checkpoint.close()
+
+
+if __name__ == "__main__":
+    main()
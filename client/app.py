@@ -3,6 +3,7 @@ import requests
 import json
 import datetime
 import os
+import uuid
 from dotenv import load_dotenv
 from requests.exceptions import JSONDecodeError, RequestException
 
@@ -380,23 +381,26 @@ def upload_report(token, files):
         return 503, {"detail": "Server is unavailable."}
 
 def get_chat_response(token, doc_id, messages, mode="current"):
-    try:
-        headers = {'Authorization': f'Bearer {token}'}
-        
-        if mode == "trends":
-            endpoint = f"{API_URL}/diagnosis/longitudinal"
-        else:
-            endpoint = f"{API_URL}/diagnosis/chat"
-            
-        payload = {
-            "doc_id": doc_id,
-            "messages": messages
-        }
+    # One key per question: a retry after a dropped connection gets the original answer
+    headers = {'Authorization': f'Bearer {token}', 'Idempotency-Key': uuid.uuid4().hex}
+    
+    if mode == "trends":
+        endpoint = f"{API_URL}/diagnosis/longitudinal"
+    else:
+        endpoint = f"{API_URL}/diagnosis/chat"
         
-        response = requests.post(endpoint, headers=headers, json=payload)
-        return response.status_code, response.json()
-    except requests.exceptions.ConnectionError:
-        return 503, {"detail": "Server is unavailable."}
+    payload = {
+        "doc_id": doc_id,
+        "messages": messages
+    }
+    
+    for attempt in range(2):
+        try:
+            response = requests.post(endpoint, headers=headers, json=payload)
+            return response.status_code, response.json()
+        except requests.exceptions.ConnectionError:
+            continue
+    return 503, {"detail": "Server is unavailable."}
 
 def get_doctor_diagnosis(token, patient_name):
     try:
@@ -411,10 +415,35 @@ def get_doctor_diagnosis(token, patient_name):
         return 503, {"detail": "Server is unavailable."}
 
 def get_pending_reviews(token):
+    """
+    The review queue, loaded in full once per login and then kept current with
+    /diagnosis/pending/changes, so a rerun only fetches what changed.
+    """
     try:
         headers = {'Authorization': f'Bearer {token}'}
-        response = requests.get(f"{API_URL}/diagnosis/pending", headers=headers)
-        return response.status_code, response.json()
+        if "pending_cursor" not in st.session_state:
+            response = requests.get(f"{API_URL}/diagnosis/pending", headers=headers)
+            if response.status_code != 200:
+                return response.status_code, response.json()
+            st.session_state.pending_queue = {rec["_id"]: rec for rec in response.json()}
+            st.session_state.pending_cursor = float(response.headers["X-Review-Cursor"])
+        else:
+            response = requests.get(
+                f"{API_URL}/diagnosis/pending/changes",
+                headers=headers,
+                params={"since": st.session_state.pending_cursor}
+            )
+            if response.status_code != 200:
+                return response.status_code, response.json()
+            changes = response.json()
+            for event in changes["events"]:
+                if event["event"] == "upsert":
+                    st.session_state.pending_queue[event["record"]["_id"]] = event["record"]
+                else:
+                    st.session_state.pending_queue.pop(event["_id"], None)
+            st.session_state.pending_cursor = changes["cursor"]
+        pending = sorted(st.session_state.pending_queue.values(), key=lambda r: r.get("timestamp", 0), reverse=True)
+        return 200, pending
     except requests.exceptions.ConnectionError:
         return 503, {"detail": "Server is unavailable."}
 
@@ -427,6 +456,15 @@ def verify_record(token, record_id, status, note):
     except requests.exceptions.ConnectionError:
         return 503, {"detail": "Server is unavailable."}
 
+def verify_records_bulk(token, items):
+    """items: [{"record_id", "status", "note"}]; one request for the whole selection."""
+    try:
+        headers = {'Authorization': f'Bearer {token}'}
+        response = requests.post(f"{API_URL}/diagnosis/verify/bulk", headers=headers, json={"items": items})
+        return response.status_code, response.json()
+    except requests.exceptions.ConnectionError:
+        return 503, {"detail": "Server is unavailable."}
+
 def get_patient_history(token):
     try:
         headers = {'Authorization': f'Bearer {token}'}
@@ -475,6 +513,9 @@ if st.session_state.logged_in:
         st.session_state.username = ""
         st.session_state.token = ""
         st.session_state.role = ""
+        st.session_state.pop("pending_cursor", None)
+        st.session_state.pop("pending_queue", None)
+        st.session_state.pop("bulk_review_result", None)
         st.rerun()
 else:
     tab1, tab2 = st.sidebar.tabs(["🔐 Login", "📝 Signup"])
@@ -770,10 +811,53 @@ else:
             
             with st.spinner("📥 Loading pending reviews..."):
                 code, pending = get_pending_reviews(st.session_state.token)
+
+            if "bulk_review_result" in st.session_state:
+                status, res = st.session_state.pop("bulk_review_result")
+                failed = [r for r in res["results"] if r["result"] != "updated"]
+                st.success(f"✅ {res['updated']} diagnosis {status}")
+                if failed:
+                    st.warning(f"⚠️ {len(failed)} could not be updated")
             
             if code == 200:
                 if pending:
                     st.info(f"📋 You have **{len(pending)}** diagnosis awaiting review")
+
+                    # Multi-select review: routine items cleared with one request
+                    with st.form("bulk_review", clear_on_submit=True):
+                        labels = {
+                            rec['_id']: f"{rec.get('requester')} | "
+                                        f"{datetime.datetime.fromtimestamp(rec.get('timestamp', 0)).strftime('%b %d, %I:%M %p')} | "
+                                        f"{(rec.get('question') or '')[:60]}"
+                            for rec in pending
+                        }
+                        selected = st.multiselect(
+                            "Select diagnoses to review together",
+                            options=list(labels),
+                            format_func=labels.get
+                        )
+                        bulk_note = st.text_input("Note for all selected", placeholder="e.g. Routine result, no action needed")
+                        b1, b2 = st.columns(2)
+                        with b1:
+                            bulk_approve = st.form_submit_button("✅ Approve selected", use_container_width=True)
+                        with b2:
+                            bulk_reject = st.form_submit_button("❌ Reject selected", use_container_width=True)
+
+                    if (bulk_approve or bulk_reject) and selected:
+                        if bulk_note:
+                            status = "approved" if bulk_approve else "rejected"
+                            res_code, res = verify_records_bulk(
+                                st.session_state.token,
+                                [{"record_id": rid, "status": status, "note": bulk_note} for rid in selected]
+                            )
+                            if res_code == 200:
+                                # Shown after the rerun that refreshes the queue
+                                st.session_state.bulk_review_result = (status, res)
+                                st.rerun()
+                            else:
+                                st.error(f"❌ {res.get('detail', 'Bulk review failed')}")
+                        else:
+                            st.warning("⚠️ Please add a note for the selected diagnoses")
                     
                     for idx, rec in enumerate(pending):
                         timestamp = datetime.datetime.fromtimestamp(rec.get('timestamp', 0)).strftime('%B %d, %Y at %I:%M %p (GMT)')
@@ -813,7 +897,20 @@ else:
                                             st.warning("File missing")
                                     else:
                                         st.caption("🚫 Source file not found")
-                            
+
+                            # Generated once at upload time, so no extra request per record
+                            digest = rec.get("digest")
+                            if digest:
+                                with st.container(border=True):
+                                    st.markdown("**📝 Report Digest**")
+                                    if digest.get("findings"):
+                                        st.markdown(digest["findings"])
+                                    for row in digest.get("abnormal", []):
+                                        unit = f" {row['unit']}" if row.get("unit") else ""
+                                        page = f" (Page {row['page']})" if row.get("page") is not None else ""
+                                        icon = "🔺" if row.get("flag") == "high" else "🔻"
+                                        st.markdown(f"{icon} **{row['name']}**: {row['value']:g}{unit}{page}")
+
                             st.markdown("---")
                             st.markdown("#### ✍️ Your Professional Review")
                             
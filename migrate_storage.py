@@ -0,0 +1,36 @@
+import argparse
+import asyncio
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from server.reports.storage import get_storage, LocalStorage, UPLOAD_DIR, STORAGE_BACKEND
+
+
+async def migrate(source: LocalStorage, target, dry_run: bool) -> int:
+    same_store = isinstance(target, LocalStorage) and target.root.resolve() == source.root.resolve()
+    moved = 0
+    for key in await source.keys():
+        name, _ = source._find(key)
+        if same_store and "/" in name:
+            continue  # already in the sharded layout
+        moved += 1
+        if not dry_run:
+            # A save into the same directory also removes the flat file
+            await target.save(key, await source.read(key))
+    return moved
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Move flat UPLOAD_DIR report files into the sharded layout (and STORAGE_COMPRESSION), "
+                    "or copy a local directory into STORAGE_BACKEND=s3. Safe to re-run."
+    )
+    parser.add_argument("--from-dir", default=UPLOAD_DIR, help="Local directory to read from")
+    parser.add_argument("--dry-run", action="store_true", help="Only count the files to move")
+    args = parser.parse_args()
+
+    source = LocalStorage(args.from_dir)
+    print(f"📦 {args.from_dir} -> {STORAGE_BACKEND} storage")
+    moved = asyncio.run(migrate(source, get_storage(), args.dry_run))
+    print(f"✅ {'Would move' if args.dry_run else 'Moved'} {moved} file(s).")
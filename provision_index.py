@@ -0,0 +1,20 @@
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from server.config.services import provision_index, PINECONE_INDEX_NAME, EMBED_DIMENSION, VECTOR_BACKEND
+from server.config.db import ensure_indexes
+
+if __name__ == "__main__":
+    if VECTOR_BACKEND == "local":
+        print(f"✅ Local vector index '{PINECONE_INDEX_NAME}' is created on first use.")
+    else:
+        print(f"🔧 Provisioning Pinecone index '{PINECONE_INDEX_NAME}' (dimension={EMBED_DIMENSION})...")
+        if provision_index():
+            print("✅ Index created and ready.")
+        else:
+            print("✅ Index already exists.")
+
+    print("🔧 Creating MongoDB indexes...")
+    ensure_indexes()
+    print("✅ MongoDB indexes ready.")
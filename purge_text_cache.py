@@ -0,0 +1,56 @@
+import argparse
+import asyncio
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from server.reports import text_cache
+from server.reports.storage import get_storage, STORAGE_BACKEND
+
+
+async def stored_file_hashes() -> set:
+    storage = get_storage()
+    hashes = set()
+    for key in await storage.keys():
+        async with storage.local_path(key) as path:
+            hashes.add(text_cache.file_sha256(str(path)))
+    return hashes
+
+
+def print_stats(label: str):
+    s = text_cache.stats()
+    print(f"{label}: {s['entries']} file(s), {s['pages']} page(s), {s['bytes'] / (1024 * 1024):.1f} MB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=f"Trim or clear the extracted-text cache ({text_cache.TEXT_CACHE_PATH}). "
+                    "Purged files are simply re-extracted the next time they are indexed."
+    )
+    parser.add_argument("--all", action="store_true", help="Remove every entry")
+    parser.add_argument("--older-than-days", type=float, help="Remove entries not used for this many days")
+    parser.add_argument("--orphans", action="store_true",
+                        help="Remove entries whose file is no longer in report storage")
+    parser.add_argument("--max-mb", type=float, help="Evict least recently used entries down to this size")
+    parser.add_argument("--stats", action="store_true", help="Only print the cache size")
+    args = parser.parse_args()
+
+    print_stats("📦 Text cache")
+    if args.stats:
+        raise SystemExit(0)
+
+    keep = None
+    if args.orphans:
+        print(f"🔎 Hashing stored report files ({STORAGE_BACKEND})...")
+        keep = asyncio.run(stored_file_hashes())
+
+    removed = text_cache.purge(
+        max_bytes=int(args.max_mb * 1024 * 1024) if args.max_mb is not None else None,
+        older_than=args.older_than_days * 86400 if args.older_than_days is not None else None,
+        keep=keep,
+        everything=args.all,
+    )
+    if removed:
+        text_cache.compact()
+    print(f"✅ Removed {removed} entr{'y' if removed == 1 else 'ies'}.")
+    print_stats("📦 Text cache")
@@ -0,0 +1,50 @@
+import argparse
+import asyncio
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from server.reports.digest import script_can_queue_digests
+from server.reports.indexing import reindex_report, reports_needing_reindex
+from server.reports.vectorstore import INDEX_VERSION
+
+
+async def migrate(version: int, batch_size: int, limit: int, dry_run: bool):
+    doc_ids = reports_needing_reindex(version, limit=limit)
+    print(f"🔎 {len(doc_ids)} report(s) not yet on index version {version}.")
+    if dry_run or not doc_ids:
+        return
+
+    refresh_digest = script_can_queue_digests()
+    done, failed = 0, 0
+    start = time.time()
+    for i in range(0, len(doc_ids), batch_size):
+        batch = doc_ids[i:i + batch_size]
+        results = await asyncio.gather(
+            *(reindex_report(doc_id, version=version, refresh_digest=refresh_digest) for doc_id in batch),
+            return_exceptions=True
+        )
+        for doc_id, res in zip(batch, results):
+            if isinstance(res, Exception):
+                failed += 1
+                print(f"   ❌ {doc_id}: {res}")
+            else:
+                done += 1
+        print(f"   - {done + failed}/{len(doc_ids)} processed ({done / (time.time() - start):.1f} reports/s)")
+
+    print(f"✅ Re-indexed {done} report(s), {failed} failed. Re-run to retry failures.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Incrementally re-embed reports into a new index version. "
+                    "Reports keep serving their old vectors until each one is cut over."
+    )
+    parser.add_argument("--version", type=int, default=INDEX_VERSION, help="Target index version (default: INDEX_VERSION)")
+    parser.add_argument("--batch-size", type=int, default=5, help="Reports re-embedded concurrently")
+    parser.add_argument("--limit", type=int, default=0, help="Stop after this many reports (0 = all)")
+    parser.add_argument("--dry-run", action="store_true", help="Only count the reports that need migrating")
+    args = parser.parse_args()
+
+    asyncio.run(migrate(args.version, args.batch_size, args.limit, args.dry_run))
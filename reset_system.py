@@ -1,9 +1,12 @@
 import os
 import shutil
+import asyncio
 from dotenv import load_dotenv
 from pymongo import MongoClient
 from pinecone import Pinecone
 
+from server.reports.storage import get_storage, STORAGE_BACKEND
+
 # Load environment variables
 load_dotenv()
 
@@ -20,7 +23,7 @@ def reset_database():
     db = client[DB_NAME]
 
     # List of collections to clear
-    collections = ["users", "reports", "diagnosis_history"]
+    collections = ["users", "reports", "diagnosis_history", "lab_results", "report_digests"]
     
     for col_name in collections:
         result = db[col_name].delete_many({})
@@ -48,23 +51,32 @@ def reset_pinecone():
         print(f"❌ Error clearing Pinecone: {e}")
 
 def reset_local_files():
-    print("\n🗑️  Cleaning local upload directory...")
-    upload_dir = os.getenv("UPLOAD_DIR", "./uploaded_dir")
-    
-    if os.path.exists(upload_dir):
-        # Remove all files in the directory but keep the directory itself
-        for filename in os.listdir(upload_dir):
-            file_path = os.path.join(upload_dir, filename)
+    storage = get_storage()
+    print(f"\n🗑️  Deleting stored report files ({STORAGE_BACKEND})...")
+
+    async def delete_all():
+        keys = await storage.keys()
+        for key in keys:
             try:
-                if os.path.isfile(file_path) or os.path.islink(file_path):
-                    os.unlink(file_path)
-                elif os.path.isdir(file_path):
-                    shutil.rmtree(file_path)
+                await storage.delete(key)
             except Exception as e:
-                print(f"   ❌ Failed to delete {file_path}. Reason: {e}")
-        print(f"✅ Local files in '{upload_dir}' deleted.")
-    else:
-        print(f"   ⚠️ Directory '{upload_dir}' does not exist, skipping.")
+                print(f"   ❌ Failed to delete {key}. Reason: {e}")
+        return len(keys)
+    print(f"✅ {asyncio.run(delete_all())} report file(s) deleted.")
+
+    # Chunk store and extracted-text cache (SQLite files plus their WAL/shared-memory files)
+    for store in (os.getenv("CHUNK_STORE_PATH", "./chunk_store.sqlite"),
+                  os.getenv("TEXT_CACHE_PATH", "./extracted_text.sqlite")):
+        for path in (store, store + "-wal", store + "-shm"):
+            if os.path.exists(path):
+                os.unlink(path)
+        print(f"✅ '{store}' deleted.")
+
+    # Self-hosted vector index (VECTOR_BACKEND=local)
+    index_dir = os.getenv("LOCAL_INDEX_DIR", "./vector_index")
+    if os.path.isdir(index_dir):
+        shutil.rmtree(index_dir)
+        print(f"✅ Local vector index '{index_dir}' deleted.")
 
 if __name__ == "__main__":
     confirm = input("⚠️  WARNING: This will DELETE ALL DATA (Users, Reports, History, Vectors). Type 'yes' to proceed: ")
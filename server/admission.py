@@ -0,0 +1,184 @@
+"""
+Admission control for the LLM- and OCR-bound endpoints.
+
+Each admitted request holds its route's weight in capacity units (ADMISSION_WEIGHTS: a
+longitudinal analysis or an OCR upload costs more than a chat turn) until it finishes:
+
+  ADMISSION_CAPACITY        units across the process; past it requests wait in a FIFO
+                            queue of ADMISSION_QUEUE_SIZE for at most
+                            ADMISSION_QUEUE_TIMEOUT_SECONDS, then get 503
+  ADMISSION_USER_CAPACITY   units one user may hold or have queued; past it, 429 at once
+
+Rejections carry Retry-After, estimated from how long admitted requests have recently held
+their units, so saturation sheds load before it reaches the providers.
+Capacity and the queue are per process (i.e. per uvicorn worker, so the deployment's total
+scales with the workers); a user's units are counted in the shared state, so the user
+limit holds however the load balancer spreads their requests.
+"""
+import os
+import math
+import time
+import asyncio
+from collections import deque
+
+from dotenv import load_dotenv
+from fastapi import Depends, HTTPException
+
+from .auth.route import get_current_user
+from .config.state import get_state, key
+from .metrics import Counter, Gauge, register
+
+load_dotenv()
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+ADMISSION_CAPACITY = int(os.getenv("ADMISSION_CAPACITY", "32"))
+ADMISSION_USER_CAPACITY = int(os.getenv("ADMISSION_USER_CAPACITY", "4"))
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "64"))
+ADMISSION_QUEUE_TIMEOUT_SECONDS = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", "10"))
+# A worker that dies holding units leaks them until the user is idle this long
+ADMISSION_USER_TTL_SECONDS = 300
+# route class=units, comma-separated; unlisted classes weigh 1
+ROUTE_WEIGHTS = {
+    name.strip(): int(units)
+    for name, units in (item.split("=") for item in
+                        os.getenv("ADMISSION_WEIGHTS", "chat=1,longitudinal=2,upload=3,reindex=3").split(",") if item)
+}
+
+ADMISSION_UNITS_IN_USE = register(Gauge(
+    "medragnosis_admission_units_in_use", "Admission capacity units held by running requests."
+))
+ADMISSION_QUEUE_DEPTH = register(Gauge(
+    "medragnosis_admission_queue_depth", "Requests waiting for admission, by route class."
+))
+ADMISSION_SHED = register(Counter(
+    "medragnosis_admission_shed_total",
+    "Requests rejected by admission control, by route class and reason (user_limit, queue_full, timeout)."
+))
+
+MESSAGES = {
+    "user_limit": "You have too many requests in progress. Please wait for them to finish.",
+    "queue_full": "The server is busy. Please try again shortly.",
+    "timeout": "The server is busy. Please try again shortly.",
+}
+
+
+class AdmissionController:
+    def __init__(self, capacity: int = ADMISSION_CAPACITY, user_capacity: int = ADMISSION_USER_CAPACITY,
+                 queue_size: int = ADMISSION_QUEUE_SIZE, queue_timeout: float = ADMISSION_QUEUE_TIMEOUT_SECONDS):
+        self.capacity = capacity
+        self.user_capacity = user_capacity
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.in_use = 0
+        self._queue = deque()  # [future, weight, route], oldest first
+        self._hold_seconds = 1.0  # moving average of how long admitted requests run
+
+    def retry_after(self) -> int:
+        return max(1, min(60, math.ceil(self._hold_seconds)))
+
+    def _shed(self, route: str, reason: str, status_code: int):
+        ADMISSION_SHED.inc(route=route, reason=reason)
+        raise HTTPException(status_code=status_code, detail=MESSAGES[reason],
+                            headers={"Retry-After": str(self.retry_after())})
+
+    def _grant(self):
+        # Strict FIFO: a heavy request at the head is not overtaken by lighter ones behind it
+        while self._queue:
+            future, weight, _ = self._queue[0]
+            if future.done():
+                self._queue.popleft()
+                continue
+            if self.in_use + weight > self.capacity:
+                break
+            self._queue.popleft()
+            self.in_use += weight
+            future.set_result(True)
+        ADMISSION_UNITS_IN_USE.set(self.in_use)
+
+    def _expire(self, entry: list):
+        future = entry[0]
+        if not future.done():
+            future.set_exception(TimeoutError())
+
+    async def _dequeue(self, entry: list, user: str):
+        if entry in self._queue:
+            self._queue.remove(entry)
+        self._grant()
+        await self._add_user_units(user, -entry[1])
+
+    async def _add_user_units(self, user: str, units: int) -> int:
+        """Adds to the units the user holds or has queued across all workers; returns the new total."""
+        state, user_key = get_state(), key("admission", "user", user)
+
+        def update():
+            total = state.incrby(user_key, units)
+            state.expire(user_key, ADMISSION_USER_TTL_SECONDS)
+            return total
+        return await asyncio.to_thread(update)
+
+    async def acquire(self, user: str, route: str, weight: int):
+        """Returns once `weight` units are held for the user; raises a 429/503 HTTPException instead."""
+        weight = max(1, min(weight, self.capacity, self.user_capacity))
+        # Counted first and given back on rejection, so two workers cannot both pass the check
+        if await self._add_user_units(user, weight) > self.user_capacity:
+            await self._add_user_units(user, -weight)
+            self._shed(route, "user_limit", 429)
+        if not self._queue and self.in_use + weight <= self.capacity:
+            self.in_use += weight
+            ADMISSION_UNITS_IN_USE.set(self.in_use)
+            return
+        if len(self._queue) >= self.queue_size:
+            await self._add_user_units(user, -weight)
+            self._shed(route, "queue_full", 503)
+
+        loop = asyncio.get_running_loop()
+        entry = [loop.create_future(), weight, route]
+        self._queue.append(entry)
+        timer = loop.call_later(self.queue_timeout, self._expire, entry)
+        ADMISSION_QUEUE_DEPTH.inc(route=route)
+        try:
+            await entry[0]
+        except TimeoutError:
+            await self._dequeue(entry, user)
+            self._shed(route, "timeout", 503)
+        except asyncio.CancelledError:
+            # The client went away; give back the units if they were granted meanwhile
+            if entry[0].done() and not entry[0].cancelled() and entry[0].exception() is None:
+                await self.release(user, weight)
+            else:
+                await self._dequeue(entry, user)
+            raise
+        finally:
+            timer.cancel()
+            ADMISSION_QUEUE_DEPTH.dec(route=route)
+
+    async def release(self, user: str, weight: int, held_seconds: float = None):
+        weight = max(1, min(weight, self.capacity, self.user_capacity))
+        self.in_use -= weight
+        if held_seconds is not None:
+            self._hold_seconds = 0.8 * self._hold_seconds + 0.2 * held_seconds
+        self._grant()
+        await self._add_user_units(user, -weight)
+
+
+controller = AdmissionController()
+
+
+def admit(route: str):
+    """
+    Dependency in place of get_current_user for expensive routes: yields the user once the
+    request is admitted and holds its units until the endpoint returns.
+    """
+    weight = ROUTE_WEIGHTS.get(route, 1)
+
+    async def dependency(user=Depends(get_current_user)):
+        if not ADMISSION_ENABLED:
+            yield user
+            return
+        await controller.acquire(user["username"], route, weight)
+        start = time.monotonic()
+        try:
+            yield user
+        finally:
+            await controller.release(user["username"], weight, time.monotonic() - start)
+    return dependency
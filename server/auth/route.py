@@ -4,6 +4,7 @@ from .models import SignupRequest, LoginRequest
 from .hash_utils import hash_password, verify_password
 from .jwt_handler import create_access_token, verify_token
 from ..config.db import users_collection
+from ..metrics import span
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
@@ -28,7 +29,8 @@ def get_current_user(token: str = Depends(oauth2_scheme)):
     if username is None or role is None:
         raise HTTPException(status_code=401, detail="Invalid token payload")
         
-    user = users_collection.find_one({"username": username})
+    with span("auth_lookup"):
+        user = users_collection.find_one({"username": username})
     if not user:
         raise HTTPException(status_code=401, detail="User not found")
         
@@ -8,10 +8,24 @@ load_dotenv()
 MONGO_URI=os.getenv("MONGO_URI")
 DB_NAME=os.getenv("DB_NAME","MedRagnosis")
 
-client=MongoClient(MONGO_URI)
+# connect=False: no connection or monitor threads until the first operation
+client=MongoClient(MONGO_URI, connect=False)
 db=client[DB_NAME]
 
 
 users_collection=db["users"]
 reports_collection=db["reports"]
-diagnosis_collection=db["diagnosis_history"]
\ No newline at end of file
+diagnosis_collection=db["diagnosis_history"]
+lab_results_collection=db["lab_results"]
+digests_collection=db["report_digests"]
+
+
+def ensure_indexes():
+    """Creates the secondary indexes used by the hot read paths. Safe to call repeatedly."""
+    reports_collection.create_index([("doc_id", 1)])
+    reports_collection.create_index([("index_version", 1), ("uploaded_at", 1)])
+    lab_results_collection.create_index([("uploader", 1), ("test", 1), ("report_date", 1)])
+    lab_results_collection.create_index([("doc_id", 1), ("test", 1)])
+    diagnosis_collection.create_index([("verification_status", 1), ("timestamp", -1)])
+    diagnosis_collection.create_index([("updated_at", 1)])
+    digests_collection.create_index([("doc_id", 1)], unique=True)
\ No newline at end of file
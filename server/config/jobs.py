@@ -0,0 +1,57 @@
+"""
+Background job queues in the shared state.
+
+Any worker can push a job and any worker can pop it, so background work (e.g. digests
+generated after an upload) survives the request that queued it and spreads across the
+deployment. A job's status is kept for JOB_STATUS_TTL_SECONDS after it finishes. Jobs
+popped by a worker that dies are not retried.
+"""
+import json
+import time
+import uuid
+from typing import Optional
+
+from .state import get_state, key
+
+JOB_STATUS_TTL_SECONDS = 24 * 3600
+
+
+class JobQueue:
+    def __init__(self, name: str):
+        self.name = name
+
+    def _status_key(self, job_id: str) -> str:
+        return key("job", self.name, job_id)
+
+    def _set_status(self, job: dict, ex: int = None):
+        get_state().set(self._status_key(job["id"]), json.dumps(job), ex=ex)
+
+    def push(self, kind: str, **payload) -> str:
+        """Queues a job; returns its id."""
+        job = {"id": uuid.uuid4().hex, "kind": kind, "payload": payload,
+               "status": "queued", "queued_at": time.time()}
+        self._set_status(job)
+        get_state().lpush(key("queue", self.name), json.dumps(job))
+        return job["id"]
+
+    def pop(self) -> Optional[dict]:
+        """The oldest queued job, now marked running, or None if the queue is empty."""
+        raw = get_state().rpop(key("queue", self.name))
+        if raw is None:
+            return None
+        job = {**json.loads(raw), "status": "running", "started_at": time.time()}
+        self._set_status(job)
+        return job
+
+    def finish(self, job: dict, error: str = None):
+        done = {**job, "status": "failed" if error else "done", "finished_at": time.time()}
+        if error:
+            done["error"] = error
+        self._set_status(done, ex=JOB_STATUS_TTL_SECONDS)
+
+    def status(self, job_id: str) -> Optional[dict]:
+        raw = get_state().get(self._status_key(job_id))
+        return json.loads(raw) if raw is not None else None
+
+    def __len__(self) -> int:
+        return get_state().llen(key("queue", self.name))
@@ -0,0 +1,201 @@
+"""
+Central dispatcher for LLM (Groq) calls: priority classes, a tokens-per-minute budget
+and fair queuing across users.
+
+Every LLM call goes through `call_llm()`. When the provider's concurrency slots
+(GROQ_MAX_CONCURRENCY) or the token budget (LLM_TOKENS_PER_MINUTE) are exhausted, calls
+wait and are released strictly by priority class:
+
+  interactive > longitudinal > batch
+
+and round-robin across users within a class, so one user's burst cannot hold back
+another's. LLM_INTERACTIVE_RESERVED slots are kept free of lower classes, so an
+interactive chat turn never waits behind a full house of batch calls.
+
+Callers name their class; a block run under `llm_priority("batch")` (e.g. an evaluation
+run) demotes every call made inside it.
+"""
+import os
+import time
+import asyncio
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from dotenv import load_dotenv
+
+from .services import call, PROVIDER_LIMITS
+from ..metrics import Gauge, Histogram, register
+
+load_dotenv()
+
+PRIORITIES = ("interactive", "longitudinal", "batch")
+# Groq's quota for the model and plan; 0 disables the budget
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "0"))
+# Processes drawing on that quota (uvicorn workers times replicas); each gets an equal share
+LLM_BUDGET_SHARES = max(1, int(os.getenv("LLM_BUDGET_SHARES", os.getenv("WEB_CONCURRENCY", "1"))))
+LLM_INTERACTIVE_RESERVED = int(os.getenv("LLM_INTERACTIVE_RESERVED", "2"))
+# Completion tokens reserved per call until the real usage is known
+LLM_OUTPUT_TOKENS_ESTIMATE = int(os.getenv("LLM_OUTPUT_TOKENS_ESTIMATE", "300"))
+
+LLM_QUEUE_DEPTH = register(Gauge(
+    "medragnosis_llm_queue_depth", "LLM calls waiting in the dispatcher, by priority class."
+))
+LLM_WAIT_SECONDS = register(Histogram(
+    "medragnosis_llm_wait_seconds", "Time LLM calls waited in the dispatcher, by priority class."
+))
+
+llm_priority_var: ContextVar[str] = ContextVar("llm_priority", default=None)
+
+
+@contextmanager
+def llm_priority(priority: str):
+    """Runs every LLM call made inside the block at this priority class."""
+    if priority not in PRIORITIES:
+        raise ValueError(f"Unknown LLM priority {priority!r} ({', '.join(PRIORITIES)})")
+    token = llm_priority_var.set(priority)
+    try:
+        yield
+    finally:
+        llm_priority_var.reset(token)
+
+
+def estimate_tokens(*payload) -> int:
+    """Prompt tokens (about 4 characters each) plus the completion allowance."""
+    return len(str(payload)) // 4 + LLM_OUTPUT_TOKENS_ESTIMATE
+
+
+class LLMDispatcher:
+    def __init__(self, slots: int = PROVIDER_LIMITS["groq"],
+                 tokens_per_minute: int = LLM_TOKENS_PER_MINUTE // LLM_BUDGET_SHARES,
+                 interactive_reserved: int = LLM_INTERACTIVE_RESERVED):
+        self.slots = slots
+        self.interactive_reserved = min(interactive_reserved, slots - 1)
+        self.rate = tokens_per_minute / 60.0
+        self.capacity = float(tokens_per_minute)
+        self.tokens = self.capacity
+        self.in_flight = 0
+        self._refilled = time.monotonic()
+        # priority -> {user: deque of [future, tokens]}; dict order is the round-robin order
+        self._queues = {p: OrderedDict() for p in PRIORITIES}
+        self._timer = None  # (loop, handle) of the pending budget wake-up
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._refilled) * self.rate)
+        self._refilled = now
+
+    def _slot_free(self, priority: str) -> bool:
+        limit = self.slots if priority == "interactive" else self.slots - self.interactive_reserved
+        return self.in_flight < limit
+
+    def _deficit(self, tokens: int) -> float:
+        """Tokens the budget is short of for this call (a call larger than the whole budget
+        runs once the bucket is full)."""
+        if not self.rate:
+            return 0.0
+        return max(0.0, min(tokens, self.capacity) - self.tokens)
+
+    def _next(self):
+        """The head waiter of the highest non-empty class, taking users in turn."""
+        for priority in PRIORITIES:
+            users = self._queues[priority]
+            while users:
+                user, waiters = next(iter(users.items()))
+                while waiters and waiters[0][0].done():
+                    waiters.popleft()  # cancelled while waiting
+                if waiters:
+                    return priority, user, waiters
+                del users[user]
+        return None
+
+    def _dispatch(self):
+        self._timer = None
+        self._refill()
+        while True:
+            head = self._next()
+            if head is None:
+                return
+            priority, user, waiters = head
+            future, tokens = waiters[0]
+            if not self._slot_free(priority):
+                return  # the next release dispatches again
+            deficit = self._deficit(tokens)
+            if deficit:
+                # Lower classes wait too; wake up once the budget has refilled enough
+                loop = asyncio.get_running_loop()
+                if self._timer is None or self._timer[0] is not loop:
+                    self._timer = (loop, loop.call_later(deficit / self.rate, self._dispatch))
+                return
+            waiters.popleft()
+            users = self._queues[priority]
+            users.move_to_end(user)
+            if not waiters:
+                del users[user]
+            self._take(tokens)
+            future.set_result(True)
+
+    def _take(self, tokens: int):
+        self.in_flight += 1
+        if self.rate:
+            self.tokens -= min(tokens, self.capacity)
+
+    async def acquire(self, priority: str, user: str, tokens: int):
+        self._refill()
+        if not any(self._queues[p] for p in PRIORITIES) and self._slot_free(priority) and not self._deficit(tokens):
+            self._take(tokens)
+            LLM_WAIT_SECONDS.observe(0.0, priority=priority)
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._queues[priority].setdefault(user, deque()).append([future, tokens])
+        LLM_QUEUE_DEPTH.inc(priority=priority)
+        start = time.perf_counter()
+        try:
+            self._dispatch()
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+        finally:
+            LLM_QUEUE_DEPTH.dec(priority=priority)
+        LLM_WAIT_SECONDS.observe(time.perf_counter() - start, priority=priority)
+
+    def queued(self) -> int:
+        """Calls waiting for a slot or for the budget."""
+        return sum(len(waiters) for users in self._queues.values() for waiters in users.values())
+
+    def release(self, reserved: int = 0, used: int = None):
+        """Frees the slot; with the real usage known, settles the difference against the budget."""
+        self.in_flight -= 1
+        if self.rate and used is not None:
+            self._refill()
+            self.tokens -= used - min(reserved, self.capacity)
+        self._dispatch()
+
+
+dispatcher = LLMDispatcher()
+
+
+def _usage(result) -> int:
+    usage = getattr(result, "usage_metadata", None) or {}
+    return usage.get("total_tokens")
+
+
+async def call_llm(fn, *args, priority: str = "interactive", user: str = "-", on_admit=None, **kwargs):
+    """
+    Runs a blocking LLM call (e.g. chain.invoke) once the dispatcher admits it, through
+    services.call so the provider pool and metrics stay the same. on_admit() is called
+    when the wait in the dispatcher is over.
+    """
+    priority = llm_priority_var.get() or priority
+    tokens = estimate_tokens(args, kwargs)
+    await dispatcher.acquire(priority, user, tokens)
+    if on_admit is not None:
+        on_admit()
+    result = None
+    try:
+        result = await call("groq", fn, *args, **kwargs)
+        return result
+    finally:
+        dispatcher.release(tokens, _usage(result))
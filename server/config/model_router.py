@@ -0,0 +1,202 @@
+"""
+Latency-aware model routing for LLM calls, with hedging and fallback.
+
+`generate()` runs a prompt on the first of a list of candidate models and returns the
+first answer:
+
+  - simple turns (condensing a question, short lookup-style questions) prefer
+    LLM_FAST_MODEL, everything else LLM_MODEL; the other model and LLM_FALLBACK_MODELS
+    follow as backups
+  - models failing more than LLM_MAX_ERROR_RATE of their recent calls move to the back
+  - a call still running after the model's rolling p95 latency is hedged: the next
+    candidate starts too and whichever answers first wins
+  - a call that errors falls through to the next candidate at once
+
+Latency and errors are tracked per model over the last LLM_STATS_WINDOW_SECONDS. Every
+attempt still goes through the LLM dispatcher, so hedges and fallbacks share its
+priorities and token budget. Latency and the hedge clock start once the dispatcher has
+admitted a call, so time spent queued does not make a model look slow, and no hedge is
+started while calls are waiting in the dispatcher (it would only lengthen the queue).
+A losing hedge is left to finish (its thread cannot be interrupted) and only updates
+the statistics; if the caller goes away, every attempt still running is cancelled.
+"""
+import os
+import time
+import asyncio
+from collections import deque
+from typing import Callable, List
+
+from dotenv import load_dotenv
+
+from .services import get_llm, LLM_MODEL, LLM_FAST_MODEL, LLM_FALLBACK_MODELS
+from .llm_dispatcher import call_llm, dispatcher
+from ..metrics import Counter, register
+
+load_dotenv()
+
+MODEL_ROUTING_ENABLED = os.getenv("MODEL_ROUTING_ENABLED", "true").lower() == "true"
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "true").lower() == "true"
+# Hedge delay before a model has LLM_MIN_SAMPLES calls of history, and the floor after
+LLM_HEDGE_DEFAULT_MS = float(os.getenv("LLM_HEDGE_DEFAULT_MS", "5000"))
+LLM_HEDGE_MIN_MS = float(os.getenv("LLM_HEDGE_MIN_MS", "300"))
+LLM_MIN_SAMPLES = 20
+LLM_MAX_ERROR_RATE = float(os.getenv("LLM_MAX_ERROR_RATE", "0.5"))
+LLM_STATS_WINDOW_SECONDS = float(os.getenv("LLM_STATS_WINDOW_SECONDS", "300"))
+
+LLM_CALLS = register(Counter(
+    "medragnosis_llm_calls_total", "LLM attempts by model and outcome (ok, error)."
+))
+LLM_HEDGES = register(Counter(
+    "medragnosis_llm_hedges_total", "Backup LLM calls started because a model was slow, by the slow model."
+))
+
+# Losing hedges run on in the background; kept referenced until they finish
+_background = set()
+
+
+class ModelStats:
+    """Rolling (timestamp, seconds, ok) samples for one model."""
+
+    def __init__(self, window_seconds: float = LLM_STATS_WINDOW_SECONDS, max_samples: int = 500):
+        self.window_seconds = window_seconds
+        self._samples = deque(maxlen=max_samples)
+
+    def record(self, seconds: float, ok: bool):
+        self._samples.append((time.monotonic(), seconds, ok))
+
+    def _recent(self) -> list:
+        cutoff = time.monotonic() - self.window_seconds
+        while self._samples and self._samples[0][0] < cutoff:
+            self._samples.popleft()
+        return list(self._samples)
+
+    def error_rate(self) -> float:
+        recent = self._recent()
+        if len(recent) < LLM_MIN_SAMPLES:
+            return 0.0
+        return sum(1 for _, _, ok in recent if not ok) / len(recent)
+
+    def p95(self):
+        """Seconds, or None without enough successful samples."""
+        latencies = sorted(seconds for _, seconds, ok in self._recent() if ok)
+        if len(latencies) < LLM_MIN_SAMPLES:
+            return None
+        return latencies[min(len(latencies) - 1, int(round(0.95 * (len(latencies) - 1))))]
+
+
+class ModelRouter:
+    def __init__(self, primary: str = LLM_MODEL, fast: str = LLM_FAST_MODEL, fallbacks: List[str] = None,
+                 hedge: bool = LLM_HEDGE_ENABLED, enabled: bool = MODEL_ROUTING_ENABLED):
+        self.primary = primary
+        self.fast = fast or primary
+        self.fallbacks = LLM_FALLBACK_MODELS if fallbacks is None else fallbacks
+        self.hedge = hedge
+        self.enabled = enabled
+        self.stats = {}
+
+    def _stats(self, model: str) -> ModelStats:
+        if model not in self.stats:
+            self.stats[model] = ModelStats()
+        return self.stats[model]
+
+    def candidates(self, simple: bool = False) -> List[str]:
+        if not self.enabled:
+            return [self.primary]
+        preferred = [self.fast, self.primary] if simple else [self.primary, self.fast]
+        models = list(dict.fromkeys(preferred + self.fallbacks))
+        # Stable sort: healthy models keep their order ahead of failing ones
+        return sorted(models, key=lambda m: self._stats(m).error_rate() > LLM_MAX_ERROR_RATE)
+
+    def hedge_delay(self, model: str) -> float:
+        p95 = self._stats(model).p95()
+        if p95 is None:
+            return LLM_HEDGE_DEFAULT_MS / 1000
+        return max(p95, LLM_HEDGE_MIN_MS / 1000)
+
+    async def _attempt(self, attempt: dict, build: Callable, payload, priority: str, user: str):
+        model = attempt["model"]
+
+        def admitted():
+            attempt["admitted_at"] = time.perf_counter()
+            attempt["admitted"].set()
+
+        try:
+            result = await call_llm(build(get_llm(model)).invoke, payload, priority=priority, user=user,
+                                    on_admit=admitted)
+        except Exception:
+            if attempt["admitted_at"] is not None:
+                self._stats(model).record(time.perf_counter() - attempt["admitted_at"], ok=False)
+            LLM_CALLS.inc(model=model, outcome="error")
+            raise
+        self._stats(model).record(time.perf_counter() - attempt["admitted_at"], ok=True)
+        LLM_CALLS.inc(model=model, outcome="ok")
+        return result
+
+    async def generate(self, build: Callable, payload, simple: bool = False,
+                       priority: str = "interactive", user: str = "-"):
+        """
+        build(llm) returns a runnable (e.g. prompt | llm); the result is its .invoke(payload)
+        from the first candidate model that answers. Raises the last error if all fail.
+        """
+        candidates = self.candidates(simple)
+        pending, errors = {}, []  # pending: task -> attempt
+
+        def launch():
+            attempt = {"model": candidates[len(pending) + len(errors)], "admitted": asyncio.Event(),
+                       "admitted_at": None, "hedgeable": True}
+            task = asyncio.ensure_future(self._attempt(attempt, build, payload, priority, user))
+            pending[task] = attempt
+
+        launch()
+        try:
+            while pending:
+                more = len(pending) + len(errors) < len(candidates)
+                timeout, admission = None, None
+                attempt = next(iter(pending.values()))
+                if self.hedge and more and len(pending) == 1 and attempt["hedgeable"]:
+                    if attempt["admitted_at"] is None:
+                        # The hedge clock starts once the dispatcher admits the call
+                        admission = asyncio.ensure_future(attempt["admitted"].wait())
+                    else:
+                        elapsed = time.perf_counter() - attempt["admitted_at"]
+                        timeout = max(0.0, self.hedge_delay(attempt["model"]) - elapsed)
+                waiting = set(pending) | ({admission} if admission else set())
+                done, _ = await asyncio.wait(waiting, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if admission is not None:
+                    admission.cancel()
+                    done.discard(admission)
+                if not done:
+                    if admission is not None:
+                        continue  # admitted: now time the hedge
+                    if dispatcher.queued():
+                        # A hedge would only join the queue; let this attempt run
+                        attempt["hedgeable"] = False
+                        continue
+                    LLM_HEDGES.inc(model=attempt["model"])
+                    launch()
+                    continue
+                for task in done:
+                    del pending[task]
+                    if task.exception() is None:
+                        for loser in pending:
+                            _background.add(loser)
+                            loser.add_done_callback(_discard)
+                        pending.clear()
+                        return task.result()
+                    errors.append(task.exception())
+                if not pending and more:
+                    launch()
+            raise errors[-1]
+        finally:
+            # Only left non-empty when generate itself fails or is cancelled
+            for task in pending:
+                task.cancel()
+
+
+def _discard(task: asyncio.Task):
+    _background.discard(task)
+    if not task.cancelled():
+        task.exception()  # a failed losing hedge is already counted; do not log it as lost
+
+
+router = ModelRouter()
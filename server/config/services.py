@@ -0,0 +1,266 @@
+"""
+Provider registry: the one place that owns the clients for the vector store (Pinecone,
+or the self-hosted quantized index with VECTOR_BACKEND=local), embeddings (OpenAI) and
+the LLM (Groq).
+
+Clients are created on first use (or warmed in the FastAPI lifespan), never at import,
+so importing the app needs no network and the heavy SDKs load only when needed. Each
+provider gets one keep-alive connection pool shared by every code path, and a
+concurrency limit applied through `call()` (LLM calls go through llm_dispatcher.call_llm,
+which adds priorities and a token budget on top).
+"""
+import os
+import time
+import asyncio
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from ..metrics import PROVIDER_IN_FLIGHT, PROVIDER_QUEUE_DEPTH
+
+load_dotenv()
+
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
+PINECONE_ENV = os.getenv("PINECONE_ENV", "us-east-1")
+PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX_NAME", "medragnosis-index")
+# Optional: with the host known, opening the index skips a describe_index round trip
+PINECONE_INDEX_HOST = os.getenv("PINECONE_INDEX_HOST")
+# Index that holds reports recorded before `vector_index` was stored on them; set it to
+# the old name when PINECONE_INDEX_NAME moves to a new index (e.g. a smaller dimension)
+PINECONE_LEGACY_INDEX_NAME = os.getenv("PINECONE_LEGACY_INDEX_NAME", PINECONE_INDEX_NAME)
+# "pinecone" or "local" (server/reports/local_index.py, int8/binary quantized scans)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "pinecone")
+EMBED_MODEL = os.getenv("EMBED_MODEL", "text-embedding-3-small")
+# Below the model's native width, text-embedding-3 models return shortened embeddings
+EMBED_DIMENSION = int(os.getenv("EMBED_DIMENSION", "1536"))
+NATIVE_DIMENSIONS = {"text-embedding-3-small": 1536, "text-embedding-3-large": 3072, "text-embedding-ada-002": 1536}
+LLM_MODEL = os.getenv("LLM_MODEL", "llama-3.3-70b-versatile")
+# Smaller model for simple turns (condensing, direct lookups); see model_router.py
+LLM_FAST_MODEL = os.getenv("LLM_FAST_MODEL", "llama-3.1-8b-instant")
+# Tried in order when the preferred model errors or is slow
+LLM_FALLBACK_MODELS = [m.strip() for m in os.getenv("LLM_FALLBACK_MODELS", "").split(",") if m.strip()]
+
+# Connection pools: idle sockets are kept open this long so TLS sessions get reused
+HTTP_KEEPALIVE_SECONDS = float(os.getenv("HTTP_KEEPALIVE_SECONDS", "60"))
+HTTP_TIMEOUT_SECONDS = float(os.getenv("HTTP_TIMEOUT_SECONDS", "30"))
+
+# Max in-flight calls (and pooled connections) per provider
+PROVIDER_LIMITS = {
+    "openai": int(os.getenv("OPENAI_MAX_CONCURRENCY", "16")),
+    "groq": int(os.getenv("GROQ_MAX_CONCURRENCY", "8")),
+    "pinecone": int(os.getenv("PINECONE_MAX_CONCURRENCY", "16")),
+}
+
+_lock = threading.Lock()
+_executors = {}
+_http_clients = {}
+_pinecone = None
+_indexes = {}
+_embedders = {}
+_llms = {}
+
+
+def _limits(provider: str):
+    import httpx
+    size = PROVIDER_LIMITS[provider]
+    return httpx.Limits(max_connections=size, max_keepalive_connections=size,
+                        keepalive_expiry=HTTP_KEEPALIVE_SECONDS)
+
+
+def get_http_client(provider: str, asynchronous: bool = False):
+    """Pooled httpx client for a provider, shared by every SDK object that talks to it."""
+    key = (provider, asynchronous)
+    if key not in _http_clients:
+        with _lock:
+            if key not in _http_clients:
+                import httpx
+                cls = httpx.AsyncClient if asynchronous else httpx.Client
+                _http_clients[key] = cls(limits=_limits(provider), timeout=HTTP_TIMEOUT_SECONDS)
+    return _http_clients[key]
+
+
+def get_pinecone():
+    global _pinecone
+    if _pinecone is None:
+        with _lock:
+            if _pinecone is None:
+                from pinecone import Pinecone
+                _pinecone = Pinecone(
+                    api_key=PINECONE_API_KEY,
+                    timeout=HTTP_TIMEOUT_SECONDS,
+                    connection_pool_maxsize=PROVIDER_LIMITS["pinecone"],
+                )
+    return _pinecone
+
+
+def get_index(name: str = None):
+    """
+    Handle to a vector index (default: PINECONE_INDEX_NAME). Does not create Pinecone
+    indexes; run provision_index.py once per environment.
+    """
+    name = name or PINECONE_INDEX_NAME
+    if name not in _indexes:
+        if VECTOR_BACKEND == "local":
+            from ..reports.local_index import open_index
+            with _lock:
+                if name not in _indexes:
+                    _indexes[name] = open_index(name)
+            return _indexes[name]
+        pc = get_pinecone()
+        with _lock:
+            if name not in _indexes:
+                if PINECONE_INDEX_HOST and name == PINECONE_INDEX_NAME:
+                    _indexes[name] = pc.Index(host=PINECONE_INDEX_HOST)
+                else:
+                    _indexes[name] = pc.Index(name)
+    return _indexes[name]
+
+
+def index_name_for(report: dict) -> str:
+    """The index holding a `reports` record's vectors."""
+    return report.get("vector_index") or PINECONE_LEGACY_INDEX_NAME
+
+
+def _output_dimensions(model: str, dimensions: int = None):
+    """The `dimensions` argument for the embeddings API: None for the model's native width."""
+    return dimensions if dimensions and dimensions != NATIVE_DIMENSIONS.get(model) else None
+
+
+def get_embed_model(model: str = EMBED_MODEL, dimensions: int = EMBED_DIMENSION):
+    """
+    One embeddings client per model name and output width (reports keep the model and
+    dimension they were indexed with; None is the model's native width).
+    """
+    key = (model, _output_dimensions(model, dimensions))
+    if key not in _embedders:
+        http_client = get_http_client("openai")
+        http_async_client = get_http_client("openai", asynchronous=True)
+        with _lock:
+            if key not in _embedders:
+                from langchain_openai import OpenAIEmbeddings
+                _embedders[key] = OpenAIEmbeddings(
+                    model=model, dimensions=key[1], api_key=OPENAI_API_KEY,
+                    http_client=http_client, http_async_client=http_async_client,
+                )
+    return _embedders[key]
+
+
+def get_llm(model: str = LLM_MODEL):
+    """One chat client per model name."""
+    if model not in _llms:
+        http_client = get_http_client("groq")
+        http_async_client = get_http_client("groq", asynchronous=True)
+        with _lock:
+            if model not in _llms:
+                from langchain_groq import ChatGroq
+                _llms[model] = ChatGroq(
+                    temperature=0, model_name=model, groq_api_key=GROQ_API_KEY,
+                    http_client=http_client, http_async_client=http_async_client,
+                )
+    return _llms[model]
+
+
+def _executor(provider: str) -> ThreadPoolExecutor:
+    if provider not in _executors:
+        with _lock:
+            if provider not in _executors:
+                _executors[provider] = ThreadPoolExecutor(
+                    max_workers=PROVIDER_LIMITS[provider], thread_name_prefix=f"{provider}-call"
+                )
+    return _executors[provider]
+
+
+async def call(provider: str, fn, *args, **kwargs):
+    """
+    Runs a blocking SDK call on the provider's own thread pool, sized to its concurrency
+    limit: bursts queue here instead of opening more connections, and a slow provider
+    cannot occupy the threads other providers (or asyncio.to_thread) need.
+    """
+    def run():
+        PROVIDER_QUEUE_DEPTH.dec(provider=provider)
+        PROVIDER_IN_FLIGHT.inc(provider=provider)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            PROVIDER_IN_FLIGHT.dec(provider=provider)
+
+    PROVIDER_QUEUE_DEPTH.inc(provider=provider)
+    future = _executor(provider).submit(contextvars.copy_context().run, run)
+    try:
+        return await asyncio.wrap_future(future)
+    except asyncio.CancelledError:
+        if future.cancel():  # never started, so run() did not leave the queue
+            PROVIDER_QUEUE_DEPTH.dec(provider=provider)
+        raise
+
+
+def use_clients(index=None, embed_model=None, llm=None, llms=None):
+    """
+    Installs pre-built clients in place of the real ones (e.g. the offline fakes in benchmarks/).
+    `llm` serves every configured model; `llms` maps model names to their own clients.
+    """
+    with _lock:
+        if index is not None:
+            _indexes[PINECONE_INDEX_NAME] = index
+        if embed_model is not None:
+            _embedders[(EMBED_MODEL, _output_dimensions(EMBED_MODEL, EMBED_DIMENSION))] = embed_model
+        if llm is not None:
+            for model in {LLM_MODEL, LLM_FAST_MODEL, *LLM_FALLBACK_MODELS}:
+                _llms[model] = llm
+        _llms.update(llms or {})
+
+
+def warm_up():
+    """Builds every client up front, e.g. from the FastAPI lifespan on a long-running server."""
+    get_index()
+    get_embed_model()
+    get_llm()
+
+
+def provision_index(metric: str = "dotproduct", poll_interval: float = 1.0):
+    """Creates the Pinecone index if it is missing and waits until it is ready."""
+    if VECTOR_BACKEND == "local":
+        # The local index is a file created on first use
+        return False
+    from pinecone import ServerlessSpec
+
+    pc = get_pinecone()
+    existing_indexes = [i["name"] for i in pc.list_indexes()]
+    if PINECONE_INDEX_NAME in existing_indexes:
+        return False
+
+    spec = ServerlessSpec(cloud="aws", region=PINECONE_ENV)
+    pc.create_index(name=PINECONE_INDEX_NAME, dimension=EMBED_DIMENSION, metric=metric, spec=spec)
+    while not pc.describe_index(PINECONE_INDEX_NAME).status["ready"]:
+        time.sleep(poll_interval)
+    return True
+
+
+async def aclose():
+    """
+    Closes every pooled connection, stops the provider thread pools and drops the clients
+    (FastAPI lifespan shutdown).
+    """
+    global _pinecone
+    with _lock:
+        clients = dict(_http_clients)
+        _http_clients.clear()
+        executors = list(_executors.values())
+        _executors.clear()
+        pinecone_client = _pinecone
+        _pinecone = None
+        _indexes.clear()
+        _llms.clear()
+        _embedders.clear()
+
+    for (provider, asynchronous), client in clients.items():
+        if asynchronous:
+            await client.aclose()
+        else:
+            client.close()
+    if pinecone_client is not None and hasattr(pinecone_client, "close"):
+        pinecone_client.close()
+    for executor in executors:
+        executor.shutdown(wait=False)
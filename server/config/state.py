@@ -0,0 +1,148 @@
+"""
+Shared state for multi-worker deployments: caches, locks, counters and job queues that
+every worker (and replica) must agree on.
+
+STATE_BACKEND selects the store:
+
+  memory  per-process dicts (the default, and the stand-in used by tests and benchmarks);
+          correct for a single worker only
+  redis   a Redis server at STATE_URL (`pip install redis`), shared by all workers
+
+Callers use the subset of the redis-py client API below, so a `redis.Redis` is used as
+is and MemoryState mirrors its semantics (values come back as bytes, `ex` is seconds).
+"""
+import os
+import time
+import threading
+from collections import deque
+from typing import List, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+STATE_BACKEND = os.getenv("STATE_BACKEND", "memory")
+STATE_URL = os.getenv("STATE_URL", "redis://localhost:6379/0")
+# Prefixed to every key, so deployments can share one Redis
+STATE_PREFIX = os.getenv("STATE_PREFIX", "medragnosis:")
+
+_lock = threading.Lock()
+_state = None
+
+
+def _bytes(value) -> bytes:
+    if isinstance(value, bytes):
+        return value
+    return str(value).encode()
+
+
+class MemoryState:
+    """In-process implementation of the redis-py subset used by the app."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}   # key -> value (bytes, or a deque for lists)
+        self._expires = {}  # key -> monotonic deadline
+        self._writes = 0
+
+    def _sweep(self):
+        # Keys that expire without being read again would otherwise stay forever
+        self._writes += 1
+        if self._writes % 1000 == 0:
+            for key in [k for k, deadline in self._expires.items() if deadline <= time.monotonic()]:
+                self._live(key)
+
+    def _live(self, key: str) -> bool:
+        deadline = self._expires.get(key)
+        if deadline is not None and deadline <= time.monotonic():
+            self._values.pop(key, None)
+            self._expires.pop(key, None)
+        return key in self._values
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            return self._values[key] if self._live(key) else None
+
+    def mget(self, keys: List[str]) -> List[Optional[bytes]]:
+        with self._lock:
+            return [self._values[k] if self._live(k) else None for k in keys]
+
+    def set(self, key: str, value, ex: float = None, nx: bool = False) -> Optional[bool]:
+        with self._lock:
+            if nx and self._live(key):
+                return None
+            self._sweep()
+            self._values[key] = _bytes(value)
+            if ex:
+                self._expires[key] = time.monotonic() + ex
+            else:
+                self._expires.pop(key, None)
+            return True
+
+    def delete(self, *keys: str) -> int:
+        with self._lock:
+            deleted = 0
+            for key in keys:
+                deleted += self._live(key)
+                self._values.pop(key, None)
+                self._expires.pop(key, None)
+            return deleted
+
+    def expire(self, key: str, seconds: float) -> bool:
+        with self._lock:
+            if not self._live(key):
+                return False
+            self._expires[key] = time.monotonic() + seconds
+            return True
+
+    def incrby(self, key: str, amount: int = 1) -> int:
+        with self._lock:
+            value = int(self._values[key]) + amount if self._live(key) else amount
+            self._values[key] = _bytes(value)
+            return value
+
+    def decrby(self, key: str, amount: int = 1) -> int:
+        return self.incrby(key, -amount)
+
+    def lpush(self, key: str, *values) -> int:
+        with self._lock:
+            items = self._values[key] if self._live(key) else deque()
+            for value in values:
+                items.appendleft(_bytes(value))
+            self._values[key] = items
+            return len(items)
+
+    def rpop(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            if not self._live(key) or not self._values[key]:
+                return None
+            return self._values[key].pop()
+
+    def llen(self, key: str) -> int:
+        with self._lock:
+            return len(self._values[key]) if self._live(key) else 0
+
+
+def get_state():
+    """The process-wide shared-state client (created on first use)."""
+    global _state
+    if _state is None:
+        with _lock:
+            if _state is None:
+                if STATE_BACKEND == "redis":
+                    import redis
+                    _state = redis.Redis.from_url(STATE_URL, socket_timeout=5)
+                else:
+                    _state = MemoryState()
+    return _state
+
+
+def use_state(state):
+    """Installs a state client in place of the configured one (e.g. a fresh MemoryState in tests)."""
+    global _state
+    with _lock:
+        _state = state
+
+
+def key(*parts) -> str:
+    return STATE_PREFIX + ":".join(str(p) for p in parts)
@@ -0,0 +1,139 @@
+"""
+Single-flight coalescing for the diagnosis endpoints.
+
+Duplicate concurrent requests (a client retry, a double-click) share one run of the
+pipeline: the first starts it, identical requests arriving while it is in flight attach
+to it and get its result, so the LLM calls are made and the record is inserted once.
+Within a worker they await the same task; across workers the first takes a lock in the
+shared state (config/state.py) and the others wait for the result it publishes there.
+
+With an Idempotency-Key header the finished response is also kept in the shared state
+for IDEMPOTENCY_TTL_SECONDS, so a client retrying after a dropped connection gets the
+original answer instead of a new run, whichever worker it reaches. Failed runs are not
+kept; a retry runs again.
+"""
+import os
+import json
+import uuid
+import asyncio
+import hashlib
+from typing import Awaitable, Callable, Optional
+
+from dotenv import load_dotenv
+
+from ..config.state import get_state, key
+from ..metrics import Counter, register
+
+load_dotenv()
+
+COALESCE_ENABLED = os.getenv("COALESCE_ENABLED", "true").lower() == "true"
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "600"))
+# Longer than any pipeline run; a worker that dies mid-run frees the lock after this
+COALESCE_LOCK_SECONDS = 120
+COALESCE_POLL_SECONDS = 0.1
+
+COALESCED_REQUESTS = register(Counter(
+    "medragnosis_coalesced_requests_total",
+    "Requests served by another request's run (outcome: attached in this worker, attached_remote "
+    "to another worker's run, or replayed by idempotency key)."
+))
+
+_inflight = {}
+
+
+class IdempotencyConflict(Exception):
+    """An Idempotency-Key was reused for a different request."""
+
+
+def request_key(*parts) -> str:
+    """Stable hash of JSON-serialisable parts, e.g. (user, doc_id, messages)."""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _replay(idempotency_key: str, fingerprint: str):
+    stored = get_state().get(key("idempotency", idempotency_key))
+    if stored is None:
+        return None
+    entry = json.loads(stored)
+    if entry["fingerprint"] != fingerprint:
+        raise IdempotencyConflict("Idempotency-Key was already used for a different request")
+    return entry["response"]
+
+
+def _remember(idempotency_key: str, fingerprint: str, response):
+    get_state().set(key("idempotency", idempotency_key),
+                    json.dumps({"fingerprint": fingerprint, "response": response}), ex=IDEMPOTENCY_TTL_SECONDS)
+
+
+async def _await_remote(fingerprint: str, run_id: bytes):
+    """The response of another worker's run, or None if that run ended without one."""
+    state = get_state()
+    lock, result = key("coalesce", "lock", fingerprint), key("coalesce", "result", fingerprint, run_id.decode())
+    for _ in range(int(COALESCE_LOCK_SECONDS / COALESCE_POLL_SECONDS)):
+        published = await asyncio.to_thread(state.get, result)
+        if published is not None:
+            return json.loads(published)
+        if await asyncio.to_thread(state.get, lock) != run_id:
+            # Finished (check once more for its result) or failed
+            published = await asyncio.to_thread(state.get, result)
+            return json.loads(published) if published is not None else None
+        await asyncio.sleep(COALESCE_POLL_SECONDS)
+    return None
+
+
+async def _run_shared(fingerprint: str, fn: Callable[[], Awaitable]):
+    """Runs fn unless another worker is running the same request; then takes its result."""
+    state = get_state()
+    lock = key("coalesce", "lock", fingerprint)
+    run_id = uuid.uuid4().hex
+    while not await asyncio.to_thread(state.set, lock, run_id, ex=COALESCE_LOCK_SECONDS, nx=True):
+        other = await asyncio.to_thread(state.get, lock)
+        if other is None:
+            continue  # released between the two calls
+        response = await _await_remote(fingerprint, other)
+        if response is not None:
+            COALESCED_REQUESTS.inc(outcome="attached_remote")
+            return response
+    try:
+        response = await fn()
+        # Only waiters of this run read it, so it need not outlive them
+        await asyncio.to_thread(state.set, key("coalesce", "result", fingerprint, run_id),
+                                json.dumps(response), ex=COALESCE_LOCK_SECONDS)
+        return response
+    finally:
+        await asyncio.to_thread(state.delete, lock)
+
+
+def _forget(fingerprint: str, task: asyncio.Task):
+    if _inflight.get(fingerprint) is task:
+        del _inflight[fingerprint]
+    if not task.cancelled():
+        task.exception()  # retrieved here so an unawaited failure is not logged as lost
+
+
+async def run_once(fingerprint: str, fn: Callable[[], Awaitable], idempotency_key: Optional[str] = None):
+    """
+    Awaits fn(), or the run already in flight for the same fingerprint. The run is shielded,
+    so a caller that disconnects does not cancel it for the others.
+    idempotency_key must already be scoped to the user (see request_key).
+    """
+    if not COALESCE_ENABLED:
+        return await fn()
+
+    if idempotency_key:
+        response = await asyncio.to_thread(_replay, idempotency_key, fingerprint)
+        if response is not None:
+            COALESCED_REQUESTS.inc(outcome="replayed")
+            return response
+
+    task = _inflight.get(fingerprint)
+    if task is None:
+        task = _inflight[fingerprint] = asyncio.ensure_future(_run_shared(fingerprint, fn))
+        task.add_done_callback(lambda t: _forget(fingerprint, t))
+    else:
+        COALESCED_REQUESTS.inc(outcome="attached")
+
+    response = await asyncio.shield(task)
+    if idempotency_key:
+        await asyncio.to_thread(_remember, idempotency_key, fingerprint, response)
+    return response
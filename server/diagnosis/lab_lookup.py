@@ -0,0 +1,137 @@
+import re
+from typing import List, Optional
+
+from ..reports.lab_extraction import normalize_test_name
+
+# Questions that need reasoning or guideline tables go to the RAG chain
+_NEEDS_LLM = re.compile(
+    r"\b(why|explain|mean|means|cause|should|recommend|advice|diet|treat|risk|compare|trend|"
+    r"optimal|desirable|borderline|target|summar\w*|interpret)\b",
+    re.IGNORECASE,
+)
+_STATUS_WORDS = re.compile(r"\b(normal|abnormal|high|low|elevated|within|range|out of range)\b", re.IGNORECASE)
+_ABNORMAL_ANY = re.compile(r"\b(any|which|all)\b.*\b(abnormal|out of range|high|low|elevated)\b", re.IGNORECASE)
+# "Summarize this", "anything abnormal?": answered from the report digest when there is one
+SUMMARY_QUESTION = re.compile(
+    r"\b(summar\w*|overview|gist|key (findings|points)|main (findings|points)|"
+    r"anything (abnormal|wrong|unusual|concerning|out of range)|"
+    r"what does (this|the|my) (report|test|result)s? (say|show))\b",
+    re.IGNORECASE,
+)
+
+# Words that do not identify a test on their own ("total cholesterol" vs "cholesterol")
+_GENERIC = {"total", "serum", "blood", "plasma", "fasting", "random", "level", "count", "cholesterol", "ratio"}
+
+_FLAG_TEXT = {"high": "above the reference range", "low": "below the reference range",
+              "normal": "within the reference range"}
+
+
+def _words(text: str) -> List[str]:
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+
+def match_tests(question: str, tests: List[str]) -> List[str]:
+    """
+    Returns the test keys named in the question. Full names win ("hdl/ldl ratio"),
+    then names whose every word appears ("HDL to LDL ratio"), otherwise a
+    distinctive leading word ("ldl" -> "ldl cholesterol").
+    """
+    normalized = f" {normalize_test_name(question)} "
+    found = []
+    for test in sorted(tests, key=len, reverse=True):
+        if f" {test} " in normalized or f" {test}?" in normalized:
+            found.append(test)
+            normalized = normalized.replace(test, " ")
+    if found:
+        return found
+
+    q_words = set(_words(question))
+    covered = [t for t in tests if _words(t) and set(_words(t)) <= q_words]
+    if covered:
+        # "hdl/ldl ratio" covers the words of "hdl" and "ldl" on their own
+        return [t for t in covered
+                if not any(o != t and set(_words(t)) < set(_words(o)) for o in covered)]
+
+    by_head = {}
+    for test in tests:
+        words = _words(test)
+        if words and words[0] not in _GENERIC and words[0] in q_words:
+            by_head.setdefault(words[0], []).append(test)
+    return [min(candidates, key=len) for candidates in by_head.values()]
+
+
+def _describe(row: dict) -> str:
+    unit = f" {row['unit']}" if row.get("unit") else ""
+    text = f"{row['name']} is {row['value']:g}{unit}"
+    low, high = row.get("ref_low"), row.get("ref_high")
+    if low is not None and high is not None:
+        text += f" (reference range {low:g} - {high:g}{unit})"
+    elif high is not None:
+        text += f" (reference < {high:g}{unit})"
+    elif low is not None:
+        text += f" (reference > {low:g}{unit})"
+    if row.get("flag"):
+        text += f", which is {_FLAG_TEXT[row['flag']]}"
+    return text
+
+
+def _cite(row: dict) -> str:
+    page = f" (Page {row['page']})" if row.get("page") is not None else ""
+    return f"{row.get('source', 'the report')}{page}"
+
+
+def answer_lab_question(question: str, rows: List[dict]) -> Optional[dict]:
+    """
+    Answers direct value/status lookups from structured lab rows.
+    Returns None when the question needs the RAG chain.
+    """
+    if not rows or _NEEDS_LLM.search(question):
+        return None
+
+    by_test = {row["test"]: row for row in rows}
+    tests = match_tests(question, list(by_test))
+
+    if not tests:
+        if not _ABNORMAL_ANY.search(question) or not any(r.get("flag") for r in rows):
+            return None
+        flagged = [r for r in rows if r.get("flag") in ("high", "low")]
+        if not flagged:
+            answer = "All results with a reference range in this report are within range."
+        else:
+            lines = [f"- {_describe(r)}." for r in flagged]
+            answer = f"According to {_cite(flagged[0])}, these results are outside the reference range:\n" + "\n".join(lines)
+        matched = flagged or rows
+    else:
+        matched = [by_test[t] for t in tests]
+        if _STATUS_WORDS.search(question) and not any(r.get("flag") for r in matched):
+            return None
+        answer = " ".join(f"According to {_cite(r)}, {_describe(r)}." for r in matched)
+
+    contexts = [_describe(r) for r in matched]
+    sources = sorted({r.get("source") for r in matched if r.get("source")})
+    return {"diagnosis": answer, "sources": sources, "contexts": contexts, "fast_path": "lab_results"}
+
+
+def answer_from_digest(question: str, digest: Optional[dict]) -> Optional[dict]:
+    """
+    Answers summary questions from a report's precomputed digest.
+    Returns None for other questions, or when the digest has nothing to say.
+    """
+    if not digest or not SUMMARY_QUESTION.search(question):
+        return None
+    if not digest.get("findings") and not digest.get("num_lab_results"):
+        return None
+
+    parts = []
+    if digest.get("findings"):
+        parts.append(f"Key findings from {', '.join(digest.get('sources', [])) or 'the report'}:\n{digest['findings']}")
+    abnormal = digest.get("abnormal", [])
+    if abnormal:
+        lines = [f"- {_describe(r)} ({_cite(r)})." for r in abnormal]
+        parts.append("Results outside the reference range:\n" + "\n".join(lines))
+    elif digest.get("num_lab_results"):
+        parts.append("All results with a reference range in this report are within range.")
+
+    contexts = ([digest["findings"]] if digest.get("findings") else []) + [_describe(r) for r in abnormal]
+    return {"diagnosis": "\n\n".join(parts), "sources": list(digest.get("sources", [])),
+            "contexts": contexts, "fast_path": "digest"}
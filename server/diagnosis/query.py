@@ -1,40 +1,29 @@
 import os
+import re
 import asyncio
+import logging
+from datetime import datetime
 from dotenv import load_dotenv
-from pinecone import Pinecone
-from langchain_openai import OpenAIEmbeddings
-from langchain_groq import ChatGroq
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
-from langchain_core.output_parsers import StrOutputParser
+from ..config.db import lab_results_collection, reports_collection, digests_collection
+from ..config.services import get_index, get_embed_model, get_llm, call, index_name_for, EMBED_MODEL
+from ..config.model_router import router
+from ..reports.chunk_store import hydrate
+from .lab_lookup import answer_lab_question, answer_from_digest, SUMMARY_QUESTION
+from .trends import compute_trends, select_trends, format_trend_summary
+from .rerank import RERANK_ENABLED, RERANK_CANDIDATES, CONTEXT_TOKEN_BUDGET, select_passages
+from ..metrics import span
 
 load_dotenv()
 
-PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
-PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX_NAME", "medragnosis")
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+logger = logging.getLogger("MedRagnosis.query")
 
-os.environ["OPENAI_API_KEY"] = OPENAI_API_KEY
-
-pc = Pinecone(api_key=PINECONE_API_KEY)
-index = pc.Index(PINECONE_INDEX_NAME)
-
-embed_model = OpenAIEmbeddings(model="text-embedding-3-small", api_key=OPENAI_API_KEY)
-llm = ChatGroq(temperature=0, model_name="llama-3.3-70b-versatile", groq_api_key=GROQ_API_KEY)
+LAB_FAST_PATH_ENABLED = os.getenv("LAB_FAST_PATH_ENABLED", "true").lower() == "true"
+# Answer first-turn "summarize this report" questions from the report digest (reports/digest.py)
+DIGEST_ANSWERS_ENABLED = os.getenv("DIGEST_ANSWERS_ENABLED", "true").lower() == "true"
 
 # 1. Chain to Rephrase Follow-up Questions 
 condense_q_system = """Given a chat history and the latest user question which might reference context in the chat history, formulate a standalone question which can be understood without the chat history. Do NOT answer the question, just reformulate it if needed and otherwise return it as is."""
 
-condense_q_prompt = ChatPromptTemplate.from_messages(
-    [
-        ("system", condense_q_system),
-        MessagesPlaceholder(variable_name="chat_history"),
-        ("human", "{question}"),
-    ]
-)
-condense_q_chain = condense_q_prompt | llm | StrOutputParser()
-
 #  2. Chain to Answer Questions using RAG 
 qa_system = """You are a medical assistant AI called MedRagnosis. 
 Use the following pieces of retrieved context to answer the question.
@@ -47,27 +36,127 @@ Context:
 {context}
 """
 
-qa_prompt = ChatPromptTemplate.from_messages(
-    [
-        ("system", qa_system),
-        MessagesPlaceholder(variable_name="chat_history"),
-        ("human", "{question}"),
-    ]
+
+# Chains are composed per call (cheap) so importing the app loads neither langchain nor the
+# LLM client, and they always use the registry's current client.
+def _chat_prompt(system: str):
+    from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+    return ChatPromptTemplate.from_messages(
+        [
+            ("system", system),
+            MessagesPlaceholder(variable_name="chat_history"),
+            ("human", "{question}"),
+        ]
+    )
+
+
+def get_condense_chain(llm=None):
+    from langchain_core.output_parsers import StrOutputParser
+    return _chat_prompt(condense_q_system) | (llm or get_llm()) | StrOutputParser()
+
+
+def get_rag_chain(llm=None):
+    return _chat_prompt(qa_system) | (llm or get_llm())
+
+
+# Questions asking for one value, date or name rather than an interpretation
+LOOKUP_QUESTION = re.compile(
+    r"^\s*(what|what's|whats|when|who|which|where|how (much|many|high|low))\b.*\b"
+    r"(is|was|are|were|did|does|my|the)\b", re.IGNORECASE
 )
-rag_chain = qa_prompt | llm
+INTERPRETIVE_WORDS = re.compile(r"\b(why|explain|should|risk|trend|compare|recommend|mean|worr)", re.IGNORECASE)
+
+
+def is_simple_turn(question: str, chat_history: list) -> bool:
+    """Short lookup-style questions with little history go to the fast model."""
+    return (
+        len(chat_history) <= 2
+        and len(question.split()) <= 20
+        and bool(LOOKUP_QUESTION.search(question))
+        and not INTERPRETIVE_WORDS.search(question)
+    )
+
+
+def _vector_scope(doc_id: str):
+    """
+    Pinecone filter, embedder and index for a report's live vectors. While a report is being
+    re-embedded both versions exist; queries follow the `reports` record.
+    """
+    reports = list(reports_collection.find(
+        {"doc_id": doc_id}, {"index_version": 1, "embed_model": 1, "embed_dimension": 1, "vector_index": 1}
+    ))
+    versions = {r.get("index_version") for r in reports}
+
+    vector_filter = {"doc_id": doc_id}
+    if reports and None not in versions:
+        vector_filter["index_version"] = {"$in": sorted(versions)}
+
+    if not reports:
+        return vector_filter, get_embed_model(), get_index()
+    # Query embeddings must come from the model (and width) the report was indexed with
+    report = reports[0]
+    embedder = get_embed_model(report.get("embed_model") or EMBED_MODEL, report.get("embed_dimension"))
+    return vector_filter, embedder, get_index(index_name_for(report))
+
+
+def _uploader_scopes(username: str) -> list:
+    """
+    (Pinecone filter, embedder, index) for each group of an uploader's reports that share an
+    index, embedding model and index version, so every report is searched where (and as) it
+    was indexed, and one that is being re-embedded is not retrieved twice (see _vector_scope).
+    """
+    reports = list(reports_collection.find(
+        {"uploader": username},
+        {"doc_id": 1, "index_version": 1, "embed_model": 1, "embed_dimension": 1, "vector_index": 1}
+    ))
+    if not reports:
+        return [({"uploader": username}, get_embed_model(), get_index())]
+    groups = {}
+    for report in reports:
+        group = (index_name_for(report), report.get("embed_model") or EMBED_MODEL,
+                 report.get("embed_dimension"), report.get("index_version"))
+        groups.setdefault(group, set()).add(report["doc_id"])
+    scopes = []
+    for (index_name, model, dimension, version), doc_ids in groups.items():
+        vector_filter = {"uploader": username, "doc_id": {"$in": sorted(doc_ids)}}
+        if version is not None:
+            vector_filter["index_version"] = version
+        scopes.append((vector_filter, get_embed_model(model, dimension), get_index(index_name)))
+    return scopes
 
 
 async def chat_diagnosis_report(user: str, doc_id: str, messages: list):
     """
     Handles a full chat conversation.
+    0. Answers direct lab-value lookups from the structured lab_results table, and
+       first-turn summary questions from the report's precomputed digest.
     1. Rephrases the latest question based on history.
     2. Retrieves context using the rephrased question.
     3. Generates an answer using the original question + history + context.
     """
     # Extract the latest question
     latest_question = messages[-1].content
+
+    # 0. Fast path: "What is the total cholesterol?" needs no LLM call
+    if LAB_FAST_PATH_ENABLED:
+        with span("lab_lookup"):
+            rows = await asyncio.to_thread(
+                lambda: list(lab_results_collection.find({"doc_id": doc_id}, {"_id": 0}))
+            )
+        fast = answer_lab_question(latest_question, rows)
+        if fast:
+            return fast
+
+    # "Summarize this report" was answered once, at ingest; follow-ups need the history
+    if DIGEST_ANSWERS_ENABLED and len(messages) == 1 and SUMMARY_QUESTION.search(latest_question):
+        with span("digest_lookup"):
+            digest = await asyncio.to_thread(digests_collection.find_one, {"doc_id": doc_id}, {"_id": 0})
+        fast = answer_from_digest(latest_question, digest)
+        if fast:
+            return fast
     
     # Convert incoming messages to LangChain format for history
+    from langchain_core.messages import HumanMessage, AIMessage
     chat_history = []
     for msg in messages[:-1]:
         if msg.role == "user":
@@ -77,28 +166,42 @@ async def chat_diagnosis_report(user: str, doc_id: str, messages: list):
 
     # 1. Condense Question (if there is history)
     if chat_history:
-        standalone_question = await asyncio.to_thread(
-            condense_q_chain.invoke, 
-            {"chat_history": chat_history, "question": latest_question}
-        )
-        print(f"Rephrased Query: {standalone_question}")
+        with span("condense"):
+            standalone_question = await router.generate(
+                get_condense_chain, 
+                {"chat_history": chat_history, "question": latest_question},
+                simple=True, priority="interactive", user=user
+            )
+        logger.info(f"Rephrased Query: {standalone_question}")
     else:
         standalone_question = latest_question
 
     # 2. Retrieve Context (Using standalone question)
-    embedding = await asyncio.to_thread(embed_model.embed_query, standalone_question)
+    with span("vector_scope"):
+        vector_filter, embedder, index = await asyncio.to_thread(_vector_scope, doc_id)
+    with span("embed"):
+        embedding = await call("openai", embedder.embed_query, standalone_question)
     
-    results = await asyncio.to_thread(
-        index.query,
-        vector=embedding,
-        top_k=5,
-        include_metadata=True,
-        filter={"doc_id": doc_id} 
-    )
+    # Over-fetch when reranking so the local reranker has candidates to choose from
+    with span("vector_query"):
+        results = await call(
+            "pinecone", index.query,
+            vector=embedding,
+            top_k=RERANK_CANDIDATES if RERANK_ENABLED else 5,
+            include_metadata=True,
+            filter=vector_filter
+        )
+    with span("hydrate"):
+        matches = await asyncio.to_thread(hydrate, results.get("matches", []))
+
+    if RERANK_ENABLED:
+        with span("rerank"):
+            passages = await asyncio.to_thread(select_passages, standalone_question, matches)
+        matches = [{"metadata": {**p["metadata"], "text": p["text"]}} for p in passages]
 
     contexts = []
     sources_set = set()
-    for match in results.get("matches", []):
+    for match in matches:
         md = match.get("metadata", {})
         text_snippet = md.get("text") or ""
         contexts.append(text_snippet)
@@ -110,36 +213,89 @@ async def chat_diagnosis_report(user: str, doc_id: str, messages: list):
     context_text = "\n\n".join(contexts)
 
     # 3. Generate Answer
-    final = await asyncio.to_thread(
-        rag_chain.invoke,
-        {
-            "context": context_text,
-            "chat_history": chat_history,
-            "question": latest_question
-        }
-    )
+    with span("llm_generate"):
+        final = await router.generate(
+            get_rag_chain,
+            {
+                "context": context_text,
+                "chat_history": chat_history,
+                "question": latest_question
+            },
+            simple=is_simple_turn(latest_question, chat_history), priority="interactive", user=user
+        )
 
     return {"diagnosis": final.content, "sources": list(sources_set), "contexts": contexts}
 
 async def longitudinal_analysis(username: str, question: str):
     """
-    Searches across ALL reports belonging to a user to find trends.
+    Analyzes trends across ALL reports belonging to a user.
+    Uses the structured lab history when available (constant-size prompt),
+    otherwise falls back to retrieving text excerpts.
+    """
+    # 1. Trend engine over extracted lab values
+    with span("lab_lookup"):
+        rows = await asyncio.to_thread(
+            lambda: list(lab_results_collection.find(
+                {"uploader": username},
+                {"_id": 0, "test": 1, "name": 1, "value": 1, "unit": 1, "ref_low": 1, "ref_high": 1,
+                 "report_date": 1, "source": 1}
+            ))
+        )
+    with span("trend_compute"):
+        trends = compute_trends(rows)
+
+    if trends:
+        tests = select_trends(trends, question)
+        summary = format_trend_summary(trends, tests)
+        trend_prompt = f"""
+    You are a medical analyst. Below is a computed summary of the patient's lab results over time
+    (values, changes, slopes and out-of-range flags across all of their reports).
+    Identify trends, changes in values, or recurring issues, citing the dates given.
+
+    Trend Summary:
+    {summary}
+
+    User Question: {question}
     """
-    embedding = await asyncio.to_thread(embed_model.embed_query, question)
+        with span("llm_generate"):
+            final = await router.generate(lambda llm: llm, trend_prompt, priority="longitudinal", user=username)
+        sources = sorted({src for t in tests for src in trends[t]["sources"]})
+        return {"diagnosis": final.content, "sources": sources, "contexts": [summary]}
+
+    # 2. Fallback: reports without structured values
+    with span("vector_scope"):
+        scopes = await asyncio.to_thread(_uploader_scopes, username)
+    # One query embedding per embedding model in use
+    embedders = list({id(embedder): embedder for _, embedder, _ in scopes}.values())
+    with span("embed"):
+        vectors = await asyncio.gather(*(call("openai", e.embed_query, question) for e in embedders))
+    embeddings = {id(e): vector for e, vector in zip(embedders, vectors)}
     
     # Filter by 'uploader' instead of 'doc_id'
-    results = await asyncio.to_thread(
-        index.query,
-        vector=embedding,
-        top_k=10,  
-        include_metadata=True,
-        filter={"uploader": username} 
-    )
+    top_k = RERANK_CANDIDATES * 2 if RERANK_ENABLED else 10
+    with span("vector_query"):
+        responses = await asyncio.gather(*(
+            call("pinecone", index.query, vector=embeddings[id(embedder)], top_k=top_k,
+                 include_metadata=True, filter=vector_filter)
+            for vector_filter, embedder, index in scopes
+        ))
+    ranked = sorted((m for r in responses for m in r.get("matches", [])),
+                    key=lambda m: m.get("score", 0), reverse=True)[:top_k]
+    with span("hydrate"):
+        matches = await asyncio.to_thread(hydrate, ranked)
+
+    if RERANK_ENABLED:
+        with span("rerank"):
+            passages = await asyncio.to_thread(
+                select_passages, question, matches, CONTEXT_TOKEN_BUDGET * 2, 10
+            )
+        matches = [{"metadata": {**p["metadata"], "text": p["text"]}} for p in passages]
 
     contexts = []
-    for match in results.get("matches", []):
+    for match in matches:
         md = match.get("metadata", {})
-        date_str = md.get("uploaded_at", "Unknown Date") 
+        uploaded_at = md.get("uploaded_at")
+        date_str = datetime.fromtimestamp(uploaded_at).strftime("%Y-%m-%d") if uploaded_at else "Unknown Date"
         text = f"[Date: {date_str}] {md.get('text', '')}"
         contexts.append(text)
 
@@ -159,6 +315,7 @@ async def longitudinal_analysis(username: str, question: str):
     User Question: {question}
     """
     
-    final = await asyncio.to_thread(llm.invoke, trend_prompt)
+    with span("llm_generate"):
+        final = await router.generate(lambda llm: llm, trend_prompt, priority="longitudinal", user=username)
     
     return {"diagnosis": final.content, "sources": []}
\ No newline at end of file
@@ -0,0 +1,199 @@
+import os
+import re
+import math
+import logging
+from typing import List, Optional
+from dotenv import load_dotenv
+
+from ..utils import estimate_tokens
+
+load_dotenv()
+
+logger = logging.getLogger("MedRagnosis.rerank")
+
+# Reranking is opt-in: when disabled, query.py keeps the plain top-5 behaviour.
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "false").lower() == "true"
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))
+RERANK_MAX_PASSAGES = int(os.getenv("RERANK_MAX_PASSAGES", "5"))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "600"))
+DEDUP_THRESHOLD = float(os.getenv("RERANK_DEDUP_THRESHOLD", "0.8"))
+# Optional cross-encoder (e.g. "cross-encoder/ms-marco-MiniLM-L-6-v2"). Always loaded on CPU.
+RERANK_MODEL = os.getenv("RERANK_MODEL")
+# Weight of the vector-store similarity vs. the local reranker score.
+VECTOR_SCORE_WEIGHT = float(os.getenv("RERANK_VECTOR_WEIGHT", "0.3"))
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:\.[0-9]+)?")
+_STOPWORDS = {
+    "a", "an", "and", "any", "are", "as", "at", "be", "by", "for", "from", "has", "have",
+    "how", "i", "in", "is", "it", "listed", "me", "my", "of", "on", "or", "report", "the",
+    "there", "this", "to", "was", "what", "when", "which", "who", "with",
+}
+_cross_encoder = None
+
+
+def _tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+def _get_cross_encoder():
+    """Loads the optional cross-encoder once. Returns None if it is not configured or installed."""
+    global _cross_encoder
+    if _cross_encoder is None and RERANK_MODEL:
+        try:
+            from sentence_transformers import CrossEncoder
+            _cross_encoder = CrossEncoder(RERANK_MODEL, device="cpu")
+        except Exception as e:
+            logger.warning(f"Cross-encoder unavailable ({e}). Falling back to lexical reranking.")
+            _cross_encoder = False
+    return _cross_encoder or None
+
+
+def lexical_scores(query: str, passages: List[str], k1: float = 1.5, b: float = 0.75) -> List[float]:
+    """BM25 scores of each passage against the query, with IDF computed over the candidate set."""
+    query_terms = set(_tokenize(query)) - _STOPWORDS
+    docs = [_tokenize(p) for p in passages]
+    if not docs or not query_terms:
+        return [0.0] * len(passages)
+
+    n = len(docs)
+    avg_len = sum(len(d) for d in docs) / n or 1.0
+    doc_freq = {t: sum(1 for d in docs if t in d) for t in query_terms}
+
+    scores = []
+    for doc in docs:
+        tf = {}
+        for t in doc:
+            if t in query_terms:
+                tf[t] = tf.get(t, 0) + 1
+        score = 0.0
+        for t, freq in tf.items():
+            idf = math.log(1 + (n - doc_freq[t] + 0.5) / (doc_freq[t] + 0.5))
+            score += idf * freq * (k1 + 1) / (freq + k1 * (1 - b + b * len(doc) / avg_len))
+        scores.append(score)
+    return scores
+
+
+def _normalize(values: List[float]) -> List[float]:
+    if not values:
+        return []
+    lo, hi = min(values), max(values)
+    if hi - lo < 1e-9:
+        return [1.0 if hi > 0 else 0.0 for _ in values]
+    return [(v - lo) / (hi - lo) for v in values]
+
+
+def rerank(query: str, candidates: List[dict]) -> List[dict]:
+    """
+    Rescores candidates ({"text", "score", "metadata"}) and returns them best first.
+    Uses the cross-encoder when configured, otherwise BM25 over the candidate set,
+    blended with the original vector similarity.
+    """
+    if not candidates:
+        return []
+
+    texts = [c["text"] for c in candidates]
+    encoder = _get_cross_encoder()
+    if encoder is not None:
+        local = list(encoder.predict([(query, t) for t in texts]))
+    else:
+        local = lexical_scores(query, texts)
+
+    local = _normalize([float(s) for s in local])
+    vector = _normalize([float(c.get("score") or 0.0) for c in candidates])
+
+    rescored = []
+    for c, l, v in zip(candidates, local, vector):
+        rescored.append({**c, "rerank_score": (1 - VECTOR_SCORE_WEIGHT) * l + VECTOR_SCORE_WEIGHT * v})
+    rescored.sort(key=lambda c: c["rerank_score"], reverse=True)
+    return rescored
+
+
+def _shingles(text: str, size: int = 5) -> set:
+    tokens = _tokenize(text)
+    if len(tokens) < size:
+        return {tuple(tokens)} if tokens else set()
+    return {tuple(tokens[i:i + size]) for i in range(len(tokens) - size + 1)}
+
+
+def _strip_overlap(selected: str, text: str, min_overlap: int = 20, max_overlap: int = 200) -> str:
+    """
+    Removes the part of `text` that repeats a boundary of `selected`, which is what the
+    splitter's chunk_overlap produces for neighbouring chunks.
+    """
+    max_len = min(len(selected), len(text), max_overlap)
+    for size in range(max_len, min_overlap - 1, -1):
+        # `text` continues `selected`
+        if selected.endswith(text[:size]):
+            return text[size:].lstrip()
+        # `text` precedes `selected`
+        if selected.startswith(text[-size:]):
+            return text[:-size].rstrip()
+    return text
+
+
+def dedupe(candidates: List[dict], threshold: float = DEDUP_THRESHOLD) -> List[dict]:
+    """
+    Drops candidates that are mostly contained in a better-ranked one and trims the
+    overlapping text that neighbouring chunks share.
+    """
+    kept = []
+    kept_shingles = []
+    for c in candidates:
+        text = c["text"]
+        for prev in kept:
+            text = _strip_overlap(prev["text"], text)
+            if not text:
+                break
+        if not text.strip():
+            continue
+
+        sh = _shingles(text)
+        duplicate = False
+        for prev_sh in kept_shingles:
+            if sh and len(sh & prev_sh) / len(sh) >= threshold:
+                duplicate = True
+                break
+        if duplicate:
+            continue
+
+        kept.append({**c, "text": text})
+        kept_shingles.append(sh)
+    return kept
+
+
+def pack(candidates: List[dict], token_budget: int = CONTEXT_TOKEN_BUDGET,
+         max_passages: int = RERANK_MAX_PASSAGES) -> List[dict]:
+    """Greedily takes the best passages that fit in the token budget."""
+    packed = []
+    used = 0
+    for c in candidates:
+        if len(packed) >= max_passages:
+            break
+        cost = estimate_tokens(c["text"])
+        if used + cost > token_budget:
+            continue
+        packed.append(c)
+        used += cost
+    return packed
+
+
+def select_passages(query: str, matches: List[dict], token_budget: Optional[int] = None,
+                    max_passages: Optional[int] = None) -> List[dict]:
+    """
+    Full reranking stage for vector-store matches: rescore, dedupe, then pack into the budget.
+    Returns candidates as {"text", "score", "metadata", "rerank_score"}.
+    """
+    candidates = []
+    for match in matches:
+        md = match.get("metadata", {}) or {}
+        text = md.get("text") or ""
+        if text.strip():
+            candidates.append({"text": text, "score": match.get("score", 0.0), "metadata": md})
+
+    ranked = rerank(query, candidates)
+    unique = dedupe(ranked)
+    return pack(
+        unique,
+        token_budget=token_budget or CONTEXT_TOKEN_BUDGET,
+        max_passages=max_passages or RERANK_MAX_PASSAGES,
+    )
@@ -0,0 +1,230 @@
+"""
+Doctor review queue: delta sync and a live feed of pending diagnosis records.
+
+Every diagnosis record carries `updated_at`, set when it is created and when a doctor
+reviews it. Clients load the queue once (GET /diagnosis/pending), then either ask for
+what changed since their cursor (GET /diagnosis/pending/changes?since=) or hold an SSE
+connection (GET /diagnosis/pending/stream) that pushes each change as it happens:
+
+  upsert   a record entered (or is still in) the pending queue; the full record
+  remove   a record left the queue (reviewed); its _id and new status
+
+Each worker runs one feed source, shared by all of its subscribers, and only while it
+has any. REVIEW_FEED_SOURCE selects it:
+
+  poll          one indexed `updated_at` query every REVIEW_FEED_POLL_SECONDS (the
+                default; works on any MongoDB, and is what tests use)
+  changestream  MongoDB change streams (needs a replica set)
+
+Either way every worker sees every other worker's writes; its own are pushed at once.
+Pending records carry their report's digest (reports/digest.py) when one has been generated.
+Cursors are server timestamps, so each query reaches CLOCK_SKEW_SECONDS back and a client
+may see a change twice. Applying events by _id makes that harmless.
+"""
+import os
+import json
+import time
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import List
+
+from dotenv import load_dotenv
+
+from ..config.db import reports_collection, diagnosis_collection
+from ..reports.digest import attach_digests
+from ..metrics import Gauge, register
+
+load_dotenv()
+
+logger = logging.getLogger("MedRagnosis.review_feed")
+
+REVIEW_FEED_SOURCE = os.getenv("REVIEW_FEED_SOURCE", "poll")
+REVIEW_FEED_POLL_SECONDS = float(os.getenv("REVIEW_FEED_POLL_SECONDS", "2"))
+REVIEW_FEED_KEEPALIVE_SECONDS = 15
+# Workers' clocks may disagree by this much
+CLOCK_SKEW_SECONDS = 5
+# Events a slow subscriber may fall behind before it is told to resync
+SUBSCRIBER_QUEUE_SIZE = 1000
+
+LONGITUDINAL_FILENAME = "Longitudinal Analysis (All Files)"
+
+REVIEW_FEED_SUBSCRIBERS = register(Gauge(
+    "medragnosis_review_feed_subscribers", "Open review queue feed connections in this worker."
+))
+
+
+def attach_filenames(records: List[dict]) -> List[dict]:
+    """Serialises record ids and adds each record's report filename, with one reports query."""
+    doc_ids = {r.get("doc_id") for r in records if r.get("doc_id") and r.get("doc_id") != "all-reports"}
+    filenames = {}
+    if doc_ids:
+        for report in reports_collection.find({"doc_id": {"$in": list(doc_ids)}}, {"doc_id": 1, "filename": 1}):
+            filenames.setdefault(report["doc_id"], report["filename"])
+    for record in records:
+        record["_id"] = str(record["_id"])
+        if record.get("doc_id") and record.get("doc_id") != "all-reports":
+            record["filename"] = filenames.get(record["doc_id"], "Unknown File")
+        else:
+            record["filename"] = LONGITUDINAL_FILENAME
+    return records
+
+
+def pending_records() -> List[dict]:
+    cursor = diagnosis_collection.find({"verification_status": "pending"}).sort("timestamp", -1)
+    return attach_digests(attach_filenames(list(cursor)))
+
+
+def _event(record: dict) -> dict:
+    """Feed event for a record already through attach_filenames (or with a serialised _id)."""
+    if record.get("verification_status", "pending") == "pending":
+        return {"event": "upsert", "record": record, "updated_at": record.get("updated_at")}
+    return {"event": "remove", "_id": record["_id"], "verification_status": record["verification_status"],
+            "updated_at": record.get("updated_at")}
+
+
+def changes_since(since: float) -> dict:
+    """{"cursor": pass as the next since, "events": [upsert/remove, oldest first]}."""
+    cursor = time.time()
+    changed = list(diagnosis_collection.find({"updated_at": {"$gt": since - CLOCK_SKEW_SECONDS}})
+                   .sort("updated_at", 1))
+    attach_digests(attach_filenames([r for r in changed if r.get("verification_status", "pending") == "pending"]))
+    for record in changed:
+        record["_id"] = str(record["_id"])
+    return {"cursor": cursor, "events": [_event(r) for r in changed]}
+
+
+def record_events(records: List[dict]) -> List[dict]:
+    """Feed events for raw records (pending ones get filenames and digests, one query each for all)."""
+    records = [dict(record) for record in records]
+    attach_digests(attach_filenames([r for r in records if r.get("verification_status", "pending") == "pending"]))
+    for record in records:
+        record["_id"] = str(record["_id"])
+    return [_event(record) for record in records]
+
+
+def record_event(record: dict) -> dict:
+    """Feed event for one raw record (looks up its filename and digest if it is pending)."""
+    return record_events([record])[0]
+
+
+def sse(event: dict) -> str:
+    """One Server-Sent Events message; its id is the cursor to resume from."""
+    lines = []
+    if event.get("updated_at") is not None:
+        lines.append(f"id: {event['updated_at']}")
+    lines.append(f"event: {event['event']}")
+    lines.append(f"data: {json.dumps(event, default=str)}")
+    return "\n".join(lines) + "\n\n"
+
+
+class ReviewFeed:
+    def __init__(self, source: str = REVIEW_FEED_SOURCE, poll_seconds: float = REVIEW_FEED_POLL_SECONDS):
+        if source not in ("poll", "changestream"):
+            raise ValueError(f"Unknown REVIEW_FEED_SOURCE {source!r} (poll, changestream)")
+        self.source = source
+        self.poll_seconds = poll_seconds
+        self._subscribers = set()
+        self._task = None
+        self._loop = None
+        self._sent = OrderedDict()  # (_id, updated_at) already fanned out, to drop repeats
+
+    def _fan_out(self, event: dict):
+        seen = (event.get("record", {}).get("_id") or event.get("_id"), event.get("updated_at"))
+        if seen in self._sent:
+            return
+        self._sent[seen] = True
+        if len(self._sent) > 10 * SUBSCRIBER_QUEUE_SIZE:
+            self._sent.popitem(last=False)
+        for queue in self._subscribers:
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Too far behind: drop its backlog and have it reload the queue
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait({"event": "resync"})
+
+    def publish(self, record: dict):
+        """
+        Pushes a record this worker just wrote, without waiting for the source to see it.
+        Callable from the event loop or from a sync endpoint's thread.
+        """
+        self.publish_many([record])
+
+    def publish_many(self, records: List[dict]):
+        """publish() for a batch of records, with one set of lookups for all of them."""
+        if not self._subscribers or not records:
+            return
+        events = record_events(records)
+        try:
+            on_loop = asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            on_loop = False
+        for event in events:
+            if on_loop:
+                self._fan_out(event)
+            else:
+                self._loop.call_soon_threadsafe(self._fan_out, event)
+
+    async def apublish(self, record: dict):
+        """publish() for async endpoints: the filename and digest lookups run in a thread."""
+        if self._subscribers:
+            await asyncio.to_thread(self.publish, record)
+
+    @asynccontextmanager
+    async def subscribe(self):
+        """A queue of feed events for as long as the block runs."""
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._loop = asyncio.get_running_loop()
+        self._subscribers.add(queue)
+        REVIEW_FEED_SUBSCRIBERS.inc()
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._poll() if self.source == "poll" else self._watch())
+        try:
+            yield queue
+        finally:
+            self._subscribers.discard(queue)
+            REVIEW_FEED_SUBSCRIBERS.dec()
+            if not self._subscribers and self._task is not None:
+                self._task.cancel()
+                self._task = None
+
+    async def _poll(self):
+        cursor = time.time()
+        while True:
+            await asyncio.sleep(self.poll_seconds)
+            try:
+                changes = await asyncio.to_thread(changes_since, cursor)
+            except Exception as e:
+                logger.warning(f"Review feed poll failed: {e}")
+                continue
+            cursor = changes["cursor"]
+            for event in changes["events"]:
+                self._fan_out(event)
+
+    async def _watch(self):
+        loop = asyncio.get_running_loop()
+        stop = threading.Event()
+
+        def watch():
+            pipeline = [{"$match": {"operationType": {"$in": ["insert", "update", "replace"]}}}]
+            with diagnosis_collection.watch(pipeline, full_document="updateLookup", max_await_time_ms=1000) as stream:
+                while not stop.is_set():
+                    change = stream.try_next()
+                    if change and change.get("fullDocument"):
+                        loop.call_soon_threadsafe(self._fan_out, record_event(change["fullDocument"]))
+
+        try:
+            await asyncio.to_thread(watch)
+        except Exception as e:
+            # e.g. a standalone server, which has no change streams
+            logger.warning(f"Review feed change stream failed ({e}); polling instead")
+            await self._poll()
+        finally:
+            stop.set()
+
+
+review_feed = ReviewFeed()
@@ -1,20 +1,41 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Header, Response
+from fastapi.responses import StreamingResponse
 from ..auth.route import get_current_user 
+from ..admission import admit
 from .query import chat_diagnosis_report, longitudinal_analysis 
+from .coalesce import run_once, request_key, IdempotencyConflict
+from .review_feed import (review_feed, attach_filenames, pending_records, changes_since, sse,
+                          REVIEW_FEED_KEEPALIVE_SECONDS)
 from ..config.db import reports_collection, diagnosis_collection
-from ..models.db_models import ChatRequest, VerificationRequest
+from ..models.db_models import ChatRequest, VerificationRequest, BulkVerificationRequest
+from ..metrics import span
 import time
-from typing import List
+import asyncio
+from typing import List, Optional
 from bson.objectid import ObjectId
+from pymongo import UpdateOne
 
 router = APIRouter(prefix="/diagnosis", tags=["diagnosis"])
 
+
+async def _coalesced(kind: str, req: ChatRequest, username: str, idempotency_key: Optional[str], fn):
+    """Runs fn once for concurrent duplicates of this request (and replays it for a retried Idempotency-Key)."""
+    fingerprint = request_key(kind, username, req.doc_id, [(m.role, m.content) for m in req.messages])
+    scoped_key = request_key(kind, username, idempotency_key) if idempotency_key else None
+    try:
+        return await run_once(fingerprint, fn, scoped_key)
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
 @router.post("/chat")
 async def chat_diagnose(
     req: ChatRequest,
-    user=Depends(get_current_user)
+    user=Depends(admit("chat")),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
 ):
-    report = reports_collection.find_one({"doc_id": req.doc_id})
+    with span("report_lookup"):
+        report = reports_collection.find_one({"doc_id": req.doc_id})
     if not report:
         raise HTTPException(status_code=404, detail="Report not found")
     
@@ -22,87 +43,192 @@ async def chat_diagnose(
         raise HTTPException(status_code=406, detail="You cannot access another user's report")
     
     if user["role"] == "patient":
-        res = await chat_diagnosis_report(user["username"], req.doc_id, req.messages)
-        latest_q = req.messages[-1].content if req.messages else "Unknown"
+        async def run():
+            res = await chat_diagnosis_report(user["username"], req.doc_id, req.messages)
+            latest_q = req.messages[-1].content if req.messages else "Unknown"
 
-        diagnosis_collection.insert_one({
-            "doc_id": req.doc_id,
-            "requester": user["username"],
-            "question": latest_q, 
-            "answer": res.get("diagnosis"),
-            "sources": res.get("sources", []),
-            "timestamp": time.time(),
-            "type": "chat",
-            "verification_status": "pending",
-            "doctor_note": None
-        })
-        return res
+            now = time.time()
+            record = {
+                "doc_id": req.doc_id,
+                "requester": user["username"],
+                "question": latest_q, 
+                "answer": res.get("diagnosis"),
+                "sources": res.get("sources", []),
+                "timestamp": now,
+                "updated_at": now,
+                "type": "chat",
+                "verification_status": "pending",
+                "doctor_note": None
+            }
+            with span("mongo_insert"):
+                await asyncio.to_thread(diagnosis_collection.insert_one, record)
+            await review_feed.apublish(record)
+            return res
+
+        return await _coalesced("chat", req, user["username"], idempotency_key, run)
     
     raise HTTPException(status_code=403, detail="Unauthorized")
 
 @router.post("/longitudinal")
 async def longitudinal_diagnose(
     req: ChatRequest,
-    user=Depends(get_current_user)
+    user=Depends(admit("longitudinal")),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
 ):
     if user["role"] != "patient":
         raise HTTPException(status_code=403, detail="Only patients can use this feature")
 
     question = req.messages[-1].content if req.messages else "Analyze trends"
-    res = await longitudinal_analysis(user["username"], question)
-    
-    diagnosis_collection.insert_one({
-        "doc_id": "all-reports",
-        "requester": user["username"],
-        "question": question, 
-        "answer": res.get("diagnosis"),
-        "sources": [],
-        "timestamp": time.time(),
-        "type": "trend",
-        "verification_status": "pending"
-    })
-    
-    return res
+
+    async def run():
+        res = await longitudinal_analysis(user["username"], question)
+        
+        now = time.time()
+        record = {
+            "doc_id": "all-reports",
+            "requester": user["username"],
+            "question": question, 
+            "answer": res.get("diagnosis"),
+            "sources": [],
+            "timestamp": now,
+            "updated_at": now,
+            "type": "trend",
+            "verification_status": "pending"
+        }
+        with span("mongo_insert"):
+            await asyncio.to_thread(diagnosis_collection.insert_one, record)
+        await review_feed.apublish(record)
+        
+        return res
+
+    return await _coalesced("trend", req, user["username"], idempotency_key, run)
 
 @router.get("/pending")
-def get_pending_reviews_endpoint(user=Depends(get_current_user)):
+def get_pending_reviews_endpoint(response: Response, user=Depends(get_current_user)):
     if user["role"] != "doctor":
         raise HTTPException(status_code=403, detail="Only doctors can view pending items")
     
-    cursor = diagnosis_collection.find({"verification_status": "pending"}).sort("timestamp", -1)
-    
-    results = []
-    for doc in cursor:
-        doc["_id"] = str(doc["_id"]) 
-        # Attach Filename for Doctor Context
-        if doc.get("doc_id") and doc.get("doc_id") != "all-reports":
-            report_meta = reports_collection.find_one({"doc_id": doc["doc_id"]})
-            doc["filename"] = report_meta["filename"] if report_meta else "Unknown File"
-        else:
-             doc["filename"] = "Longitudinal Analysis (All Files)"
-             
-        results.append(doc)
-    return results
+    # Taken before the query: the `since` for the client's first /pending/changes call
+    response.headers["X-Review-Cursor"] = str(time.time())
+    # Filenames for doctor context come from one batched reports query
+    return pending_records()
+
+@router.get("/pending/changes")
+def get_pending_changes(since: float, user=Depends(get_current_user)):
+    """
+    Delta sync for the review queue: records that entered or left it since `since`
+    (the `cursor` of the previous call, or the time the queue was loaded).
+    """
+    if user["role"] != "doctor":
+        raise HTTPException(status_code=403, detail="Only doctors can view pending items")
+    return changes_since(since)
+
+@router.get("/pending/stream")
+async def stream_pending(
+    since: Optional[float] = None,
+    last_event_id: Optional[str] = Header(None, alias="Last-Event-ID"),
+    user=Depends(get_current_user)
+):
+    """
+    Server-Sent Events feed of the review queue: a snapshot (or the changes since `since`,
+    or since Last-Event-ID on reconnect), then each change as it happens.
+    """
+    if user["role"] != "doctor":
+        raise HTTPException(status_code=403, detail="Only doctors can view pending items")
+    if since is None and last_event_id:
+        try:
+            since = float(last_event_id)
+        except ValueError:
+            pass
+
+    async def events():
+        # Subscribed before the catch-up query, so no change falls between the two
+        async with review_feed.subscribe() as queue:
+            if since is None:
+                snapshot = await asyncio.to_thread(pending_records)
+                yield sse({"event": "snapshot", "records": snapshot, "updated_at": time.time()})
+            else:
+                for event in (await asyncio.to_thread(changes_since, since))["events"]:
+                    yield sse(event)
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), REVIEW_FEED_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield sse(event)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def _review_update(user: dict, req: VerificationRequest, now: float) -> dict:
+    return {
+        "verified_by": user["username"],
+        "verification_status": req.status,
+        "doctor_note": req.note,
+        "updated_at": now
+    }
 
 @router.post("/verify")
 def verify_diagnosis(req: VerificationRequest, user=Depends(get_current_user)):
     if user["role"] != "doctor":
         raise HTTPException(status_code=403, detail="Unauthorized")
     
-    result = diagnosis_collection.update_one(
-        {"_id": ObjectId(req.record_id)},
-        {"$set": {
-            "verified_by": user["username"],
-            "verification_status": req.status,
-            "doctor_note": req.note
-        }}
-    )
+    update = _review_update(user, req, time.time())
+    result = diagnosis_collection.update_one({"_id": ObjectId(req.record_id)}, {"$set": update})
     
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Record not found")
+
+    if req.status == "pending":
+        review_feed.publish(diagnosis_collection.find_one({"_id": ObjectId(req.record_id)}))
+    else:
+        review_feed.publish({"_id": req.record_id, **update})
         
     return {"message": "Diagnosis updated successfully"}
 
+@router.post("/verify/bulk")
+def verify_diagnoses_bulk(req: BulkVerificationRequest, user=Depends(get_current_user)):
+    """
+    Reviews many records in one request and one bulk_write. Every item gets a result:
+    updated, invalid_id, duplicate (the same record earlier in the batch) or not_found.
+    """
+    if user["role"] != "doctor":
+        raise HTTPException(status_code=403, detail="Unauthorized")
+
+    results, valid = [], {}
+    for item in req.items:
+        if not ObjectId.is_valid(item.record_id):
+            results.append({"record_id": item.record_id, "result": "invalid_id"})
+        elif item.record_id in valid:
+            results.append({"record_id": item.record_id, "result": "duplicate"})
+        else:
+            valid[item.record_id] = item
+            results.append({"record_id": item.record_id, "result": None})
+
+    ids = [ObjectId(record_id) for record_id in valid]
+    found = {str(doc["_id"]) for doc in diagnosis_collection.find({"_id": {"$in": ids}}, {"_id": 1})} if ids else set()
+
+    now = time.time()
+    updates = {record_id: _review_update(user, item, now) for record_id, item in valid.items() if record_id in found}
+    if updates:
+        diagnosis_collection.bulk_write(
+            [UpdateOne({"_id": ObjectId(record_id)}, {"$set": update}) for record_id, update in updates.items()],
+            ordered=False
+        )
+
+    for result in results:
+        if result["result"] is None:
+            result["result"] = "updated" if result["record_id"] in updates else "not_found"
+    # Records sent back to the queue are published whole, fetched with one query
+    reopened = [ObjectId(record_id) for record_id, update in updates.items() if update["verification_status"] == "pending"]
+    published = list(diagnosis_collection.find({"_id": {"$in": reopened}})) if reopened else []
+    published += [{"_id": record_id, **update} for record_id, update in updates.items()
+                  if update["verification_status"] != "pending"]
+    review_feed.publish_many(published)
+
+    return {"updated": len(updates), "results": results}
+
 @router.get("/my_history")
 def get_my_history(user=Depends(get_current_user)):
     if user["role"] != "patient":
@@ -122,17 +248,4 @@ async def get_patient_diagnosis(patient_name: str, user=Depends(get_current_user
         raise HTTPException(status_code=403, detail="Only doctors can access this endpoint")
         
     diagnosis_records = diagnosis_collection.find({"requester": patient_name})
-    records_list = []
-    for record in diagnosis_records:
-        record["_id"] = str(record["_id"]) 
-        
-        # Attach Filename
-        if record.get("doc_id") and record.get("doc_id") != "all-reports":
-            report_meta = reports_collection.find_one({"doc_id": record["doc_id"]})
-            record["filename"] = report_meta["filename"] if report_meta else "Unknown File"
-        else:
-             record["filename"] = "Longitudinal Analysis (All Files)"
-
-        records_list.append(record)
-        
-    return records_list
\ No newline at end of file
+    return attach_filenames(list(diagnosis_records))
\ No newline at end of file
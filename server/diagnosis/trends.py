@@ -0,0 +1,120 @@
+from datetime import datetime
+from typing import List, Optional
+
+import numpy as np
+
+from .lab_lookup import match_tests
+
+# Relative change (per series) below which a test is reported as stable
+STABLE_THRESHOLD = 0.05
+# Upper bound on the tests sent to the LLM, so the prompt size does not grow with history
+MAX_TRENDS_IN_PROMPT = 12
+
+
+def _fmt_date(ts: float) -> str:
+    return datetime.fromtimestamp(ts).strftime("%Y-%m-%d")
+
+
+def build_series(rows: List[dict]) -> dict:
+    """Groups lab rows into per-test arrays ordered by report date."""
+    grouped = {}
+    for row in rows:
+        if row.get("value") is None or row.get("report_date") is None:
+            continue
+        grouped.setdefault(row["test"], []).append(row)
+
+    series = {}
+    for test, items in grouped.items():
+        items.sort(key=lambda r: r["report_date"])
+        series[test] = {
+            "name": items[-1].get("name", test),
+            "unit": items[-1].get("unit"),
+            "dates": np.array([r["report_date"] for r in items], dtype=float),
+            "values": np.array([r["value"] for r in items], dtype=float),
+            "ref_low": np.array([np.nan if r.get("ref_low") is None else r["ref_low"] for r in items], dtype=float),
+            "ref_high": np.array([np.nan if r.get("ref_high") is None else r["ref_high"] for r in items], dtype=float),
+            "sources": sorted({r.get("source") for r in items if r.get("source")}),
+        }
+    return series
+
+
+def compute_trend(s: dict) -> dict:
+    """Delta, slope (per 30 days) and out-of-range flags for one test series."""
+    values, dates = s["values"], s["dates"]
+    n = len(values)
+
+    # Out-of-range is evaluated against each report's own reference range
+    with np.errstate(invalid="ignore"):
+        below = values < s["ref_low"]
+        above = values > s["ref_high"]
+
+    delta = float(values[-1] - values[0]) if n > 1 else 0.0
+    pct_change = delta / abs(values[0]) if n > 1 and values[0] != 0 else 0.0
+
+    slope = 0.0
+    if n > 1:
+        days = (dates - dates[0]) / 86400.0
+        var = float(np.var(days))
+        if var > 0:
+            slope = float(np.mean((days - days.mean()) * (values - values.mean())) / var) * 30
+
+    if n < 2 or abs(pct_change) < STABLE_THRESHOLD:
+        direction = "stable"
+    else:
+        direction = "rising" if delta > 0 else "falling"
+
+    latest_flag = "high" if above[-1] else "low" if below[-1] else None
+    return {
+        "name": s["name"],
+        "unit": s["unit"],
+        "n": n,
+        "first": float(values[0]),
+        "last": float(values[-1]),
+        "first_date": _fmt_date(dates[0]),
+        "last_date": _fmt_date(dates[-1]),
+        "min": float(values.min()),
+        "max": float(values.max()),
+        "delta": delta,
+        "pct_change": pct_change,
+        "slope_per_30d": slope,
+        "direction": direction,
+        "out_of_range": int(below.sum() + above.sum()),
+        "latest_flag": latest_flag,
+        "sources": s["sources"],
+    }
+
+
+def compute_trends(rows: List[dict]) -> dict:
+    """Trend statistics for every test found in a patient's lab history."""
+    return {test: compute_trend(s) for test, s in build_series(rows).items()}
+
+
+def select_trends(trends: dict, question: str, limit: int = MAX_TRENDS_IN_PROMPT) -> List[str]:
+    """Tests named in the question first, then abnormal ones, then the biggest movers."""
+    mentioned = match_tests(question, list(trends))
+    rest = sorted(
+        (t for t in trends if t not in mentioned),
+        key=lambda t: (trends[t]["latest_flag"] is None, trends[t]["out_of_range"] == 0,
+                       -abs(trends[t]["pct_change"])),
+    )
+    return (mentioned + rest)[:limit]
+
+
+def format_trend_summary(trends: dict, tests: Optional[List[str]] = None) -> str:
+    """One compact line per test for the LLM prompt."""
+    lines = []
+    for test in tests or list(trends):
+        t = trends[test]
+        unit = f" {t['unit']}" if t.get("unit") else ""
+        line = f"- {t['name']}: {t['last']:g}{unit} on {t['last_date']}"
+        if t["n"] > 1:
+            line += (f" (from {t['first']:g} on {t['first_date']}, {t['n']} results, "
+                     f"change {t['delta']:+g} / {t['pct_change']:+.0%}, "
+                     f"slope {t['slope_per_30d']:+.2f}/30d, {t['direction']}, "
+                     f"range {t['min']:g}-{t['max']:g})")
+        if t["out_of_range"]:
+            line += f"; out of range in {t['out_of_range']}/{t['n']} reports"
+        if t["latest_flag"]:
+            line += f"; latest is {t['latest_flag'].upper()}"
+        lines.append(line)
+    return "\n".join(lines)
@@ -1,25 +1,77 @@
+import os
+import time
+import asyncio
 import logging
+import threading
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request, status
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.exceptions import RequestValidationError 
 from .auth.route import router as auth_router
 from .reports.route import router as report_router
 from .diagnosis.route import router as diagnosis_router
+from .config.db import ensure_indexes
+from .config import services
+from .reports import digest
+from . import metrics
+
+# Prefix every log line with the request's trace id (also returned as the X-Trace-Id header)
+LOG_TRACE_IDS = os.getenv("LOG_TRACE_IDS", "false").lower() == "true"
 
 # 1. Configure Logging
 logging.basicConfig(
     level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    format="%(asctime)s - %(name)s - %(levelname)s - "
+           + ("[%(trace_id)s] " if LOG_TRACE_IDS else "") + "%(message)s",
     datefmt="%Y-%m-%d %H:%M:%S",
 )
+for handler in logging.getLogger().handlers:
+    handler.addFilter(metrics.TraceIdFilter())
 logger = logging.getLogger("MedRagnosis")
 
-app = FastAPI(title="MedRagnosis-RAG-Enhanced Medical Diagnosis Engine")
+# Build the Pinecone/OpenAI/Groq clients at startup instead of on the first request
+WARM_CLIENTS_ON_STARTUP = os.getenv("WARM_CLIENTS_ON_STARTUP", "false").lower() == "true"
+
+
+def _ensure_indexes():
+    try:
+        ensure_indexes()
+    except Exception as e:
+        logger.warning(f"Could not create MongoDB indexes: {e}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    logger.info("🚀 MedRagnosis Server Starting Up...")
+    # Index creation must not hold up startup (or hang it when MongoDB is unreachable)
+    threading.Thread(target=_ensure_indexes, daemon=True).start()
+    if WARM_CLIENTS_ON_STARTUP:
+        try:
+            services.warm_up()
+        except Exception as e:
+            logger.warning(f"Client warm-up failed, falling back to lazy creation: {e}")
+    digest_worker = asyncio.create_task(digest.run_digest_worker()) if digest.DIGEST_ENABLED else None
+    yield
+    if digest_worker:
+        digest_worker.cancel()
+        await asyncio.gather(digest_worker, return_exceptions=True)
+    await services.aclose()
+
+
+app = FastAPI(title="MedRagnosis-RAG-Enhanced Medical Diagnosis Engine", lifespan=lifespan)
 
 # 2. Add Global Exception Handler 
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
+    # A provider's rate limit (OpenAI/Groq 429) is overload, not a server fault
+    if getattr(exc, "status_code", None) == 429:
+        logger.warning(f"Provider rate limit: {exc}")
+        return JSONResponse(
+            status_code=503,
+            content={"detail": "The AI service is busy. Please try again shortly."},
+            headers={"Retry-After": "5"},
+        )
     logger.error(f"Global Error: {exc}", exc_info=True)
     return JSONResponse(
         status_code=500,
@@ -39,6 +91,30 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
         content={"detail": clean_message},
     )
 
+# 4. Request Metrics and Trace IDs
+@app.middleware("http")
+async def observe_requests(request: Request, call_next):
+    trace_id = metrics.new_trace_id(request.headers.get("x-trace-id") or request.headers.get("traceparent"))
+    scope_token = metrics.request_scope_var.set(request.scope)
+    trace_token = metrics.trace_id_var.set(trace_id)
+    metrics.REQUESTS_IN_FLIGHT.inc()
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        response.headers["X-Trace-Id"] = trace_id
+        return response
+    finally:
+        metrics.REQUESTS_IN_FLIGHT.dec()
+        route = metrics.current_route()
+        metrics.REQUEST_SECONDS.observe(
+            time.perf_counter() - start,
+            route=route if route != "-" else "unmatched", method=request.method, status=status_code
+        )
+        metrics.request_scope_var.reset(scope_token)
+        metrics.trace_id_var.reset(trace_token)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -46,9 +122,14 @@ app.add_middleware(
     allow_headers=["*"]
 )
 
-@app.on_event("startup")
-async def startup_event():
-    logger.info("🚀 MedRagnosis Server Starting Up...")
+@app.get("/health")
+def health_check():
+    return {"message": "ok"}
+
+@app.get("/metrics", include_in_schema=False)
+def metrics_endpoint():
+    """Prometheus text exposition of stage/request latency histograms and in-flight/queue gauges."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 app.include_router(auth_router)
 app.include_router(report_router)
@@ -0,0 +1,177 @@
+"""
+In-process metrics with Prometheus text exposition (served at /metrics), per-stage
+timing spans and request trace ids.
+
+Kept dependency-free: histograms, gauges and counters are plain dicts guarded by a lock.
+"""
+import logging
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Seconds; spans range from sub-millisecond Mongo lookups to multi-second OCR/LLM calls
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+trace_id_var: ContextVar[str] = ContextVar("trace_id", default="-")
+# Label for work outside a request (e.g. a CLI); inside one the matched route is used
+route_var: ContextVar[str] = ContextVar("route", default="-")
+# The ASGI scope of the current request; the router records the matched route on it
+request_scope_var: ContextVar[dict] = ContextVar("request_scope", default=None)
+# Per-call stage timings, when a caller asked for them with collect_stages()
+stage_timings_var: ContextVar[dict] = ContextVar("stage_timings", default=None)
+
+_lock = threading.Lock()
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key: tuple, extra: dict = None) -> str:
+    items = list(key) + list((extra or {}).items())
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self._series = {}
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        with _lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0}
+            series["counts"][bisect_left(self.buckets, value)] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with _lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series["counts"]):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_format_labels(key, {'le': bound})} {cumulative}")
+                lines.append(f"{self.name}_bucket{_format_labels(key, {'le': '+Inf'})} {series['count']}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {series['sum']:.6f}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {series['count']}")
+        return lines
+
+
+class Gauge:
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        with _lock:
+            self._values[_label_key(labels)] = value
+
+    def value(self, **labels) -> float:
+        with _lock:
+            return self._values.get(_label_key(labels), 0)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with _lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {value:g}")
+        return lines
+
+
+class Counter(Gauge):
+    kind = "counter"
+
+
+STAGE_SECONDS = Histogram("medragnosis_stage_duration_seconds", "Time spent per pipeline stage.")
+REQUEST_SECONDS = Histogram("medragnosis_request_duration_seconds", "End-to-end HTTP request latency.")
+REQUESTS_IN_FLIGHT = Gauge("medragnosis_requests_in_flight", "HTTP requests currently being served.")
+PROVIDER_IN_FLIGHT = Gauge("medragnosis_provider_in_flight", "Calls currently running against a provider.")
+PROVIDER_QUEUE_DEPTH = Gauge("medragnosis_provider_queue_depth", "Calls waiting for a provider concurrency slot.")
+
+REGISTRY = [STAGE_SECONDS, REQUEST_SECONDS, REQUESTS_IN_FLIGHT, PROVIDER_IN_FLIGHT, PROVIDER_QUEUE_DEPTH]
+
+
+def register(metric):
+    """Adds a metric defined elsewhere to the /metrics output."""
+    if metric not in REGISTRY:
+        REGISTRY.append(metric)
+    return metric
+
+
+def render() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def current_route() -> str:
+    """Path template of the current request (/reports/view/{doc_id}), keeping labels low-cardinality."""
+    scope = request_scope_var.get()
+    route = scope.get("route") if scope else None
+    return getattr(route, "path", None) or route_var.get()
+
+
+@contextmanager
+def span(stage: str):
+    """Times a pipeline stage; recorded under the current request's route."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, route=current_route(), stage=stage)
+        timings = stage_timings_var.get()
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + elapsed
+
+
+@contextmanager
+def collect_stages():
+    """Yields a dict that fills with {stage: seconds} for the spans run inside the block."""
+    timings = {}
+    token = stage_timings_var.set(timings)
+    try:
+        yield timings
+    finally:
+        stage_timings_var.reset(token)
+
+
+def new_trace_id(incoming: str = None) -> str:
+    """Reuses the caller's X-Trace-Id or the trace-id part of a W3C traceparent header."""
+    if incoming:
+        parts = incoming.split("-")
+        if len(parts) == 4 and len(parts[1]) == 32:
+            return parts[1]
+        return incoming[:64]
+    return uuid.uuid4().hex
+
+
+class TraceIdFilter(logging.Filter):
+    """Adds `trace_id` to every log record so log formats can include %(trace_id)s."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.trace_id = trace_id_var.get()
+        return True
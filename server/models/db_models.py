@@ -20,6 +20,7 @@ class DiagnosisRecord(BaseModel):
     answer: str
     sources: Optional[List] = []
     timestamp: float = Field(default_factory=lambda: time.time())
+    updated_at: Optional[float] = None  # created or last reviewed; review queue delta sync
     
     verified_by: Optional[str] = None 
     verification_status: str = "pending"  
@@ -36,4 +37,8 @@ class ChatRequest(BaseModel):
 class VerificationRequest(BaseModel):
     record_id: str
     status: str
-    note: str
\ No newline at end of file
+    note: str
+
+
+class BulkVerificationRequest(BaseModel):
+    items: List[VerificationRequest] = Field(..., min_length=1, max_length=500)
@@ -0,0 +1,124 @@
+"""
+Local store of chunk text, keyed by vector id.
+
+The vector index only holds ids and small filter fields; chunk text lives here,
+zlib-compressed in SQLite, and query matches are hydrated with one batched read.
+Vectors indexed before the store existed still carry their text in metadata and are
+served as they are.
+
+The SQLite file is shared by the workers of one node. Replicas on several nodes set
+CHUNK_STORE_BACKEND=state to keep the same compressed blobs in the shared state
+(config/state.py) instead.
+"""
+import os
+import zlib
+import logging
+import sqlite3
+import threading
+from typing import Dict, Iterable, List
+
+from dotenv import load_dotenv
+
+from ..config.state import get_state, key
+
+load_dotenv()
+
+logger = logging.getLogger("MedRagnosis.chunk_store")
+
+CHUNK_STORE_BACKEND = os.getenv("CHUNK_STORE_BACKEND", "sqlite")
+CHUNK_STORE_PATH = os.getenv("CHUNK_STORE_PATH", "./chunk_store.sqlite")
+# SQLite's default limit on bound parameters per statement is 999 on older builds
+BATCH_SIZE = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    vector_id TEXT PRIMARY KEY,
+    text BLOB NOT NULL
+);
+"""
+
+_local = threading.local()
+
+
+def _connection() -> sqlite3.Connection:
+    # One connection per thread (and per process, so forked workers never share one)
+    key = (os.getpid(), CHUNK_STORE_PATH)
+    if getattr(_local, "key", None) != key:
+        conn = sqlite3.connect(CHUNK_STORE_PATH, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        _local.conn, _local.key = conn, key
+    return _local.conn
+
+
+def _batches(items: list):
+    for start in range(0, len(items), BATCH_SIZE):
+        yield items[start:start + BATCH_SIZE]
+
+
+def _state_key(vid: str) -> str:
+    return key("chunk", vid)
+
+
+def put_many(ids: List[str], texts: List[str]):
+    if CHUNK_STORE_BACKEND == "state":
+        state = get_state()
+        for vid, text in zip(ids, texts):
+            state.set(_state_key(vid), zlib.compress(text.encode(), 6))
+        return
+    conn = _connection()
+    with conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO chunks VALUES (?, ?)",
+            [(vid, zlib.compress(text.encode(), 6)) for vid, text in zip(ids, texts)]
+        )
+
+
+def get_many(ids: Iterable[str]) -> Dict[str, str]:
+    """{vector id: chunk text} for the ids that are stored."""
+    ids, found = list(dict.fromkeys(ids)), {}
+    if CHUNK_STORE_BACKEND == "state":
+        state = get_state()
+        for batch in _batches(ids):
+            for vid, blob in zip(batch, state.mget([_state_key(vid) for vid in batch])):
+                if blob is not None:
+                    found[vid] = zlib.decompress(blob).decode()
+        return found
+    conn = _connection()
+    for batch in _batches(ids):
+        placeholders = ",".join("?" * len(batch))
+        for vid, blob in conn.execute(f"SELECT vector_id, text FROM chunks WHERE vector_id IN ({placeholders})", batch):
+            found[vid] = zlib.decompress(blob).decode()
+    return found
+
+
+def delete_many(ids: Iterable[str]) -> int:
+    if CHUNK_STORE_BACKEND == "state":
+        keys = [_state_key(vid) for vid in ids]
+        return get_state().delete(*keys) if keys else 0
+    conn = _connection()
+    with conn:
+        return conn.executemany("DELETE FROM chunks WHERE vector_id=?", [(vid,) for vid in ids]).rowcount
+
+
+def hydrate(matches: list) -> List[dict]:
+    """
+    Vector-store matches as {"id", "score", "metadata"} dicts with metadata["text"] filled
+    from the store. Matches whose text is in neither place are dropped.
+    """
+    matches = [
+        {"id": m.get("id"), "score": m.get("score", 0.0), "metadata": dict(m.get("metadata") or {})}
+        for m in matches
+    ]
+    texts = get_many(m["id"] for m in matches if not m["metadata"].get("text"))
+    hydrated, missing = [], 0
+    for m in matches:
+        if not m["metadata"].get("text"):
+            if m["id"] not in texts:
+                missing += 1
+                continue
+            m["metadata"]["text"] = texts[m["id"]]
+        hydrated.append(m)
+    if missing:
+        logger.warning(f"{missing} matched vector(s) have no text in the chunk store ({CHUNK_STORE_PATH})")
+    return hydrated
@@ -0,0 +1,193 @@
+"""
+Layout-aware chunking for lab reports.
+
+Each page is split into blocks: section headings, tables and plain paragraphs. A table
+keeps its column header, and the OCR column layout (a block of test names, then a block
+of "value unit range" lines under RESULT UNIT REF. RANGE) is re-joined into
+"NAME: value unit range" rows so a value is never embedded apart from its test name.
+Blocks are packed up to a token budget, preferring to cut at section boundaries; a table
+that has to be split repeats its header. There is no overlap between chunks.
+"""
+import os
+import re
+from typing import List
+
+from dotenv import load_dotenv
+from langchain_core.documents import Document
+
+from .lab_extraction import ROW_RE, NAME_RE, RESULT_HEADER_RE, TEST_HEADER_RE, find_column_table
+from ..utils import estimate_tokens
+
+load_dotenv()
+
+# "layout" (default) or "recursive" (the old fixed 500/100 character splitter)
+CHUNKER = os.getenv("CHUNKER", "layout")
+CHUNK_TOKEN_BUDGET = int(os.getenv("CHUNK_TOKEN_BUDGET", "200"))
+# Short upper-case lines opening a paragraph ("LIPID PROFILE") start a new section
+MAX_HEADING_WORDS = 6
+
+
+def _is_row(line: str) -> bool:
+    m = ROW_RE.match(line)
+    return bool(m and (m.group("unit") or m.group("low") is not None or m.group("op") is not None))
+
+
+def _is_heading(line: str) -> bool:
+    return bool(NAME_RE.match(line)) and len(line.split()) <= MAX_HEADING_WORDS
+
+
+def _is_table_header(line: str) -> bool:
+    return bool(RESULT_HEADER_RE.search(line) or TEST_HEADER_RE.match(line))
+
+
+def layout_blocks(text: str) -> List[dict]:
+    """Splits page text into {"kind": heading|table|text, "lines": [...], "header": str|None} blocks."""
+    lines, para_starts = [], set()
+    for paragraph in re.split(r"\n\s*\n", text):
+        para = [l.strip() for l in paragraph.splitlines() if l.strip()]
+        if para:
+            para_starts.add(len(lines))
+            lines.extend(para)
+
+    # 1. OCR column layout: re-join names with their values, emitted where the names were
+    consumed, anchor, merged = set(), None, []
+    table = find_column_table(lines)
+    if table:
+        consumed = {table["test_header"], table["result_header"]}
+        consumed.update(i for i, _ in table["headings"])
+        consumed.update(i for pair in table["pairs"] for i in pair[2:])
+        anchor = min(consumed)
+        merged = [{"kind": "heading", "lines": [name], "header": None} for _, name in table["headings"]]
+        merged.append({
+            "kind": "table",
+            "header": f"{lines[table['test_header']]}: {lines[table['result_header']]}",
+            "lines": [f"{name}: {lines[vi]}" for name, _, _, vi in table["pairs"]],
+        })
+
+    # 2. Everything else: single-line result rows become tables, the rest paragraphs
+    blocks, current = [], None
+
+    def flush():
+        nonlocal current
+        if current and current["lines"]:
+            blocks.append(current)
+        current = None
+
+    for i, line in enumerate(lines):
+        if i in consumed:
+            if i == anchor:
+                flush()
+                blocks.extend(merged)
+            continue
+        if _is_row(line):
+            if not current or current["kind"] != "table":
+                header = None
+                if current and current["kind"] == "text" and _is_table_header(current["lines"][-1]):
+                    header = current["lines"].pop()
+                flush()
+                current = {"kind": "table", "header": header, "lines": []}
+            current["lines"].append(line)
+            continue
+        if i in para_starts or (current and current["kind"] == "table"):
+            flush()
+        if i in para_starts and _is_heading(line) and not _is_table_header(line):
+            blocks.append({"kind": "heading", "lines": [line], "header": None})
+            continue
+        if current is None:
+            current = {"kind": "text", "lines": [], "header": None}
+        current["lines"].append(line)
+    flush()
+    return blocks
+
+
+def _sections(blocks: List[dict]) -> List[dict]:
+    sections = [{"heading": None, "blocks": []}]
+    for block in blocks:
+        if block["kind"] == "heading":
+            sections.append({"heading": block["lines"][0], "blocks": []})
+        else:
+            sections[-1]["blocks"].append(block)
+    return [s for s in sections if s["heading"] or s["blocks"]]
+
+
+def _split_long_line(line: str, budget: int) -> List[str]:
+    words, pieces, current = line.split(), [], []
+    for word in words:
+        if current and estimate_tokens(" ".join(current + [word])) > budget:
+            pieces.append(" ".join(current))
+            current = []
+        current.append(word)
+    if current:
+        pieces.append(" ".join(current))
+    return pieces
+
+
+def _block_pieces(block: dict, budget: int) -> List[str]:
+    """A block as one string, or as several when it exceeds the budget (tables repeat their header)."""
+    header = [block["header"]] if block["header"] else []
+    text = "\n".join(header + block["lines"])
+    if estimate_tokens(text) <= budget:
+        return [text]
+
+    pieces, current = [], list(header)
+    for line in block["lines"]:
+        for part in _split_long_line(line, budget - estimate_tokens("\n".join(header))):
+            if len(current) > len(header) and estimate_tokens("\n".join(current + [part])) > budget:
+                pieces.append("\n".join(current))
+                current = list(header)
+            current.append(part)
+    if len(current) > len(header):
+        pieces.append("\n".join(current))
+    return pieces
+
+
+def chunk_text(text: str, token_budget: int = None) -> List[str]:
+    """Packs a page's blocks into chunks of at most `token_budget` estimated tokens."""
+    budget = token_budget or CHUNK_TOKEN_BUDGET
+    chunks, current, headings = [], [], set()
+
+    def size(parts: List[str]) -> int:
+        return estimate_tokens("\n\n".join(parts)) if parts else 0
+
+    def flush():
+        # A chunk that is only headings carries no information of its own
+        if any(part not in headings for part in current):
+            chunks.append("\n\n".join(current))
+        current.clear()
+
+    for section in _sections(layout_blocks(text)):
+        heading = [section["heading"]] if section["heading"] else []
+        headings.update(heading)
+        whole = heading + ["\n".join(([b["header"]] if b["header"] else []) + b["lines"])
+                           for b in section["blocks"]]
+        # Start a section on a fresh chunk unless the whole section still fits
+        # (or what is pending is too small to stand alone)
+        if size(current) >= budget // 4 and size(current + whole) > budget:
+            flush()
+        current.extend(heading)
+        for block in section["blocks"]:
+            for piece in _block_pieces(block, budget - size(heading)):
+                if size(current + [piece]) > budget and any(part not in heading for part in current):
+                    flush()
+                    # Continuation chunks keep the section heading for context
+                    current.extend(heading)
+                current.append(piece)
+    flush()
+    return chunks
+
+
+def _recursive_chunks(documents: List[Document]) -> List[Document]:
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=100)
+    return splitter.split_documents(documents)
+
+
+def chunk_documents(documents: List[Document], chunker: str = None, token_budget: int = None) -> List[Document]:
+    """Chunks page documents; every chunk keeps its page's metadata."""
+    if (chunker or CHUNKER) == "recursive":
+        return _recursive_chunks(documents)
+    return [
+        Document(page_content=chunk, metadata=dict(doc.metadata))
+        for doc in documents
+        for chunk in chunk_text(doc.page_content, token_budget)
+    ]
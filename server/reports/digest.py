@@ -0,0 +1,186 @@
+"""
+Report digests: key findings, abnormal values and page references, generated once per
+report after ingestion instead of on every "summarize this report" question.
+
+With DIGEST_ENABLED, every upload (and bulk ingest) queues a job in the shared "digest"
+job queue. run_digest_worker, started by each API worker, pops jobs and builds the digest
+at "batch" priority, so it only uses LLM capacity that chat leaves free:
+
+  abnormal  the report's out-of-range lab_results rows, with their page (no LLM)
+  findings  bullet points written by the LLM from the report's page text, each citing its
+            page (the text is read back through the extracted-text cache, not re-OCR'd)
+
+Digests are stored in the `report_digests` collection, one per doc_id. First-turn summary
+questions in chat and the doctor review queue read them; without a digest (disabled, not
+generated yet, or generation failed) both fall back to the usual path.
+"""
+import os
+import time
+import asyncio
+import logging
+from typing import List, Optional
+
+from dotenv import load_dotenv
+
+from ..config.db import reports_collection, lab_results_collection, digests_collection
+from ..config.jobs import JobQueue
+from ..config.state import STATE_BACKEND
+from ..config.model_router import router
+from ..metrics import Counter, register, span
+from .storage import get_storage, report_key
+from .vectorstore import extract_documents
+
+load_dotenv()
+
+logger = logging.getLogger("MedRagnosis.digest")
+
+DIGEST_ENABLED = os.getenv("DIGEST_ENABLED", "false").lower() == "true"
+# How long an idle worker waits before checking the queue again
+DIGEST_POLL_SECONDS = float(os.getenv("DIGEST_POLL_SECONDS", "2"))
+# Page text sent to the LLM per report (about 4 characters per token)
+DIGEST_CONTEXT_CHARS = int(os.getenv("DIGEST_CONTEXT_CHARS", "12000"))
+
+DIGEST_JOBS = register(Counter(
+    "medragnosis_digest_jobs_total", "Report digest jobs by result (done/skipped/failed)."
+))
+
+digest_jobs = JobQueue("digest")
+
+digest_prompt = """You are a medical assistant AI called MedRagnosis.
+Summarize the medical report below for a doctor who is about to review it.
+List its key findings as 3 to 8 short bullet points starting with "- ", most important first.
+End each bullet point with the page it comes from, e.g. "(Page 2)".
+Only state what the report says; do not diagnose or recommend treatment.
+
+Report:
+{report}
+"""
+
+
+def enqueue_digest(doc_id: str) -> Optional[str]:
+    """Queues a digest for a freshly ingested report; returns the job id (None when disabled)."""
+    if not DIGEST_ENABLED:
+        return None
+    return digest_jobs.push("digest", doc_id=doc_id)
+
+
+def script_can_queue_digests() -> bool:
+    """
+    Whether a standalone script (bulk_ingest.py, reindex_reports.py) should queue digests.
+    With STATE_BACKEND=memory its queue dies with the process, so no worker would build them.
+    """
+    if DIGEST_ENABLED and STATE_BACKEND == "memory":
+        logger.warning("DIGEST_ENABLED is set but STATE_BACKEND=memory: this script's digest jobs would "
+                       "never reach the API workers, so none are queued (use STATE_BACKEND=redis)")
+        return False
+    return DIGEST_ENABLED
+
+
+def get_digest(doc_id: str) -> Optional[dict]:
+    return digests_collection.find_one({"doc_id": doc_id}, {"_id": 0})
+
+
+def attach_digests(records: List[dict]) -> List[dict]:
+    """Adds each record's report digest (findings and abnormal values), with one digests query."""
+    doc_ids = {r.get("doc_id") for r in records if r.get("doc_id") and r.get("doc_id") != "all-reports"}
+    digests = {}
+    if doc_ids:
+        for digest in digests_collection.find({"doc_id": {"$in": list(doc_ids)}},
+                                              {"_id": 0, "doc_id": 1, "findings": 1, "abnormal": 1}):
+            digests[digest.pop("doc_id")] = digest
+    for record in records:
+        if record.get("doc_id") in digests:
+            record["digest"] = digests[record["doc_id"]]
+    return records
+
+
+def _excerpt(pages: List[tuple]) -> str:
+    """Page-tagged report text, cut at DIGEST_CONTEXT_CHARS."""
+    parts, used = [], 0
+    for filename, page, text in pages:
+        part = f"[{filename}, Page {page}]\n{text.strip()}"
+        if used + len(part) > DIGEST_CONTEXT_CHARS:
+            parts.append(part[:max(DIGEST_CONTEXT_CHARS - used, 0)])
+            break
+        parts.append(part)
+        used += len(part) + 2
+    return "\n\n".join(p for p in parts if p)
+
+
+async def build_digest(doc_id: str) -> Optional[dict]:
+    """Generates and stores a report's digest. Returns None if the report no longer exists."""
+    reports = await asyncio.to_thread(
+        lambda: list(reports_collection.find({"doc_id": doc_id}).sort("uploaded_at", 1))
+    )
+    if not reports:
+        return None
+
+    storage = get_storage()
+    pages = []
+    for report in reports:
+        key = report_key(doc_id, report["filename"])
+        if not await storage.exists(key):
+            continue
+        async with storage.local_path(key) as path:
+            documents = await extract_documents(path, report["filename"])
+        pages.extend((report["filename"], d.metadata.get("page"), d.page_content)
+                     for d in documents if d.page_content.strip())
+
+    rows = await asyncio.to_thread(
+        lambda: list(lab_results_collection.find({"doc_id": doc_id}, {"_id": 0}))
+    )
+    abnormal = [
+        {field: row.get(field) for field in
+         ("test", "name", "value", "unit", "ref_low", "ref_high", "flag", "page", "source")}
+        for row in rows if row.get("flag") in ("high", "low")
+    ]
+
+    findings = ""
+    if pages:
+        with span("llm_generate"):
+            reply = await router.generate(
+                lambda llm: llm, digest_prompt.format(report=_excerpt(pages)),
+                priority="batch", user=reports[0]["uploader"]
+            )
+        findings = reply.content.strip()
+
+    digest = {
+        "doc_id": doc_id,
+        "uploader": reports[0]["uploader"],
+        "sources": [r["filename"] for r in reports],
+        "findings": findings,
+        "abnormal": abnormal,
+        "num_lab_results": len(rows),
+        "pages": len(pages),
+        "generated_at": time.time(),
+    }
+    await asyncio.to_thread(
+        digests_collection.update_one, {"doc_id": doc_id}, {"$set": digest}, upsert=True
+    )
+    return digest
+
+
+async def run_digest_job(job: dict):
+    doc_id = job["payload"]["doc_id"]
+    try:
+        digest = await build_digest(doc_id)
+    except asyncio.CancelledError:
+        digest_jobs.finish(job, error="worker stopped")
+        raise
+    except Exception as e:
+        logger.warning(f"Digest for report {doc_id} failed: {e}")
+        DIGEST_JOBS.inc(result="failed")
+        digest_jobs.finish(job, error=str(e))
+        return
+    DIGEST_JOBS.inc(result="done" if digest else "skipped")
+    digest_jobs.finish(job)
+
+
+async def run_digest_worker(poll_seconds: float = DIGEST_POLL_SECONDS):
+    """Works through the digest queue, one job at a time, until cancelled."""
+    while True:
+        job = await asyncio.to_thread(digest_jobs.pop)
+        if job is None:
+            await asyncio.sleep(poll_seconds)
+            continue
+        await run_digest_job(job)
@@ -0,0 +1,282 @@
+"""
+PDF text extraction with a per-page OCR decision.
+
+Pages are processed in parallel. Each page's text layer is read first; only pages that
+look scanned go to tesseract: too little text, or mostly covered by images with just a
+small text overlay (a stamp or header over a scan). Every page records how it was
+extracted and how long it took. Results are kept in the extracted-text cache, so a
+re-index never extracts the same file twice.
+
+OCR memory is bounded: poppler renders one page at a time into a temp directory and
+tesseract reads it from disk, so no page image is held in this process. DPI is lowered
+for oversized pages to stay under OCR_MAX_PAGE_PIXELS, and each document has a page and
+pixel allowance. The ceiling is about EXTRACTION_WORKERS pages being rendered at once.
+"""
+import os
+import re
+import sys
+import math
+import time
+import logging
+import resource
+import tempfile
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Optional
+
+from langchain_core.documents import Document
+
+from ..metrics import span, Counter, Gauge, register
+from . import text_cache
+
+logger = logging.getLogger("MedRagnosis.extraction")
+
+# A page with fewer characters of text than this is treated as scanned
+MIN_TEXT_LENGTH = int(os.getenv("OCR_MIN_PAGE_CHARS", "50"))
+# A page this much covered by images is a scan unless its text layer is substantial
+OCR_IMAGE_COVERAGE = float(os.getenv("OCR_IMAGE_COVERAGE", "0.5"))
+OCR_MAX_OVERLAY_CHARS = int(os.getenv("OCR_MAX_OVERLAY_CHARS", "300"))
+# Pages extracted/OCR'd at once per file (tesseract runs as a subprocess, so threads scale)
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", str(min(4, os.cpu_count() or 1))))
+OCR_DPI = int(os.getenv("OCR_DPI", "150"))
+OCR_CONFIG = r'--oem 1 --psm 6'
+# Memory limits: a page is rendered at a lower DPI rather than exceed OCR_MAX_PAGE_PIXELS
+# (12 MP is A4 at ~340 dpi); pages past either per-document cap keep their text layer only
+OCR_MAX_PAGE_PIXELS = int(os.getenv("OCR_MAX_PAGE_PIXELS", "12000000"))
+OCR_MAX_PAGES = int(os.getenv("OCR_MAX_PAGES", "300"))
+OCR_MAX_DOCUMENT_PIXELS = int(os.getenv("OCR_MAX_DOCUMENT_PIXELS", "1000000000"))
+# Part of the text cache key: bump when the extraction logic changes its output
+EXTRACTOR = (f"pypdf+tesseract/2:{MIN_TEXT_LENGTH}:{OCR_IMAGE_COVERAGE}:{OCR_MAX_OVERLAY_CHARS}"
+             f":{OCR_MAX_PAGE_PIXELS}")
+
+EXTRACTION_PEAK_RSS = register(Gauge(
+    "medragnosis_extraction_peak_rss_bytes", "Peak resident memory of the process after its last extraction."
+))
+OCR_LIMIT_HITS = register(Counter(
+    "medragnosis_ocr_limit_hits_total", "Files with pages left un-OCR'd because a per-document OCR cap was reached."
+))
+
+
+def analyze_page(page) -> tuple:
+    """Returns the page's text layer and the share of its area covered by images."""
+    resources = page.get("/Resources")
+    resources = resources.get_object() if resources is not None else {}
+    xobjects = resources.get("/XObject")
+    xobjects = xobjects.get_object() if xobjects is not None else {}
+    width, height = float(page.mediabox.width), float(page.mediabox.height)
+    image_area = 0.0
+
+    def visit(operator, operands, cm, tm):
+        nonlocal image_area
+        if operator == b"Do" and operands and operands[0] in xobjects:
+            if xobjects[operands[0]].get_object().get("/Subtype") == "/Image":
+                # Images are drawn into the unit square scaled by the current matrix
+                image_area += abs(cm[0] * cm[3] - cm[1] * cm[2])
+
+    text = page.extract_text(visitor_operand_before=visit) or ""
+    coverage = min(1.0, image_area / (width * height)) if width and height else 0.0
+    return text, coverage
+
+
+def needs_ocr(text: str, image_coverage: float) -> bool:
+    chars = len(text.strip())
+    if chars < MIN_TEXT_LENGTH:
+        return True
+    return image_coverage >= OCR_IMAGE_COVERAGE and chars < OCR_MAX_OVERLAY_CHARS
+
+
+def ocr_dpi(width: float, height: float) -> int:
+    """OCR_DPI, lowered for a page (size in points) that would render past OCR_MAX_PAGE_PIXELS."""
+    area = (width / 72) * (height / 72)
+    if area <= 0:
+        return OCR_DPI
+    return max(1, min(OCR_DPI, int(math.sqrt(OCR_MAX_PAGE_PIXELS / area))))
+
+
+def page_pixels(width: float, height: float, dpi: int) -> int:
+    return int(width / 72 * dpi) * int(height / 72 * dpi)
+
+
+class OcrBudget:
+    """A document's OCR allowance (pages and rendered pixels), shared by its page workers."""
+
+    def __init__(self):
+        self.pages, self.pixels = 0, 0
+        self.lock = threading.Lock()
+
+    def take(self, pixels: int) -> bool:
+        with self.lock:
+            if self.pages >= OCR_MAX_PAGES or self.pixels + pixels > OCR_MAX_DOCUMENT_PIXELS:
+                return False
+            self.pages += 1
+            self.pixels += pixels
+            return True
+
+
+def ocr_page(pdf_path: str, page_number: int, dpi: int = OCR_DPI) -> str:
+    """Rasterizes one page (1-based) to a temp file and OCRs it from disk."""
+    # OCR Imports (deferred: only scanned pages pay for them)
+    import pytesseract
+    from pdf2image import convert_from_path
+
+    with tempfile.TemporaryDirectory(prefix="medragnosis-ocr-") as tmp:
+        paths = convert_from_path(pdf_path, dpi=dpi, grayscale=True, first_page=page_number,
+                                  last_page=page_number, output_folder=tmp, paths_only=True)
+        return "\n".join(pytesseract.image_to_string(path, config=OCR_CONFIG) for path in paths)
+
+
+def peak_rss_bytes() -> int:
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _page_sizes(pdf_path: str) -> tuple:
+    """(page count, (width, height) in points) from poppler, for files pypdf cannot open."""
+    from pdf2image import pdfinfo_from_path
+    info = pdfinfo_from_path(pdf_path)
+    # pdfinfo reports the first page's size; scanned documents rarely mix page sizes
+    m = re.match(r"([\d.]+) x ([\d.]+)", info.get("Page size", ""))
+    return int(info["Pages"]), (float(m.group(1)), float(m.group(2))) if m else (612.0, 792.0)
+
+
+def _map_pages(fn, page_numbers: List[int]) -> list:
+    """Runs fn over the pages in a thread pool; each task keeps the caller's metrics context."""
+    if len(page_numbers) <= 1 or EXTRACTION_WORKERS <= 1:
+        return [fn(n) for n in page_numbers]
+    with ThreadPoolExecutor(max_workers=min(EXTRACTION_WORKERS, len(page_numbers))) as pool:
+        futures = [pool.submit(contextvars.copy_context().run, fn, n) for n in page_numbers]
+        return [f.result() for f in futures]
+
+
+def _page_document(text: str, source: str, page_number: int, method: str, started: float,
+                   **extra) -> Optional[Document]:
+    if not text.strip():
+        return None
+    return Document(page_content=text, metadata={
+        "page": page_number,
+        "source": source,
+        "extraction": method,
+        "extract_ms": round((time.perf_counter() - started) * 1000, 1),
+        **extra,
+    })
+
+
+def extract_text_with_ocr(pdf_path: str) -> tuple:
+    """
+    OCRs every page; used when the PDF cannot be parsed at all.
+    Returns (page documents, complete); pages past the OCR caps are left out.
+    """
+    page_total, (width, height) = _page_sizes(pdf_path)
+    dpi = ocr_dpi(width, height)
+    budget, skipped = OcrBudget(), []
+
+    def run(page_number: int) -> Optional[Document]:
+        started = time.perf_counter()
+        if not budget.take(page_pixels(width, height, dpi)):
+            skipped.append(page_number)
+            return None
+        with span("ocr"):
+            text = ocr_page(pdf_path, page_number, dpi)
+        return _page_document(text, Path(pdf_path).name, page_number, "ocr", started, ocr_dpi=dpi)
+
+    documents = [d for d in _map_pages(run, list(range(1, page_total + 1))) if d]
+    return documents, not skipped
+
+
+def _extract(save_path: str, filename: str) -> tuple:
+    """
+    Returns (page documents, complete). Incomplete results (an OCR failure, or pages past
+    the OCR caps) are not cached, so the file is extracted again next time.
+    """
+    from pypdf import PdfReader
+
+    # 1. Open the text layer; a file pypdf cannot parse is OCR'd whole
+    try:
+        page_total = len(PdfReader(save_path).pages)
+    except Exception as e:
+        logger.warning(f"Standard load failed for {filename}: {e}. Switching to OCR...")
+        try:
+            return extract_text_with_ocr(save_path)
+        except Exception as e:
+            logger.warning(f"OCR failed for {filename}: {e}")
+            return [], False
+
+    # pypdf readers are not thread-safe: one per worker thread
+    local = threading.local()
+    budget, failures, skipped = OcrBudget(), [], []
+
+    def reader():
+        if not hasattr(local, "reader"):
+            local.reader = PdfReader(save_path)
+        return local.reader
+
+    # 2. Per page: text layer first, OCR only when the page looks scanned
+    def run(page_number: int) -> Optional[Document]:
+        started = time.perf_counter()
+        with span("text_extraction"):
+            try:
+                page = reader().pages[page_number - 1]
+                width, height = float(page.mediabox.width), float(page.mediabox.height)
+                text, coverage = analyze_page(page)
+            except Exception as e:
+                logger.warning(f"Text extraction failed for page {page_number} of {filename}: {e}")
+                width, height, text, coverage = 612.0, 792.0, "", 0.0
+        if not needs_ocr(text, coverage):
+            return _page_document(text, filename, page_number, "text", started)
+
+        dpi = ocr_dpi(width, height)
+        if not budget.take(page_pixels(width, height, dpi)):
+            skipped.append(page_number)
+            return _page_document(text, filename, page_number, "text", started)
+        try:
+            with span("ocr"):
+                ocr_text = ocr_page(save_path, page_number, dpi)
+        except Exception as e:
+            logger.warning(f"OCR failed for page {page_number} of {filename}: {e}")
+            failures.append(page_number)
+            return _page_document(text, filename, page_number, "text", started)
+        return _page_document(ocr_text, filename, page_number, "ocr", started, ocr_dpi=dpi)
+
+    documents = [d for d in _map_pages(run, list(range(1, page_total + 1))) if d]
+
+    ocr_pages = sum(1 for d in documents if d.metadata["extraction"] == "ocr")
+    if ocr_pages:
+        logger.info(f"OCR used for {ocr_pages}/{page_total} page(s) of {filename} "
+                    f"(peak RSS {peak_rss_bytes() / (1024 * 1024):.0f} MB)")
+    if skipped:
+        OCR_LIMIT_HITS.inc()
+        logger.warning(f"OCR limit reached for {filename}: {len(skipped)} page(s) kept their text layer only")
+    return documents, not (failures or skipped)
+
+
+def _cached_extract(save_path: str, filename: str) -> List[Document]:
+    with span("extraction"):
+        if not text_cache.TEXT_CACHE_ENABLED:
+            return _extract(save_path, filename)[0]
+
+        key = (text_cache.file_sha256(save_path), EXTRACTOR, OCR_CONFIG, OCR_DPI)
+        documents = text_cache.get(*key)
+        if documents is not None:
+            for doc in documents:
+                doc.metadata["source"] = filename
+            return documents
+
+        documents, complete = _extract(save_path, filename)
+        if documents and complete:
+            text_cache.put(*key, documents)
+        return documents
+
+
+def load_documents(save_path: str, filename: str) -> List[Document]:
+    """
+    Extracts one document per page from a saved PDF, OCR'ing only the pages that need it.
+    Blocking and free of network clients, so it can run in a thread or a worker process.
+    """
+    save_path = str(save_path)
+    try:
+        return _cached_extract(save_path, filename)
+    finally:
+        EXTRACTION_PEAK_RSS.set(peak_rss_bytes())
@@ -0,0 +1,138 @@
+import asyncio
+from typing import List
+
+from ..config.db import reports_collection, lab_results_collection, digests_collection
+from ..config.services import get_index, get_embed_model, call, index_name_for
+from .vectorstore import extract_documents, index_documents, INDEX_VERSION
+from .storage import get_storage, report_key
+from .digest import enqueue_digest
+from . import text_cache, chunk_store
+
+# Pinecone accepts at most 1000 ids per delete call
+DELETE_BATCH_SIZE = 1000
+
+
+def vector_ids_for(report: dict) -> List[str]:
+    """Vector ids owned by a `reports` record, including pre-versioning `{doc_id}-{i}` ids."""
+    if report.get("vector_ids"):
+        return list(report["vector_ids"])
+    return [f"{report['doc_id']}-{i}" for i in range(report.get("num_chunks", 0))]
+
+
+async def delete_vectors(ids: List[str], index_name: str = None, keep_chunks: set = frozenset()):
+    """Deletes vectors from an index, and their chunk text unless a live vector shares the id."""
+    index = get_index(index_name)
+    for start in range(0, len(ids), DELETE_BATCH_SIZE):
+        batch = ids[start:start + DELETE_BATCH_SIZE]
+        await call("pinecone", index.delete, ids=batch)
+        await asyncio.to_thread(chunk_store.delete_many, [vid for vid in batch if vid not in keep_chunks])
+
+
+async def delete_report(doc_id: str) -> dict:
+    """
+    Removes a report's vectors, stored files, cached extracted text, `reports` records, lab results
+    and digest.
+    Diagnosis history is kept as the audit trail; it already renders missing reports as "Unknown File".
+    """
+    reports = await asyncio.to_thread(lambda: list(reports_collection.find({"doc_id": doc_id})))
+
+    ids = []
+    for report in reports:
+        report_ids = vector_ids_for(report)
+        await delete_vectors(report_ids, index_name_for(report))
+        ids.extend(report_ids)
+
+    storage = get_storage()
+    files_deleted = 0
+    for report in reports:
+        key = report_key(doc_id, report["filename"])
+        sha256 = report.get("sha256")
+        if await storage.exists(key):
+            if not sha256:
+                # Records written before the hash was stored on them
+                async with storage.local_path(key) as path:
+                    sha256 = await asyncio.to_thread(text_cache.file_sha256, str(path))
+            await storage.delete(key)
+            files_deleted += 1
+        if sha256:
+            await asyncio.to_thread(text_cache.forget, sha256)
+
+    lab = await asyncio.to_thread(lab_results_collection.delete_many, {"doc_id": doc_id})
+    await asyncio.to_thread(reports_collection.delete_many, {"doc_id": doc_id})
+    await asyncio.to_thread(digests_collection.delete_many, {"doc_id": doc_id})
+
+    return {
+        "doc_id": doc_id,
+        "vectors_deleted": len(ids),
+        "files_deleted": files_deleted,
+        "lab_results_deleted": lab.deleted_count,
+    }
+
+
+async def reindex_report(doc_id: str, version: int = INDEX_VERSION, embed_model=None,
+                         refresh_digest: bool = True) -> dict:
+    """
+    Re-extracts and re-embeds every file of a report under `version`.
+    New vectors are written next to the live ones (or into the new index, e.g. after an
+    embedding dimension change), the `reports` record is flipped to the new version
+    (queries follow it), and only then are the old vectors deleted from the old index.
+    The digest is then queued again, so it describes the new extraction.
+    """
+    reports = await asyncio.to_thread(
+        lambda: list(reports_collection.find({"doc_id": doc_id}).sort("uploaded_at", 1))
+    )
+    if not reports:
+        raise FileNotFoundError(f"Report {doc_id} not found")
+
+    embed_model = embed_model or get_embed_model()
+    storage = get_storage()
+    reindexed = 0
+    for position, report in enumerate(reports):
+        filename = report["filename"]
+        key = report_key(doc_id, filename)
+        if not await storage.exists(key):
+            raise FileNotFoundError(f"File for report {doc_id} ({filename}) not found on server")
+
+        async with storage.local_path(key) as path:
+            documents = await extract_documents(path, filename)
+        if not documents:
+            continue
+
+        file_index = report.get("file_index", position)
+        indexed = await index_documents(
+            documents, filename, doc_id, report["uploader"], report["uploaded_at"],
+            embed_model, file_index=file_index, version=version,
+        )
+        if not indexed:
+            continue
+
+        # Cutover: readers switch to the new vectors as soon as the record flips
+        new_ids = set(indexed["vector_ids"])
+        old_index = index_name_for(report)
+        moved = old_index != indexed["vector_index"]
+        old_ids = [vid for vid in vector_ids_for(report) if moved or vid not in new_ids]
+        await asyncio.to_thread(
+            reports_collection.update_one,
+            {"_id": report["_id"]},
+            {"$set": {**indexed, "file_index": file_index}}
+        )
+        await delete_vectors(old_ids, old_index, keep_chunks=new_ids)
+        reindexed += 1
+
+    if reindexed and refresh_digest:
+        await asyncio.to_thread(enqueue_digest, doc_id)
+    return {"doc_id": doc_id, "index_version": version, "files_reindexed": reindexed}
+
+
+def reports_needing_reindex(version: int = INDEX_VERSION, limit: int = 0) -> List[str]:
+    """doc_ids whose records are not yet on `version` (oldest uploads first)."""
+    cursor = reports_collection.find(
+        {"index_version": {"$ne": version}}, {"doc_id": 1}
+    ).sort("uploaded_at", 1)
+    doc_ids = []
+    for report in cursor:
+        if report["doc_id"] not in doc_ids:
+            doc_ids.append(report["doc_id"])
+            if limit and len(doc_ids) >= limit:
+                break
+    return doc_ids
@@ -0,0 +1,189 @@
+import re
+from datetime import datetime
+from typing import List, Optional
+
+from langchain_core.documents import Document
+
+# A number such as 165, 71.2 or 0.6
+_NUM = r"\d+(?:\.\d+)?"
+# Units start with a letter, % or µ (mg/dL, mmol/L, x10^9/L, %, U/L, fL ...)
+_UNIT = r"[A-Za-z%µμ][A-Za-z0-9%µμ/^.]*"
+# Reference ranges: "130 - 239", "35-85", "< 200", "> 60"
+_RANGE = rf"(?:(?P<low>{_NUM})\s*-\s*(?P<high>{_NUM})|(?P<op>[<>])\s*(?P<bound>{_NUM}))"
+_FLAG = r"(?:H|L|HIGH|LOW|High|Low|\*)"
+
+# Single-line layout: "TOTAL CHOLESTEROL  165  mg/dL  130 - 239  H"
+ROW_RE = re.compile(
+    rf"^(?P<name>[A-Za-z][A-Za-z0-9 ()/,.%&-]*?[A-Za-z)])\s*:?\s+"
+    rf"(?P<value>{_NUM})\s*(?P<unit>{_UNIT})?\s*(?:{_RANGE})?\s*(?:{_UNIT})?\s*{_FLAG}?\s*$"
+)
+# Column layout (OCR of table reports): the values block is "165 mg/dL 130 - 239"
+VALUE_RE = re.compile(rf"^(?P<value>{_NUM})\s*(?P<unit>{_UNIT})?\s*(?:{_RANGE})?")
+# Test names in a names block are upper-case words without digits
+NAME_RE = re.compile(r"^[A-Z][A-Z ()/,.&-]*[A-Z)]$")
+
+RESULT_HEADER_RE = re.compile(r"\bRESULT\b.*\b(UNIT|RANGE)\b", re.IGNORECASE)
+TEST_HEADER_RE = re.compile(r"^(TEST|TEST NAME|TEST DESCRIPTION|INVESTIGATION|PARAMETER)S?$", re.IGNORECASE)
+
+DATE_LABEL_RE = re.compile(
+    r"(Collected|Collection|Sample|Reported|Report|Received)\s*(Time|Date|On)?\s*:?\s*"
+    r"(?P<date>\d{1,2}[\s/.-][A-Za-z]{3,9}[\s,/.-]+\d{4}|\d{1,2}[/.-]\d{1,2}[/.-]\d{2,4}|\d{4}-\d{2}-\d{2})",
+    re.IGNORECASE,
+)
+_DATE_FORMATS = ["%d %b, %Y", "%d %b %Y", "%d %B, %Y", "%d %B %Y", "%d-%b-%Y", "%d/%m/%Y", "%d.%m.%Y",
+                 "%d-%m-%Y", "%d/%m/%y", "%Y-%m-%d"]
+
+# Lines that look like "NAME value unit" but are report furniture, not results
+_NOT_TESTS = {"age", "age & gender", "iso", "page", "receipt no", "patient id", "ref", "tel", "phone"}
+
+
+def normalize_test_name(name: str) -> str:
+    """Canonical key for a test name: 'HDL / LDL RATIO' -> 'hdl/ldl ratio'."""
+    key = re.sub(r"\s*/\s*", "/", name.strip().lower())
+    key = re.sub(r"[^a-z0-9/%() .-]", " ", key)
+    return re.sub(r"\s+", " ", key).strip(" .:-")
+
+
+def _parse_range(match: re.Match) -> tuple:
+    if match.group("low") is not None:
+        return float(match.group("low")), float(match.group("high"))
+    if match.group("op") == "<":
+        return None, float(match.group("bound"))
+    if match.group("op") == ">":
+        return float(match.group("bound")), None
+    return None, None
+
+
+def _flag(value: float, low: Optional[float], high: Optional[float]) -> Optional[str]:
+    if low is None and high is None:
+        return None
+    if low is not None and value < low:
+        return "low"
+    if high is not None and value > high:
+        return "high"
+    return "normal"
+
+
+def _build_row(name: str, match: re.Match, page: Optional[int]) -> dict:
+    value = float(match.group("value"))
+    low, high = _parse_range(match)
+    return {
+        "test": normalize_test_name(name),
+        "name": name.strip(),
+        "value": value,
+        "unit": match.group("unit"),
+        "ref_low": low,
+        "ref_high": high,
+        "flag": _flag(value, low, high),
+        "page": page,
+    }
+
+
+def _parse_rows(lines: List[str], page: Optional[int]) -> List[dict]:
+    rows = []
+    for line in lines:
+        m = ROW_RE.match(line)
+        if not m or normalize_test_name(m.group("name")) in _NOT_TESTS:
+            continue
+        # Need a unit or a range, otherwise "ISO 9001"-style lines slip through
+        if not m.group("unit") and m.group("low") is None and m.group("op") is None:
+            continue
+        rows.append(_build_row(m.group("name"), m, page))
+    return rows
+
+
+def find_column_table(lines: List[str]) -> Optional[dict]:
+    """
+    Locates a block of test names and the block of values after a 'RESULT UNIT REF. RANGE'
+    header, which is how OCR reads tabular lab reports. Returns the line indices of both
+    headers, the leading names without a value (section headings such as "LIPID PROFILE")
+    and the (name, value match, name index, value index) pairs.
+    """
+    test_header = None
+    names = []
+    in_names = False
+    for i, line in enumerate(lines):
+        if TEST_HEADER_RE.match(line):
+            in_names = True
+            test_header = i
+            continue
+        if in_names:
+            if RESULT_HEADER_RE.search(line):
+                break
+            if NAME_RE.match(line):
+                names.append((i, line))
+            elif names:
+                break
+
+    result_header = None
+    values = []
+    in_values = False
+    for i, line in enumerate(lines):
+        if RESULT_HEADER_RE.search(line):
+            in_values = True
+            result_header = i
+            continue
+        if in_values:
+            m = VALUE_RE.match(line)
+            if not m:
+                break
+            values.append((i, m))
+
+    if not names or not values or len(names) < len(values):
+        return None
+    # Leading names without a value are section headings ("LIPID PROFILE")
+    split = len(names) - len(values)
+    return {
+        "test_header": test_header,
+        "result_header": result_header,
+        "headings": names[:split],
+        "pairs": [(name, m, ni, vi) for (ni, name), (vi, m) in zip(names[split:], values)],
+    }
+
+
+def _parse_columns(lines: List[str], page: Optional[int]) -> List[dict]:
+    table = find_column_table(lines)
+    if not table:
+        return []
+    return [_build_row(name, m, page) for name, m, _, _ in table["pairs"]]
+
+
+def parse_lab_results(text: str, page: Optional[int] = None) -> List[dict]:
+    """Extracts test name / value / unit / reference range rows from report text."""
+    lines = [l.strip() for l in text.splitlines() if l.strip()]
+    rows = _parse_rows(lines, page)
+    if not rows:
+        rows = _parse_columns(lines, page)
+
+    seen = set()
+    unique = []
+    for row in rows:
+        if row["test"] not in seen:
+            seen.add(row["test"])
+            unique.append(row)
+    return unique
+
+
+def extract_report_date(text: str) -> Optional[float]:
+    """Returns the collection/report date printed on the report as a timestamp, if any."""
+    for m in DATE_LABEL_RE.finditer(text):
+        raw = re.sub(r"\s+", " ", m.group("date")).strip()
+        for fmt in _DATE_FORMATS:
+            try:
+                return datetime.strptime(raw, fmt).timestamp()
+            except ValueError:
+                continue
+    return None
+
+
+def extract_lab_results(documents: List[Document]) -> List[dict]:
+    """Parses lab rows from every page; a test seen on an earlier page wins."""
+    results = []
+    seen = set()
+    for doc in documents:
+        page = doc.metadata.get("page")
+        for row in parse_lab_results(doc.page_content, page=page):
+            if row["test"] not in seen:
+                seen.add(row["test"])
+                results.append(row)
+    return results
@@ -0,0 +1,301 @@
+"""
+Self-hosted vector index (VECTOR_BACKEND=local) with quantized scanning.
+
+Mirrors the subset of pinecone.Index we use (upsert / query / delete with metadata
+filters, dot-product scores). Full float32 vectors live in SQLite on disk; memory holds
+only the scan codes chosen by VECTOR_STORAGE:
+
+  float32  exact scan (4 bytes per dimension)
+  int8     per-vector scaled int8 codes (1 byte per dimension)
+  binary   sign bits (1 bit per dimension), scored by Hamming similarity
+
+Quantized scans over-fetch VECTOR_RESCORE_FACTOR x top_k candidates, and those are
+rescored exactly against their float vectors read from disk. The codes are rebuilt from
+the stored floats at startup, so switching VECTOR_STORAGE needs no migration.
+
+Several workers on one node can share an index file: every write is also appended to a
+change log, and before each query a worker reloads the rows other workers changed since
+its last look. Filters on doc_id or uploader are narrowed through an in-memory posting
+list before the remaining conditions are checked row by row.
+"""
+import os
+import json
+import uuid
+import sqlite3
+import threading
+from typing import List, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", "./vector_index")
+VECTOR_STORAGE = os.getenv("VECTOR_STORAGE", "int8")
+DEFAULT_RESCORE_FACTORS = {"float32": 1, "int8": 4, "binary": 10}
+VECTOR_RESCORE_FACTOR = int(os.getenv("VECTOR_RESCORE_FACTOR", "0"))  # 0: the storage mode's default
+# Rows converted to float per step of a quantized scan (bounds the scan's scratch memory)
+SCAN_BLOCK_ROWS = 8192
+# Change log entries kept for other workers; one that falls further behind reloads everything
+CHANGE_LOG_ROWS = 100_000
+# Metadata fields with posting lists (equality and $in filters on them skip the full scan)
+INDEXED_FIELDS = ("doc_id", "uploader")
+# Bound parameters per SQLite statement
+SQL_BATCH_SIZE = 500
+
+FILTER_OPS = {
+    "$eq": lambda value, arg: value == arg,
+    "$ne": lambda value, arg: value != arg,
+    "$in": lambda value, arg: value in arg,
+    "$nin": lambda value, arg: value not in arg,
+    "$gt": lambda value, arg: value is not None and value > arg,
+    "$gte": lambda value, arg: value is not None and value >= arg,
+    "$lt": lambda value, arg: value is not None and value < arg,
+    "$lte": lambda value, arg: value is not None and value <= arg,
+}
+
+
+def matches_filter(doc: dict, flt: Optional[dict]) -> bool:
+    """Mongo/Pinecone-style filter: equality or {"$op": arg} conditions, all ANDed."""
+    for key, cond in (flt or {}).items():
+        value = doc.get(key)
+        if isinstance(cond, dict):
+            if not all(FILTER_OPS[op](value, arg) for op, arg in cond.items()):
+                return False
+        elif value != cond:
+            return False
+    return True
+
+
+def quantize(vectors: np.ndarray, storage: str) -> tuple:
+    """(codes, scales) for float32 rows; scales is None except for int8."""
+    if storage == "float32":
+        return vectors.astype(np.float32), None
+    if storage == "int8":
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+    if storage == "binary":
+        return np.packbits(vectors > 0, axis=1), None
+    raise ValueError(f"Unknown VECTOR_STORAGE {storage!r} (float32, int8 or binary)")
+
+
+class LocalVectorIndex:
+    def __init__(self, path: str, storage: str = VECTOR_STORAGE, rescore_factor: int = VECTOR_RESCORE_FACTOR):
+        quantize(np.zeros((1, 8), dtype=np.float32), storage)  # validates the mode
+        self.storage = storage
+        self.rescore_factor = rescore_factor or DEFAULT_RESCORE_FACTORS[storage]
+        self._lock = threading.Lock()
+        # Tags this instance's change log entries, so it does not reload its own writes
+        self._origin = uuid.uuid4().hex
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        if path != ":memory:":
+            self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS vectors (id TEXT PRIMARY KEY, metadata TEXT, vector BLOB)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS changes "
+                         "(seq INTEGER PRIMARY KEY AUTOINCREMENT, id TEXT NOT NULL, origin TEXT NOT NULL)")
+        self._db.commit()
+        self._load()
+
+    def _load(self):
+        """(Re)builds the scan state from every stored vector."""
+        # Scan state: row i of the code matrix is self._ids[i] (None once deleted). New
+        # batches wait in _pending and are stacked, dropping deleted rows, before a scan.
+        self._ids, self._metadata, self._rows = [], [], {}
+        self._postings = {field: {} for field in INDEXED_FIELDS}
+        self._codes, self._scales = None, None
+        self._pending, self._dirty = [], False
+        # Read first: changes made during the load are applied again on the next sync
+        self._seq = self._db.execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0]
+        cursor = self._db.execute("SELECT id, metadata, vector FROM vectors")
+        while batch := cursor.fetchmany(4096):
+            vectors = np.stack([np.frombuffer(blob, dtype=np.float32) for _, _, blob in batch])
+            self._append([vid for vid, _, _ in batch], [json.loads(md) for _, md, _ in batch], vectors)
+
+    def _append(self, ids: List[str], metadatas: List[dict], vectors: np.ndarray):
+        codes, scales = quantize(vectors, self.storage)
+        self._pending.append((codes, scales if scales is not None else np.ones(len(ids), dtype=np.float32)))
+        for vid, md in zip(ids, metadatas):
+            if vid in self._rows:
+                self._ids[self._rows[vid]] = None
+            row = self._rows[vid] = len(self._ids)
+            self._ids.append(vid)
+            self._metadata.append(md)
+            self._post(row, md)
+        self._dirty = True
+
+    def _post(self, row: int, md: dict):
+        for field in INDEXED_FIELDS:
+            value = md.get(field)
+            if isinstance(value, (str, int, float)):
+                self._postings[field].setdefault(value, []).append(row)
+
+    def _remove(self, ids: List[str]):
+        for vid in ids:
+            row = self._rows.pop(vid, None)
+            if row is not None:
+                self._ids[row] = None
+        self._dirty = True
+
+    def _compact(self):
+        """Stacks pending batches into the scan matrix and drops deleted rows."""
+        parts = ([(self._codes, self._scales)] if self._codes is not None else []) + self._pending
+        self._pending, self._dirty = [], False
+        if not parts:
+            return
+        codes = np.concatenate([c for c, _ in parts])
+        scales = np.concatenate([sc for _, sc in parts])
+        live = np.asarray([vid is not None for vid in self._ids], dtype=bool)
+        if not live.all():
+            codes, scales = codes[live], scales[live]
+            self._ids = [vid for vid in self._ids if vid is not None]
+            self._metadata = [md for md, keep in zip(self._metadata, live) if keep]
+            self._rows = {vid: i for i, vid in enumerate(self._ids)}
+            # Row numbers changed: rebuild the posting lists
+            self._postings = {field: {} for field in INDEXED_FIELDS}
+            for row, md in enumerate(self._metadata):
+                self._post(row, md)
+        self._codes, self._scales = (codes, scales) if len(codes) else (None, None)
+
+    def _log(self, ids: List[str]):
+        """Records changed ids for the other workers (inside the caller's transaction)."""
+        self._db.executemany("INSERT INTO changes (id, origin) VALUES (?, ?)", [(vid, self._origin) for vid in ids])
+        self._db.execute("DELETE FROM changes WHERE seq <= (SELECT MAX(seq) FROM changes) - ?", (CHANGE_LOG_ROWS,))
+
+    def _sync(self):
+        """Applies the rows other workers upserted or deleted since the last sync."""
+        latest, oldest = self._db.execute("SELECT COALESCE(MAX(seq), 0), MIN(seq) FROM changes").fetchone()
+        if latest <= self._seq:
+            return
+        if oldest is not None and oldest > self._seq + 1:
+            # The entries this instance has not seen were pruned
+            self._load()
+            return
+        changed = [vid for (vid,) in self._db.execute(
+            "SELECT DISTINCT id FROM changes WHERE seq > ? AND seq <= ? AND origin != ?",
+            (self._seq, latest, self._origin)
+        )]
+        self._seq = latest
+        for start in range(0, len(changed), SQL_BATCH_SIZE):
+            batch = changed[start:start + SQL_BATCH_SIZE]
+            placeholders = ",".join("?" * len(batch))
+            stored = self._db.execute(
+                f"SELECT id, metadata, vector FROM vectors WHERE id IN ({placeholders})", batch
+            ).fetchall()
+            self._remove(list(set(batch) - {vid for vid, _, _ in stored}))
+            if stored:
+                vectors = np.stack([np.frombuffer(blob, dtype=np.float32) for _, _, blob in stored])
+                self._append([vid for vid, _, _ in stored], [json.loads(md) for _, md, _ in stored], vectors)
+
+    def _candidates(self, flt: dict) -> np.ndarray:
+        """Rows that can match a filter, from the posting list of its first indexed field."""
+        for field in INDEXED_FIELDS:
+            cond = flt.get(field)
+            if cond is None:
+                continue
+            if not isinstance(cond, dict):
+                values = [cond]
+            elif "$eq" in cond:
+                values = [cond["$eq"]]
+            elif "$in" in cond:
+                values = cond["$in"]
+            else:
+                continue
+            postings = self._postings[field]
+            rows = [row for value in values for row in postings.get(value, ())]
+            return np.unique(np.asarray(rows, dtype=np.int64))
+        return np.arange(len(self._ids))
+
+    def upsert(self, vectors, **kwargs):
+        vectors = list(vectors)
+        if not vectors:
+            return {"upserted_count": 0}
+        values = np.asarray([v for _, v, _ in vectors], dtype=np.float32)
+        with self._lock:
+            with self._db:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO vectors VALUES (?, ?, ?)",
+                    [(vid, json.dumps(md), values[i].tobytes()) for i, (vid, _, md) in enumerate(vectors)]
+                )
+                self._log([vid for vid, _, _ in vectors])
+            self._append([vid for vid, _, _ in vectors], [dict(md) for _, _, md in vectors], values)
+        return {"upserted_count": len(vectors)}
+
+    def delete(self, ids=None, **kwargs):
+        ids = list(ids or [])
+        with self._lock:
+            with self._db:
+                self._db.executemany("DELETE FROM vectors WHERE id=?", [(vid,) for vid in ids])
+                self._log(ids)
+            self._remove(ids)
+
+    def _approximate(self, rows: Optional[np.ndarray], query: np.ndarray) -> np.ndarray:
+        """Approximate scores of the given rows (None: all rows), a block at a time."""
+        total = len(self._codes) if rows is None else len(rows)
+        bits = np.packbits(query > 0) if self.storage == "binary" else None
+        scores = np.empty(total, dtype=np.float32)
+        for start in range(0, total, SCAN_BLOCK_ROWS):
+            block = slice(start, start + SCAN_BLOCK_ROWS)
+            index = block if rows is None else rows[block]
+            codes = self._codes[index]
+            if bits is not None:
+                hamming = np.bitwise_count(np.bitwise_xor(codes, bits)).sum(axis=1, dtype=np.int32)
+                scores[block] = query.shape[0] - 2 * hamming
+            else:
+                scores[block] = (codes.astype(np.float32, copy=False) @ query) * self._scales[index]
+        return scores
+
+    def query(self, vector, top_k: int = 10, include_metadata: bool = False, filter: dict = None, **kwargs):
+        query = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            self._sync()
+            if self._dirty:
+                self._compact()
+            if self._codes is None:
+                return {"matches": []}
+            rows = None
+            if filter:
+                rows = np.asarray([i for i in self._candidates(filter) if matches_filter(self._metadata[i], filter)],
+                                  dtype=np.int64)
+                if not len(rows):
+                    return {"matches": []}
+
+            scores = self._approximate(rows, query)
+            rows = np.arange(len(self._ids)) if rows is None else rows
+            fetch = min(len(rows), top_k * self.rescore_factor)
+            shortlist = np.argpartition(-scores, fetch - 1)[:fetch] if fetch < len(rows) else np.arange(len(rows))
+            ids = [self._ids[i] for i in rows[shortlist]]
+            metadata = {vid: self._metadata[i] for vid, i in zip(ids, rows[shortlist])}
+
+            # Exact rescoring of the shortlist against the stored float vectors
+            if self.storage == "float32":
+                exact = scores[shortlist]
+            else:
+                placeholders = ",".join("?" * len(ids))
+                stored = dict(self._db.execute(f"SELECT id, vector FROM vectors WHERE id IN ({placeholders})", ids))
+                exact = np.stack([np.frombuffer(stored[vid], dtype=np.float32) for vid in ids]) @ query
+
+        order = np.argsort(-exact)[:top_k]
+        return {"matches": [
+            {"id": ids[i], "score": float(exact[i]), "metadata": metadata[ids[i]] if include_metadata else {}}
+            for i in order
+        ]}
+
+    def memory_bytes(self) -> int:
+        """Bytes held by the in-memory scan codes."""
+        with self._lock:
+            self._sync()
+            if self._dirty:
+                self._compact()
+            if self._codes is None:
+                return 0
+            return self._codes.nbytes + (self._scales.nbytes if self.storage == "int8" else 0)
+
+    def __len__(self):
+        return len(self._rows)
+
+
+def open_index(name: str) -> LocalVectorIndex:
+    return LocalVectorIndex(os.path.join(LOCAL_INDEX_DIR, f"{name}.sqlite"))
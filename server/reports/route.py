@@ -1,21 +1,22 @@
 from fastapi import APIRouter, Depends, UploadFile, File, HTTPException
-from fastapi.responses import FileResponse
+from fastapi.responses import StreamingResponse
 from ..auth.route import get_current_user 
+from ..admission import admit
 from .vectorstore import load_vectorstore
+from .indexing import delete_report, reindex_report
+from .storage import get_storage, report_key
+from .digest import enqueue_digest, get_digest
 import uuid
-import os
-from pathlib import Path
+import asyncio
 from typing import List
+from urllib.parse import quote
 from ..config.db import reports_collection
 
 router = APIRouter(prefix="/reports", tags=["reports"])
 
-# Configuration (Must match vectorstore.py)
-UPLOAD_DIR = os.getenv("UPLOAD_DIR", "./uploaded_reports")
-
 @router.post("/upload")
 async def upload_reports(
-    user=Depends(get_current_user),
+    user=Depends(admit("upload")),
     files: List[UploadFile] = File(...)
 ):
     if user["role"] != "patient":
@@ -23,6 +24,8 @@ async def upload_reports(
     
     doc_id = str(uuid.uuid4())
     await load_vectorstore(files, uploaded=user["username"], doc_id=doc_id)
+    # Summary generated in the background, at low LLM priority
+    enqueue_digest(doc_id)
     return {"message": "Uploaded and indexed", "doc_id": doc_id}
 
 #NEW VIEW ENDPOINT
@@ -44,13 +47,75 @@ async def view_report(
 
 
     filename = report["filename"]
-    file_path = Path(UPLOAD_DIR) / f"{doc_id}_{filename}"
+    storage = get_storage()
+    key = report_key(doc_id, filename)
 
-    if not file_path.exists():
+    if not await storage.exists(key):
         raise HTTPException(status_code=404, detail="File not found on server")
 
-    return FileResponse(
-        path=file_path, 
-        filename=filename, 
-        media_type='application/pdf'
-    )
\ No newline at end of file
+    # Streamed in chunks (decompressed on the fly), never read whole into memory
+    quoted = quote(filename)
+    disposition = (f'attachment; filename="{filename}"' if quoted == filename
+                   else f"attachment; filename*=utf-8''{quoted}")
+    return StreamingResponse(
+        storage.stream(key),
+        media_type='application/pdf',
+        headers={"Content-Disposition": disposition}
+    )
+
+@router.get("/{doc_id}/digest")
+async def report_digest(
+    doc_id: str,
+    user=Depends(get_current_user)
+):
+    """
+    The report's precomputed digest: key findings, abnormal values and page references.
+    """
+    report = await asyncio.to_thread(reports_collection.find_one, {"doc_id": doc_id})
+    if not report:
+        raise HTTPException(status_code=404, detail="Report metadata not found")
+
+    if user["role"] != "doctor" and user["username"] != report["uploader"]:
+        raise HTTPException(status_code=403, detail="Unauthorized to view this report")
+
+    digest = await asyncio.to_thread(get_digest, doc_id)
+    if not digest:
+        raise HTTPException(status_code=404, detail="No digest for this report yet")
+    return digest
+
+@router.delete("/{doc_id}")
+async def delete_report_endpoint(
+    doc_id: str,
+    user=Depends(get_current_user)
+):
+    """
+    Deletes a report everywhere: vectors, stored file, report metadata and lab results.
+    """
+    report = await asyncio.to_thread(reports_collection.find_one, {"doc_id": doc_id})
+    if not report:
+        raise HTTPException(status_code=404, detail="Report metadata not found")
+
+    if user["username"] != report["uploader"]:
+        raise HTTPException(status_code=403, detail="Only the uploader can delete this report")
+
+    return await delete_report(doc_id)
+
+@router.post("/{doc_id}/reindex")
+async def reindex_report_endpoint(
+    doc_id: str,
+    user=Depends(admit("reindex"))
+):
+    """
+    Re-extracts and re-embeds a report with the current chunker/embedding version.
+    """
+    report = await asyncio.to_thread(reports_collection.find_one, {"doc_id": doc_id})
+    if not report:
+        raise HTTPException(status_code=404, detail="Report metadata not found")
+
+    if user["role"] != "doctor" and user["username"] != report["uploader"]:
+        raise HTTPException(status_code=403, detail="Unauthorized to re-index this report")
+
+    try:
+        return await reindex_report(doc_id)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
@@ -0,0 +1,292 @@
+"""
+Storage for uploaded report files.
+
+Every worker reads and writes report files through `get_storage()`, never through paths
+under UPLOAD_DIR directly. STORAGE_BACKEND selects the store:
+
+  local  files under UPLOAD_DIR; with several workers or replicas, a volume they all
+         mount (NFS, EFS, a Kubernetes ReadWriteMany claim)
+  s3     objects in S3_BUCKET under S3_PREFIX (`pip install boto3`); S3_ENDPOINT_URL
+         points it at MinIO or another S3-compatible store
+
+Files are spread over STORAGE_SHARD_DEPTH levels of hash-prefix directories
+(`3f/a2/{doc_id}_{filename}`), so no directory or listing page grows with the archive.
+With STORAGE_COMPRESSION=gzip a file is stored gzipped (with a `.gz` suffix) when that
+makes it at least 5% smaller; scanned PDFs rarely shrink and are kept as they are.
+Reads decompress transparently, and flat files from before sharding are still found.
+
+The methods are coroutines; blocking file and network I/O runs in threads.
+"""
+import os
+import gzip
+import zlib
+import asyncio
+import hashlib
+import tempfile
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import AsyncIterator, Iterator, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local")
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "./uploaded_reports")
+STORAGE_SHARD_DEPTH = int(os.getenv("STORAGE_SHARD_DEPTH", "2"))
+STORAGE_COMPRESSION = os.getenv("STORAGE_COMPRESSION", "none")
+S3_BUCKET = os.getenv("S3_BUCKET", "")
+S3_PREFIX = os.getenv("S3_PREFIX", "reports/")
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL") or None
+
+CHUNK_SIZE = 256 * 1024
+GZ = ".gz"
+
+_storage = None
+
+
+def report_key(doc_id: str, filename: str) -> str:
+    """Storage key of one uploaded file of a report."""
+    return f"{doc_id}_{filename}"
+
+
+def shard(key: str, depth: int = STORAGE_SHARD_DEPTH) -> str:
+    """`key` under `depth` levels of two-hex-digit directories taken from its hash."""
+    digest = hashlib.sha1(key.encode()).hexdigest()
+    return "/".join([digest[2 * i:2 * i + 2] for i in range(depth)] + [key])
+
+
+def _key_of(name: str) -> str:
+    name = name.rsplit("/", 1)[-1]
+    return name[:-len(GZ)] if name.endswith(GZ) else name
+
+
+class Storage:
+    """
+    Keyed file store. Backends implement the blocking primitives on stored names
+    (`_find`, `_put`, `_chunks`, `_remove`, `_names`); encoding, sharding and async are here.
+    """
+
+    def __init__(self, shard_depth: int = STORAGE_SHARD_DEPTH, compression: str = STORAGE_COMPRESSION):
+        if compression not in ("none", "gzip"):
+            raise ValueError(f"Unknown STORAGE_COMPRESSION {compression!r} (none, gzip)")
+        self.shard_depth = shard_depth
+        self.compression = compression
+
+    def _name(self, key: str) -> str:
+        return shard(key, self.shard_depth)
+
+    def _find(self, key: str) -> Optional[Tuple[str, bool]]:
+        """(stored name, gzipped) of the key's file, or None."""
+        raise NotImplementedError
+
+    def _put(self, name: str, data: bytes):
+        raise NotImplementedError
+
+    def _chunks(self, name: str) -> Iterator[bytes]:
+        raise NotImplementedError
+
+    def _remove(self, name: str):
+        raise NotImplementedError
+
+    def _names(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def _save(self, key: str, data: bytes):
+        name, packed = self._name(key), data
+        if self.compression == "gzip":
+            candidate = gzip.compress(data, compresslevel=6, mtime=0)
+            if len(candidate) < 0.95 * len(data):
+                name, packed = name + GZ, candidate
+        previous = self._find(key)
+        self._put(name, packed)
+        if previous and previous[0] != name:
+            self._remove(previous[0])  # the other encoding, or a pre-sharding flat file
+
+    def _decoded(self, key: str) -> Iterator[bytes]:
+        found = self._find(key)
+        if found is None:
+            raise FileNotFoundError(key)
+        name, gzipped = found
+        decompressor = zlib.decompressobj(wbits=31) if gzipped else None
+        for chunk in self._chunks(name):
+            yield decompressor.decompress(chunk) if decompressor else chunk
+        if decompressor:
+            yield decompressor.flush()
+
+    async def save(self, key: str, data: bytes):
+        await asyncio.to_thread(self._save, key, data)
+
+    async def copy_from(self, key: str, source: str):
+        """Stores a local file under `key`."""
+        await asyncio.to_thread(lambda: self._save(key, Path(source).read_bytes()))
+
+    async def exists(self, key: str) -> bool:
+        return await asyncio.to_thread(self._find, key) is not None
+
+    async def stream(self, key: str) -> AsyncIterator[bytes]:
+        """The file's bytes in chunks, without reading it whole; raises FileNotFoundError."""
+        chunks = self._decoded(key)
+        try:
+            while True:
+                chunk = await asyncio.to_thread(next, chunks, None)
+                if chunk is None:
+                    return
+                if chunk:
+                    yield chunk
+        finally:
+            chunks.close()  # closes the file or response body if the reader stopped early
+
+    async def read(self, key: str) -> bytes:
+        return await asyncio.to_thread(lambda: b"".join(self._decoded(key)))
+
+    @asynccontextmanager
+    async def local_path(self, key: str):
+        """A local filesystem path holding the file (a temporary copy unless stored as is)."""
+        suffix = Path(key).suffix
+        fd, tmp = tempfile.mkstemp(suffix=suffix)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                async for chunk in self.stream(key):
+                    await asyncio.to_thread(f.write, chunk)
+            yield Path(tmp)
+        finally:
+            os.unlink(tmp)
+
+    async def delete(self, key: str) -> bool:
+        def remove():
+            found = self._find(key)
+            if found is not None:
+                self._remove(found[0])
+            return found is not None
+        return await asyncio.to_thread(remove)
+
+    async def keys(self) -> List[str]:
+        return await asyncio.to_thread(lambda: sorted({_key_of(n) for n in self._names()}))
+
+
+class LocalStorage(Storage):
+    """Files under a directory."""
+
+    def __init__(self, root: str = UPLOAD_DIR, **kwargs):
+        super().__init__(**kwargs)
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _find(self, key: str):
+        name = self._name(key)
+        for candidate, gzipped in ((name, False), (name + GZ, True), (key, False)):
+            if (self.root / candidate).is_file():
+                return candidate, gzipped
+        return None
+
+    def _put(self, name: str, data: bytes):
+        # Written under a temporary name and renamed, so no reader sees a partial file
+        path = self.root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".partial-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def _chunks(self, name: str):
+        with open(self.root / name, "rb") as f:
+            while chunk := f.read(CHUNK_SIZE):
+                yield chunk
+
+    def _remove(self, name: str):
+        # Emptied shard directories are kept; another worker may be writing into one
+        (self.root / name).unlink(missing_ok=True)
+
+    def _names(self):
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if not filename.startswith(".partial-"):
+                    yield Path(dirpath, filename).relative_to(self.root).as_posix()
+
+    @asynccontextmanager
+    async def local_path(self, key: str):
+        found = await asyncio.to_thread(self._find, key)
+        if found is None:
+            raise FileNotFoundError(key)
+        if found[1]:
+            async with super().local_path(key) as path:
+                yield path
+        else:
+            yield self.root / found[0]
+
+
+class S3Storage(Storage):
+    """Objects in an S3 bucket. `client` is a boto3 S3 client or anything with the same methods."""
+
+    def __init__(self, bucket: str = S3_BUCKET, prefix: str = S3_PREFIX, client=None, **kwargs):
+        super().__init__(**kwargs)
+        if client is None:
+            import boto3
+            client = boto3.client("s3", endpoint_url=S3_ENDPOINT_URL)
+        if not bucket:
+            raise ValueError("S3_BUCKET is required with STORAGE_BACKEND=s3")
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def _name(self, key: str) -> str:
+        return self.prefix + super()._name(key)
+
+    def _find(self, key: str):
+        # One listing call answers both encodings (and never raises for a missing key)
+        name = self._name(key)
+        listed = self.client.list_objects_v2(Bucket=self.bucket, Prefix=name, MaxKeys=2)
+        stored = {obj["Key"] for obj in listed.get("Contents", [])}
+        if name in stored:
+            return name, False
+        if name + GZ in stored:
+            return name + GZ, True
+        return None
+
+    def _put(self, name: str, data: bytes):
+        self.client.put_object(Bucket=self.bucket, Key=name, Body=data)
+
+    def _chunks(self, name: str):
+        body = self.client.get_object(Bucket=self.bucket, Key=name)["Body"]
+        try:
+            while chunk := body.read(CHUNK_SIZE):
+                yield chunk
+        finally:
+            body.close()
+
+    def _remove(self, name: str):
+        self.client.delete_object(Bucket=self.bucket, Key=name)
+
+    def _names(self):
+        kwargs = {"Bucket": self.bucket, "Prefix": self.prefix}
+        while True:
+            listed = self.client.list_objects_v2(**kwargs)
+            for obj in listed.get("Contents", []):
+                yield obj["Key"]
+            if not listed.get("IsTruncated"):
+                return
+            kwargs["ContinuationToken"] = listed["NextContinuationToken"]
+
+
+def get_storage() -> Storage:
+    """The process-wide report file store (created on first use)."""
+    global _storage
+    if _storage is None:
+        if STORAGE_BACKEND == "local":
+            _storage = LocalStorage()
+        elif STORAGE_BACKEND == "s3":
+            _storage = S3Storage()
+        else:
+            raise ValueError(f"Unknown STORAGE_BACKEND {STORAGE_BACKEND!r} (local, s3)")
+    return _storage
+
+
+def use_storage(storage: Storage):
+    """Installs a store in place of the configured one (e.g. a temporary directory in tests)."""
+    global _storage
+    _storage = storage
@@ -0,0 +1,175 @@
+"""
+Disk cache of extracted page text.
+
+OCR is the slowest part of ingestion, so every file's extracted pages are kept in a
+SQLite file, zlib-compressed, keyed by (file SHA-256, extractor, tesseract config, dpi).
+Re-indexing, a chunker change or an embedding migration then reads the text back instead
+of re-OCR'ing. Least recently used entries are evicted past TEXT_CACHE_MAX_MB;
+purge_text_cache.py trims or clears the cache by hand.
+"""
+import os
+import json
+import time
+import zlib
+import logging
+import sqlite3
+import hashlib
+from contextlib import contextmanager
+from typing import Iterable, List, Optional
+
+from dotenv import load_dotenv
+from langchain_core.documents import Document
+
+from ..metrics import Counter, register
+
+load_dotenv()
+
+logger = logging.getLogger("MedRagnosis.text_cache")
+
+TEXT_CACHE_ENABLED = os.getenv("TEXT_CACHE_ENABLED", "true").lower() == "true"
+TEXT_CACHE_PATH = os.getenv("TEXT_CACHE_PATH", "./extracted_text.sqlite")
+TEXT_CACHE_MAX_MB = float(os.getenv("TEXT_CACHE_MAX_MB", "1024"))
+
+TEXT_CACHE_LOOKUPS = register(Counter(
+    "medragnosis_text_cache_lookups_total", "Extracted-text cache lookups by result (hit/miss)."
+))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS extracted_text (
+    sha256 TEXT NOT NULL,
+    extractor TEXT NOT NULL,
+    ocr_config TEXT NOT NULL,
+    dpi INTEGER NOT NULL,
+    pages BLOB NOT NULL,
+    page_count INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (sha256, extractor, ocr_config, dpi)
+);
+CREATE INDEX IF NOT EXISTS extracted_text_last_used ON extracted_text (last_used);
+"""
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+@contextmanager
+def _connect():
+    # One short-lived connection per call: safe from worker threads and bulk-ingest processes
+    conn = sqlite3.connect(TEXT_CACHE_PATH, timeout=30)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def _encode(documents: List[Document]) -> bytes:
+    pages = [{"page_content": d.page_content, "metadata": d.metadata} for d in documents]
+    return zlib.compress(json.dumps(pages).encode(), 6)
+
+
+def _decode(blob: bytes) -> List[Document]:
+    return [Document(**page) for page in json.loads(zlib.decompress(blob))]
+
+
+def get(sha256: str, extractor: str, ocr_config: str, dpi: int) -> Optional[List[Document]]:
+    """The cached pages for this file and extractor settings, or None."""
+    key = (sha256, extractor, ocr_config, dpi)
+    try:
+        with _connect() as conn:
+            row = conn.execute(
+                "SELECT pages FROM extracted_text WHERE sha256=? AND extractor=? AND ocr_config=? AND dpi=?", key
+            ).fetchone()
+            if row:
+                conn.execute(
+                    "UPDATE extracted_text SET last_used=? WHERE sha256=? AND extractor=? AND ocr_config=? AND dpi=?",
+                    (time.time(), *key)
+                )
+    except sqlite3.Error as e:
+        logger.warning(f"Text cache read failed: {e}")
+        return None
+    TEXT_CACHE_LOOKUPS.inc(result="hit" if row else "miss")
+    return _decode(row[0]) if row else None
+
+
+def put(sha256: str, extractor: str, ocr_config: str, dpi: int, documents: List[Document]):
+    """Stores a file's extracted pages, then evicts old entries past TEXT_CACHE_MAX_MB."""
+    blob = _encode(documents)
+    now = time.time()
+    try:
+        with _connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO extracted_text VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (sha256, extractor, ocr_config, dpi, blob, len(documents), len(blob), now, now)
+            )
+        purge(max_bytes=int(TEXT_CACHE_MAX_MB * 1024 * 1024))
+    except sqlite3.Error as e:
+        logger.warning(f"Text cache write failed: {e}")
+
+
+def forget(sha256: str) -> int:
+    """Drops every entry for a file's content (e.g. when its report is deleted)."""
+    try:
+        with _connect() as conn:
+            return conn.execute("DELETE FROM extracted_text WHERE sha256=?", (sha256,)).rowcount
+    except sqlite3.Error as e:
+        logger.warning(f"Text cache delete failed: {e}")
+        return 0
+
+
+def purge(max_bytes: int = None, older_than: float = None, keep: Iterable[str] = None,
+          everything: bool = False) -> int:
+    """
+    Removes entries: all of them, those unused for `older_than` seconds, those whose
+    file hash is not in `keep`, and then the least recently used until under `max_bytes`.
+    Returns the number removed.
+    """
+    removed = 0
+    with _connect() as conn:
+        if everything:
+            return conn.execute("DELETE FROM extracted_text").rowcount
+        if older_than is not None:
+            removed += conn.execute(
+                "DELETE FROM extracted_text WHERE last_used < ?", (time.time() - older_than,)
+            ).rowcount
+        if keep is not None:
+            keep = set(keep)
+            stale = [(h,) for (h,) in conn.execute("SELECT DISTINCT sha256 FROM extracted_text") if h not in keep]
+            removed += conn.executemany("DELETE FROM extracted_text WHERE sha256=?", stale).rowcount
+        if max_bytes is not None:
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM extracted_text").fetchone()[0]
+            if total > max_bytes:
+                evict = []
+                for rowid, size in conn.execute("SELECT rowid, size FROM extracted_text ORDER BY last_used"):
+                    if total <= max_bytes:
+                        break
+                    evict.append((rowid,))
+                    total -= size
+                removed += conn.executemany("DELETE FROM extracted_text WHERE rowid=?", evict).rowcount
+    return removed
+
+
+def compact():
+    """Returns space freed by purged entries to the filesystem."""
+    conn = sqlite3.connect(TEXT_CACHE_PATH, timeout=30)
+    try:
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+
+
+def stats() -> dict:
+    with _connect() as conn:
+        entries, pages, size = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(page_count), 0), COALESCE(SUM(size), 0) FROM extracted_text"
+        ).fetchone()
+    return {"entries": entries, "pages": pages, "bytes": size}
@@ -1,123 +1,149 @@
 import os
 import time
 import asyncio
+import hashlib
 from pathlib import Path
+from typing import List, Optional
 from dotenv import load_dotenv
-from pinecone import Pinecone, ServerlessSpec
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings
 from langchain_core.documents import Document 
-
-from ..config.db import reports_collection
-from typing import List
 from fastapi import UploadFile
 
-# OCR Imports 
-import pytesseract
-from pdf2image import convert_from_path
+from ..config.db import reports_collection, lab_results_collection
+from ..config.services import (
+    get_index, get_embed_model, call, index_name_for, EMBED_MODEL, EMBED_DIMENSION, PINECONE_INDEX_NAME
+)
+from .lab_extraction import extract_lab_results, extract_report_date
+from .chunking import chunk_documents, CHUNKER
+from . import chunk_store
+from .storage import get_storage, report_key
+from ..metrics import span
 
 load_dotenv()
 
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
-PINECONE_ENV = os.getenv("PINECONE_ENV", "us-east-1")
-PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX_NAME", "medragnosis-index")
-UPLOAD_DIR = os.getenv("UPLOAD_DIR", "./uploaded_reports")
-
-os.environ["OPENAI_API_KEY"] = OPENAI_API_KEY
-os.makedirs(UPLOAD_DIR, exist_ok=True)
-
-# Initialize Pinecone
-pc = Pinecone(api_key=PINECONE_API_KEY)
-spec = ServerlessSpec(cloud="aws", region=PINECONE_ENV)
-existing_indexes = [i["name"] for i in pc.list_indexes()]
-
-if PINECONE_INDEX_NAME not in existing_indexes:
-    pc.create_index(name=PINECONE_INDEX_NAME, dimension=1536, metric="dotproduct", spec=spec)
-    while not pc.describe_index(PINECONE_INDEX_NAME).status["ready"]:
-        time.sleep(1)
-
-index = pc.Index(PINECONE_INDEX_NAME)
-
-def extract_text_with_ocr(pdf_path: str) -> List[Document]:
-    """Fallback function to extract text from scanned PDFs using OCR."""
-    images = convert_from_path(pdf_path, dpi=150, grayscale=True) 
-    docs = []
-    custom_config = r'--oem 1 --psm 6'
-    
-    for i, image in enumerate(images):
-        page_content = pytesseract.image_to_string(image, config=custom_config)
-        if page_content.strip():
-            docs.append(Document(
-                page_content=page_content,
-                metadata={"page": i + 1, "source": Path(pdf_path).name}
-            ))
-    return docs
+# Bump when the chunker or embedding model changes; reindex_reports.py migrates old reports
+# (2: layout-aware chunker, 3: chunk text moved from vector metadata to the chunk store)
+INDEX_VERSION = int(os.getenv("INDEX_VERSION", "3"))
+
+def vector_id(doc_id: str, version: int, file_index: int, chunk_index: int) -> str:
+    """Versioned vector id, so a re-embed can write next to the live vectors before cutover."""
+    return f"{doc_id}-v{version}-{file_index}-{chunk_index}"
+
+async def extract_documents(save_path: Path, filename: str) -> List[Document]:
+    """Extracts page documents from a saved PDF, falling back to OCR for scanned files."""
+    from .extraction import load_documents
+    return await asyncio.to_thread(load_documents, str(save_path), filename)
+
+async def index_documents(
+    documents: List[Document],
+    filename: str,
+    doc_id: str,
+    uploaded: str,
+    uploaded_at: float,
+    embed_model,
+    file_index: int = 0,
+    version: int = INDEX_VERSION,
+) -> Optional[dict]:
+    """
+    Extracts lab values, chunks, embeds and upserts one file's documents.
+    Returns the fields to store on its `reports` record, or None if nothing was indexed.
+    """
+    # 3. Structured lab values (answers direct lookups without the LLM)
+    with span("lab_extraction"):
+        lab_rows = extract_lab_results(documents)
+    with span("mongo_insert"):
+        await asyncio.to_thread(lab_results_collection.delete_many, {"doc_id": doc_id, "source": filename})
+        if lab_rows:
+            report_date = extract_report_date("\n".join(d.page_content for d in documents)) or uploaded_at
+            await asyncio.to_thread(lab_results_collection.insert_many, [
+                {**row, "uploader": uploaded, "doc_id": doc_id, "source": filename, "report_date": report_date}
+                for row in lab_rows
+            ])
+
+    # 4. Chunk and Embed
+    with span("chunk"):
+        chunks = chunk_documents(documents)
+
+    if not chunks:
+        return None
+
+    texts = [chunk.page_content for chunk in chunks]
+    ids = [vector_id(doc_id, version, file_index, i) for i in range(len(chunks))]
+    # Only filter and citation fields go to the index; the text lives in the chunk store
+    metadatas = [
+        {
+            "source": filename,
+            "doc_id": doc_id,
+            "uploader": uploaded,
+            "page": chunk.metadata.get("page", None),
+            "uploaded_at": uploaded_at,
+            "index_version": version,
+        }
+        for chunk in chunks
+    ]
+
+    with span("embed"):
+        embeddings = await call("openai", embed_model.embed_documents, texts)
+    # Stored before the upsert, so a query never sees a vector without its text
+    with span("chunk_store"):
+        await asyncio.to_thread(chunk_store.put_many, ids, texts)
+    indexed = {
+        "num_chunks": len(chunks),
+        "num_lab_results": len(lab_rows),
+        "vector_ids": ids,
+        "index_version": version,
+        "embed_model": EMBED_MODEL,
+        "embed_dimension": EMBED_DIMENSION,
+        "vector_index": PINECONE_INDEX_NAME,
+        "chunker": CHUNKER,
+    }
+    # Written where queries will look for them, resolved from the record like every read
+    with span("vector_upsert"):
+        await call("pinecone", get_index(index_name_for(indexed)).upsert, vectors=list(zip(ids, embeddings, metadatas)))
+
+    return indexed
+
+def report_record(doc_id: str, filename: str, uploaded: str, file_index: int,
+                  uploaded_at: float, indexed: dict, sha256: str = None) -> dict:
+    """
+    The `reports` document written for every ingested file (API upload and bulk ingest).
+    `sha256` is the file's content hash, its key in the extracted-text cache.
+    """
+    return {
+        "doc_id": doc_id,
+        "filename": filename,
+        "uploader": uploaded,
+        "file_index": file_index,
+        "uploaded_at": uploaded_at,
+        "sha256": sha256,
+        **indexed
+    }
 
 async def load_vectorstore(uploaded_files: List[UploadFile], uploaded: str, doc_id: str):
-    embed_model = OpenAIEmbeddings(model="text-embedding-3-small", api_key=OPENAI_API_KEY)
+    embed_model = get_embed_model()
+    storage = get_storage()
 
-    for file in uploaded_files:
+    for file_index, file in enumerate(uploaded_files):
         filename = Path(file.filename).name
-        save_path = Path(UPLOAD_DIR) / f"{doc_id}_{filename}"
-        content = await file.read()
-        with open(save_path, "wb") as f:
-            f.write(content)
-
-        # 1. Try standard text extraction
-        try:
-            loader = PyPDFLoader(str(save_path))
-            documents = loader.load()
-        except Exception as e:
-            print(f"Standard load failed for {filename}: {e}")
-            documents = []
-
-        # 2. Check if text extraction worked; if not, use OCR
-        total_text_length = sum(len(doc.page_content.strip()) for doc in documents)
-        
-        if total_text_length < 50:
-            print(f"Detected scanned PDF for the {filename}. Switching to OCR...")
-            try:
-                documents = await asyncio.to_thread(extract_text_with_ocr, str(save_path))
-            except Exception as e:
-                print(f"OCR failed for the {filename}: {e}")
-                continue
-
+        key = report_key(doc_id, filename)
+        with span("file_save"):
+            content = await file.read()
+            await storage.save(key, content)
+        sha256 = await asyncio.to_thread(lambda: hashlib.sha256(content).hexdigest())
+
+        async with storage.local_path(key) as save_path:
+            documents = await extract_documents(save_path, filename)
         if not documents:
             continue
 
-        # 3. Chunk and Embed
-        splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=100)
-        chunks = splitter.split_documents(documents)
-
-        if not chunks:
+        uploaded_at = time.time()
+        indexed = await index_documents(
+            documents, filename, doc_id, uploaded, uploaded_at, embed_model, file_index=file_index
+        )
+        if not indexed:
             continue
 
-        texts = [chunk.page_content for chunk in chunks]
-        ids = [f"{doc_id}-{i}" for i in range(len(chunks))]
-        metadatas = [
-            {
-                "source": filename,
-                "doc_id": doc_id,
-                "uploader": uploaded,
-                "page": chunk.metadata.get("page", None),
-                "text": chunk.page_content[:2000]
-            }
-            for chunk in chunks
-        ]
-
-        embeddings = await asyncio.to_thread(embed_model.embed_documents, texts)
-
-        def upsert():
-            index.upsert(vectors=list(zip(ids, embeddings, metadatas)))
-
-        await asyncio.to_thread(upsert)
-
-        reports_collection.insert_one({
-            "doc_id": doc_id,
-            "filename": filename,
-            "uploader": uploaded,
-            "num_chunks": len(chunks),
-            "uploaded_at": time.time()
-        })
\ No newline at end of file
+        with span("mongo_insert"):
+            await asyncio.to_thread(
+                reports_collection.insert_one,
+                report_record(doc_id, filename, uploaded, file_index, uploaded_at, indexed, sha256)
+            )
\ No newline at end of file
@@ -0,0 +1,7 @@
+"""Small helpers shared by ingestion (server/reports) and query time (server/diagnosis)."""
+import math
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token) used for budget packing."""
+    return max(1, math.ceil(len(text) / 4))
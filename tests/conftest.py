@@ -0,0 +1,7 @@
+import os
+
+# jwt_handler refuses to import without a signing key; tests never see a real one
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+
+# Extraction tests must not write the extracted-text cache into the working tree
+os.environ.setdefault("TEXT_CACHE_ENABLED", "false")
@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from server.admission import AdmissionController
+from server.config.state import MemoryState
+
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch):
+    monkeypatch.setattr("server.config.state._state", MemoryState())
+
+
+# 1. Test per-user limits shed at once, and queued requests are admitted in order as units free up
+def test_user_limit_and_fifo_queue():
+    async def scenario():
+        controller = AdmissionController(capacity=4, user_capacity=3, queue_size=2, queue_timeout=5)
+        await controller.acquire("heavy", "upload", 3)
+        with pytest.raises(HTTPException) as shed:
+            await controller.acquire("heavy", "chat", 1)
+        assert shed.value.status_code == 429 and shed.value.headers["Retry-After"] == "1"
+
+        await controller.acquire("a", "chat", 1)
+        admitted = []
+
+        async def waiter(user, weight):
+            await controller.acquire(user, "longitudinal", weight)
+            admitted.append(user)
+        waiters = [asyncio.create_task(waiter("b", 2)), asyncio.create_task(waiter("c", 1))]
+        await asyncio.sleep(0)
+        with pytest.raises(HTTPException) as full:
+            await controller.acquire("d", "chat", 1)
+        assert full.value.status_code == 503
+
+        await controller.release("a", 1, held_seconds=2.0)
+        await asyncio.sleep(0)
+        assert admitted == []  # b needs 2 units and c may not overtake it
+        await controller.release("heavy", 3, held_seconds=2.0)
+        await asyncio.gather(*waiters)
+        assert admitted == ["b", "c"] and controller.in_use == 3
+    asyncio.run(scenario())
+
+
+# 2. Test a request that waits past its deadline gets 503 and leaves no units behind
+def test_queue_timeout():
+    async def scenario():
+        controller = AdmissionController(capacity=1, user_capacity=1, queue_size=4, queue_timeout=0.05)
+        await controller.acquire("a", "chat", 1)
+        with pytest.raises(HTTPException) as timed_out:
+            await controller.acquire("b", "chat", 1)
+        assert timed_out.value.status_code == 503 and "Retry-After" in timed_out.value.headers
+        await controller.release("a", 1)
+        await controller.acquire("b", "chat", 1)
+        assert controller.in_use == 1
+    asyncio.run(scenario())
+
+
+# 3. Test the per-user limit holds across workers sharing one state
+def test_user_limit_across_workers():
+    async def scenario():
+        workers = [AdmissionController(capacity=8, user_capacity=2) for _ in range(2)]
+        await workers[0].acquire("a", "chat", 1)
+        await workers[1].acquire("a", "chat", 1)
+        with pytest.raises(HTTPException) as shed:
+            await workers[1].acquire("a", "chat", 1)
+        assert shed.value.status_code == 429
+        await workers[0].release("a", 1)
+        await workers[1].acquire("a", "chat", 1)
+        assert [w.in_use for w in workers] == [0, 2]
+    asyncio.run(scenario())
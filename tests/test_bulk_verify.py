@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from benchmarks.fakes import FakeCollection
+from server.diagnosis import review_feed, route
+from server.reports import digest
+from server.models.db_models import BulkVerificationRequest
+
+DOCTOR = {"username": "dr_house", "role": "doctor"}
+
+
+# 1. Test one bulk request reviews valid records and reports invalid, duplicate and unknown ids per item
+def test_bulk_verify(monkeypatch):
+    diagnoses = FakeCollection("diagnosis_history")
+    monkeypatch.setattr(route, "diagnosis_collection", diagnoses)
+    first = str(diagnoses.insert_one({"verification_status": "pending"}).inserted_id)
+    second = str(diagnoses.insert_one({"verification_status": "pending"}).inserted_id)
+    unknown = "0123456789ab0123456789ab"
+
+    req = BulkVerificationRequest(items=[
+        {"record_id": first, "status": "approved", "note": "Routine"},
+        {"record_id": "not-an-id", "status": "approved", "note": "Routine"},
+        {"record_id": second, "status": "rejected", "note": "Recheck LDL"},
+        {"record_id": first, "status": "rejected", "note": "Changed my mind"},
+        {"record_id": unknown, "status": "approved", "note": "Routine"},
+    ])
+    response = route.verify_diagnoses_bulk(req, user=DOCTOR)
+    assert response["updated"] == 2
+    assert [r["result"] for r in response["results"]] == ["updated", "invalid_id", "updated", "duplicate", "not_found"]
+
+    records = {str(d["_id"]): d for d in diagnoses.find()}
+    assert records[first]["verification_status"] == "approved" and records[first]["verified_by"] == "dr_house"
+    assert records[second]["doctor_note"] == "Recheck LDL" and records[second]["updated_at"]
+
+    with pytest.raises(HTTPException) as denied:
+        route.verify_diagnoses_bulk(req, user={"username": "p", "role": "patient"})
+    assert denied.value.status_code == 403
+
+
+# 2. Test a bulk review reaches feed subscribers with one query for all reopened records
+def test_bulk_verify_publishes(monkeypatch):
+    diagnoses, reports = FakeCollection("diagnosis_history"), FakeCollection("reports")
+    reports.insert_one({"doc_id": "doc-1", "filename": "lipids.pdf"})
+    monkeypatch.setattr(route, "diagnosis_collection", diagnoses)
+    monkeypatch.setattr(review_feed, "reports_collection", reports)
+    monkeypatch.setattr(digest, "digests_collection", FakeCollection("report_digests"))
+    ids = [str(diagnoses.insert_one({"doc_id": "doc-1", "verification_status": "approved"}).inserted_id)
+           for _ in range(3)]
+    queries = []
+    find = diagnoses.find
+    monkeypatch.setattr(diagnoses, "find", lambda *args, **kwargs: queries.append(args) or find(*args, **kwargs))
+
+    async def scenario():
+        feed = review_feed.ReviewFeed(source="poll", poll_seconds=60)
+        monkeypatch.setattr(route, "review_feed", feed)
+        async with feed.subscribe() as queue:
+            req = BulkVerificationRequest(items=[
+                {"record_id": ids[0], "status": "pending", "note": "Reopened"},
+                {"record_id": ids[1], "status": "pending", "note": "Reopened"},
+                {"record_id": ids[2], "status": "rejected", "note": "Recheck LDL"},
+            ])
+            await asyncio.to_thread(route.verify_diagnoses_bulk, req, user=DOCTOR)
+            return [await asyncio.wait_for(queue.get(), 1) for _ in range(3)]
+
+    events = asyncio.run(scenario())
+    assert [e["event"] for e in events] == ["upsert", "upsert", "remove"]
+    assert all(e["record"]["filename"] == "lipids.pdf" for e in events[:2])
+    assert len(queries) == 2  # the existence check and the reopened records
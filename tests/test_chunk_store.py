@@ -0,0 +1,25 @@
+import pytest
+
+from server.config.state import MemoryState
+from server.reports import chunk_store
+
+# 1. Test matches are hydrated from the store, legacy metadata text is kept, missing ids dropped
+@pytest.mark.parametrize("backend", ["sqlite", "state"])
+def test_hydrate(tmp_path, monkeypatch, backend):
+    monkeypatch.setattr(chunk_store, "CHUNK_STORE_BACKEND", backend)
+    monkeypatch.setattr(chunk_store, "CHUNK_STORE_PATH", str(tmp_path / "chunks.sqlite"))
+    monkeypatch.setattr("server.config.state._state", MemoryState())
+    chunk_store.put_many(["a-v3-0-0", "a-v3-0-1"], ["TOTAL CHOLESTEROL: 165 mg/dL", "HDL CHOLESTEROL: 45 mg/dL"])
+    matches = [
+        {"id": "a-v3-0-1", "score": 0.9, "metadata": {"doc_id": "a", "page": 1}},
+        {"id": "old-0", "score": 0.8, "metadata": {"doc_id": "a", "text": "legacy chunk"}},
+        {"id": "a-v3-0-9", "score": 0.7, "metadata": {"doc_id": "a"}},
+    ]
+    hydrated = chunk_store.hydrate(matches)
+    assert [(m["id"], m["metadata"]["text"]) for m in hydrated] == [
+        ("a-v3-0-1", "HDL CHOLESTEROL: 45 mg/dL"), ("old-0", "legacy chunk")
+    ]
+    assert "text" not in matches[0]["metadata"]
+
+    chunk_store.delete_many(["a-v3-0-0", "a-v3-0-1"])
+    assert chunk_store.get_many(["a-v3-0-0", "a-v3-0-1"]) == {}
@@ -0,0 +1,34 @@
+from pathlib import Path
+from langchain_core.documents import Document
+from server.reports.chunking import chunk_text, chunk_documents, layout_blocks
+from server.utils import estimate_tokens
+
+SAMPLE = (Path(__file__).parent.parent / "benchmarks" / "data" / "lipid_profile_ocr.txt").read_text()
+
+# 1. Test OCR column tables are re-joined with their test names
+def test_column_table_rows_keep_names():
+    chunks = chunk_text(SAMPLE, 200)
+    table_chunk = next(c for c in chunks if "TOTAL CHOLESTEROL: 165 mg/dL 130 - 239" in c)
+    assert "TEST NAME: RESULT UNIT REF. RANGE" in table_chunk
+    assert "HDL / LDL RATIO: 0.6 0.3 - 0.7" in table_chunk
+    assert "LIPID PROFILE" in table_chunk
+
+# 2. Test chunks respect the token budget and use fewer vectors than the 500/100 splitter
+def test_budget_and_vector_count():
+    for budget in (120, 200, 300):
+        assert all(estimate_tokens(c) <= budget for c in chunk_text(SAMPLE, budget))
+    docs = [Document(page_content=SAMPLE, metadata={"page": 1})]
+    layout = chunk_documents(docs, chunker="layout", token_budget=200)
+    assert len(layout) < len(chunk_documents(docs, chunker="recursive"))
+    assert all(c.metadata["page"] == 1 for c in layout)
+
+# 3. Test a split table repeats its header
+def test_split_table_repeats_header():
+    rows = "\n".join(f"TEST NUMBER {chr(65 + i)} {i + 1}.5 mg/dL 1 - 9" for i in range(20))
+    text = f"HAEMATOLOGY\n\nTEST RESULT UNIT RANGE\n{rows}"
+    blocks = layout_blocks(text)
+    assert [b["kind"] for b in blocks] == ["heading", "table"]
+
+    chunks = chunk_text(text, 60)
+    assert len(chunks) > 1
+    assert all(c.startswith("HAEMATOLOGY\n\nTEST RESULT UNIT RANGE") for c in chunks)
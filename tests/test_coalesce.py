@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+
+from server.config.state import MemoryState
+from server.diagnosis import coalesce
+
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch):
+    monkeypatch.setattr("server.config.state._state", MemoryState())
+
+
+def _counting(result="answer", fail=False):
+    calls = []
+
+    async def fn():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        if fail:
+            raise RuntimeError("llm down")
+        return {"diagnosis": result}
+    return fn, calls
+
+
+# 1. Test concurrent duplicates share one run and failures are not kept
+def test_duplicates_share_one_run():
+    async def scenario():
+        fn, calls = _counting()
+        results = await asyncio.gather(*(coalesce.run_once("same", fn) for _ in range(5)))
+        assert len(calls) == 1 and all(r == {"diagnosis": "answer"} for r in results)
+
+        failing, failed_calls = _counting(fail=True)
+        outcomes = await asyncio.gather(*(coalesce.run_once("broken", failing) for _ in range(3)),
+                                        return_exceptions=True)
+        assert len(failed_calls) == 1 and all(isinstance(o, RuntimeError) for o in outcomes)
+        with pytest.raises(RuntimeError):
+            await coalesce.run_once("broken", failing)
+        assert len(failed_calls) == 2
+    asyncio.run(scenario())
+
+
+# 2. Test an idempotency key replays the finished response and rejects a different request
+def test_idempotency_key_replay():
+    async def scenario():
+        fn, calls = _counting()
+        first = await coalesce.run_once("request-a", fn, idempotency_key="key-1")
+        again = await coalesce.run_once("request-a", fn, idempotency_key="key-1")
+        assert first == again and len(calls) == 1
+        with pytest.raises(coalesce.IdempotencyConflict):
+            await coalesce.run_once("request-b", fn, idempotency_key="key-1")
+    asyncio.run(scenario())
+
+
+# 3. Test runs on different workers (separate in-process maps, one shared state) share one run
+def test_duplicates_share_one_run_across_workers():
+    async def scenario():
+        fn, calls = _counting()
+        # _run_shared is what each worker's in-flight task runs
+        results = await asyncio.gather(*(coalesce._run_shared("same", fn) for _ in range(3)))
+        assert len(calls) == 1 and all(r == {"diagnosis": "answer"} for r in results)
+        await coalesce._run_shared("same", fn)
+        assert len(calls) == 2  # finished runs are not replayed without an idempotency key
+    asyncio.run(scenario())
@@ -0,0 +1,98 @@
+import asyncio
+
+import pytest
+
+from benchmarks.bench_suite import make_text_pdf
+from benchmarks.fakes import FakeChatModel, FakeCollection
+from server.config import services
+from server.config.model_router import ModelRouter
+from server.config.state import MemoryState
+from server.diagnosis import query
+from server.diagnosis.lab_lookup import answer_from_digest
+from server.reports import digest
+from server.reports.storage import LocalStorage, report_key
+
+ROWS = [
+    {"test": "hdl cholesterol", "name": "HDL Cholesterol", "value": 38.0, "unit": "mg/dL",
+     "ref_low": 40.0, "ref_high": None, "flag": "low", "page": 1, "source": "lipids.pdf"},
+    {"test": "triglycerides", "name": "Triglycerides", "value": 120.0, "unit": "mg/dL",
+     "ref_low": None, "ref_high": 150.0, "flag": "normal", "page": 1, "source": "lipids.pdf"},
+]
+
+
+@pytest.fixture
+def collections(monkeypatch, tmp_path):
+    monkeypatch.setattr("server.config.state._state", MemoryState())
+    monkeypatch.setattr("server.reports.storage._storage", LocalStorage(str(tmp_path / "reports")))
+    fakes = {name: FakeCollection(name) for name in ("reports", "lab_results", "report_digests")}
+    monkeypatch.setattr(digest, "reports_collection", fakes["reports"])
+    monkeypatch.setattr(digest, "lab_results_collection", fakes["lab_results"])
+    monkeypatch.setattr(digest, "digests_collection", fakes["report_digests"])
+    monkeypatch.setattr(query, "lab_results_collection", fakes["lab_results"])
+    monkeypatch.setattr(query, "digests_collection", fakes["report_digests"])
+    return fakes
+
+
+# 1. Test an upload's queued job stores a digest with LLM findings and the out-of-range lab values
+def test_digest_job(collections, monkeypatch, tmp_path):
+    llm = FakeChatModel()
+    monkeypatch.setitem(services._llms, "test-digest", llm)
+    monkeypatch.setattr(digest, "router", ModelRouter(primary="test-digest", fast="test-digest", enabled=False))
+    monkeypatch.setattr(digest, "DIGEST_ENABLED", True)
+
+    pdf = tmp_path / "lipids.pdf"
+    make_text_pdf(pdf, ["LIPID PROFILE\nHDL Cholesterol 38 mg/dL (> 40)\nTriglycerides 120 mg/dL (< 150)"])
+    asyncio.run(digest.get_storage().save(report_key("doc-1", "lipids.pdf"), pdf.read_bytes()))
+    collections["reports"].insert_one({"doc_id": "doc-1", "filename": "lipids.pdf", "uploader": "p", "uploaded_at": 1})
+    collections["lab_results"].insert_many([{**row, "doc_id": "doc-1"} for row in ROWS])
+
+    job_id = digest.enqueue_digest("doc-1")
+    asyncio.run(digest.run_digest_job(digest.digest_jobs.pop()))
+    assert digest.digest_jobs.status(job_id)["status"] == "done"
+
+    stored = digest.get_digest("doc-1")
+    assert llm.calls == 1 and stored["findings"]
+    assert [r["name"] for r in stored["abnormal"]] == ["HDL Cholesterol"]
+    assert stored["sources"] == ["lipids.pdf"] and stored["pages"] == 1
+
+    # Reports deleted before their job ran are skipped
+    digest.enqueue_digest("gone")
+    asyncio.run(digest.run_digest_job(digest.digest_jobs.pop()))
+    assert digest.get_digest("gone") is None
+
+    records = digest.attach_digests([{"doc_id": "doc-1"}, {"doc_id": "all-reports"}])
+    assert records[0]["digest"]["abnormal"][0]["flag"] == "low" and "digest" not in records[1]
+
+
+# 2. Test first-turn summary questions are answered from the digest and everything else is not
+def test_summary_questions_use_digest(collections):
+    class Message:
+        def __init__(self, role, content):
+            self.role, self.content = role, content
+
+    collections["report_digests"].insert_one({
+        "doc_id": "doc-1", "sources": ["lipids.pdf"], "findings": "- HDL is low (Page 1)",
+        "abnormal": [ROWS[0]], "num_lab_results": 2,
+    })
+    answer = asyncio.run(query.chat_diagnosis_report(
+        "p", "doc-1", [Message("user", "Can you summarize my report?")]
+    ))
+    assert answer["fast_path"] == "digest" and answer["sources"] == ["lipids.pdf"]
+    assert "HDL is low (Page 1)" in answer["diagnosis"]
+    assert "HDL Cholesterol is 38 mg/dL" in answer["diagnosis"] and "lipids.pdf (Page 1)" in answer["diagnosis"]
+
+    stored = digest.get_digest("doc-1")
+    assert answer_from_digest("Is there anything abnormal?", stored)["fast_path"] == "digest"
+    assert answer_from_digest("What is my HDL level?", stored) is None
+    assert answer_from_digest("Can you summarize my report?", None) is None
+
+
+# 3. Test scripts only queue digests when the queue is shared with the API workers
+def test_script_can_queue_digests(monkeypatch):
+    monkeypatch.setattr(digest, "DIGEST_ENABLED", True)
+    monkeypatch.setattr(digest, "STATE_BACKEND", "memory")
+    assert not digest.script_can_queue_digests()
+    monkeypatch.setattr(digest, "STATE_BACKEND", "redis")
+    assert digest.script_can_queue_digests()
+    monkeypatch.setattr(digest, "DIGEST_ENABLED", False)
+    assert not digest.script_can_queue_digests()
@@ -0,0 +1,37 @@
+from evaluation_rag import load_questions, cache_key, config_hash, pipeline_config, stub_scores, ResponseCache
+
+# 1. Test question sets load from files
+def test_load_questions_jsonl():
+    items = load_questions("eval_sets/lipid_profile.jsonl")
+    assert len(items) == 5
+    assert all(i["doc_id"] and i["ground_truth"] for i in items)
+
+# 2. Test the cache key follows the pipeline config
+def test_cache_key_changes_with_config():
+    live, offline = config_hash(pipeline_config()), config_hash(pipeline_config(offline=True))
+    assert live == config_hash(pipeline_config())
+    assert cache_key("q", "doc", live) != cache_key("q", "doc", offline)
+    assert cache_key("q", "doc", live) != cache_key("q", "other-doc", live)
+
+# 3. Test cached outputs survive a reload
+def test_response_cache_roundtrip(tmp_path):
+    path = str(tmp_path / "cache.jsonl")
+    ResponseCache(path).put("k", answer="165 mg/dL", contexts=["a"], timings={"embed": 1.0})
+    ResponseCache(path).put("k", answer="updated", contexts=["a"], timings={})
+    assert ResponseCache(path).get("k")["answer"] == "updated"
+
+# 4. Test the offline judges reward grounded answers
+def test_stub_scores():
+    row = {
+        "question": "What is the total cholesterol?",
+        "answer": "The total cholesterol is 165 mg/dL.",
+        "contexts": ["Letterhead", "TOTAL CHOLESTEROL 165 mg/dL 130 - 239"],
+        "ground_truth": "The total cholesterol level is 165 mg/dL.",
+    }
+    scores = stub_scores(row)
+    assert scores["faithfulness"] == 1.0
+    assert scores["context_precision"] == 0.5
+    assert scores["context_recall"] == 0.6
+
+    ungrounded = stub_scores({**row, "answer": "Your hemoglobin is 9 g/dL."})
+    assert ungrounded["faithfulness"] < scores["faithfulness"]
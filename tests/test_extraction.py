@@ -0,0 +1,84 @@
+from pypdf import PdfReader, PdfWriter
+from server.reports import extraction, text_cache
+from server.reports.extraction import load_documents, needs_ocr, ocr_dpi, page_pixels
+from benchmarks.bench_suite import make_text_pdf, make_scanned_pdf, report_pages
+
+# 1. Test the per-page OCR decision
+def test_needs_ocr():
+    assert needs_ocr("", 0.0)
+    assert needs_ocr("Page 1", 1.0)
+    # A scan with a short text overlay (e.g. a stamped header) is still a scan
+    assert needs_ocr("MEDIHELP LABORATORY " * 5, 0.95)
+    assert not needs_ocr("TOTAL CHOLESTEROL 165 mg/dL 130 - 239\n" * 20, 0.95)
+    assert not needs_ocr("TOTAL CHOLESTEROL 165 mg/dL 130 - 239\nHDL CHOLESTEROL 45 mg/dL", 0.0)
+
+# 2. Test only the scanned pages of a mixed PDF are OCR'd
+def test_mixed_pdf_ocrs_only_scanned_pages(tmp_path, monkeypatch):
+    make_text_pdf(tmp_path / "text.pdf", report_pages(2))
+    make_scanned_pdf(tmp_path / "scan.pdf", report_pages(1))
+    writer = PdfWriter()
+    for name in ("text.pdf", "scan.pdf"):
+        for page in PdfReader(tmp_path / name).pages:
+            writer.add_page(page)
+    writer.write(tmp_path / "mixed.pdf")
+
+    ocr_calls = []
+    def fake_ocr(pdf_path, page_number, dpi):
+        ocr_calls.append(page_number)
+        return "TOTAL CHOLESTEROL 165 mg/dL 130 - 239"
+    monkeypatch.setattr(extraction, "ocr_page", fake_ocr)
+
+    docs = load_documents(str(tmp_path / "mixed.pdf"), "mixed.pdf")
+    assert ocr_calls == [3]
+    assert [(d.metadata["page"], d.metadata["extraction"]) for d in docs] == [(1, "text"), (2, "text"), (3, "ocr")]
+    assert all(d.metadata["source"] == "mixed.pdf" and d.metadata["extract_ms"] >= 0 for d in docs)
+
+# 3. Test a re-extraction is served from the text cache and never re-OCRs
+def test_text_cache_skips_reextraction(tmp_path, monkeypatch):
+    monkeypatch.setattr(text_cache, "TEXT_CACHE_ENABLED", True)
+    monkeypatch.setattr(text_cache, "TEXT_CACHE_PATH", str(tmp_path / "cache.sqlite"))
+    make_scanned_pdf(tmp_path / "scan.pdf", report_pages(2))
+    ocr_calls = []
+    def fake_ocr(pdf_path, page_number, dpi):
+        ocr_calls.append(page_number)
+        return f"PAGE {page_number} TOTAL CHOLESTEROL 165 mg/dL 130 - 239"
+    monkeypatch.setattr(extraction, "ocr_page", fake_ocr)
+
+    first = load_documents(str(tmp_path / "scan.pdf"), "a.pdf")
+    again = load_documents(str(tmp_path / "scan.pdf"), "b.pdf")
+    assert ocr_calls == [1, 2]
+    assert [d.page_content for d in again] == [d.page_content for d in first]
+    assert all(d.metadata["source"] == "b.pdf" for d in again)
+
+    # A different tesseract config is a different key
+    monkeypatch.setattr(extraction, "OCR_CONFIG", "--psm 4")
+    load_documents(str(tmp_path / "scan.pdf"), "a.pdf")
+    assert ocr_calls == [1, 2, 1, 2]
+    assert text_cache.stats()["entries"] == 2
+
+    # Eviction keeps the most recently used entry within the size limit
+    assert text_cache.purge(max_bytes=text_cache.stats()["bytes"] - 1) == 1
+    load_documents(str(tmp_path / "scan.pdf"), "a.pdf")
+    assert ocr_calls == [1, 2, 1, 2]
+    assert text_cache.purge(keep=[]) == 1
+
+# 4. Test OCR DPI adapts to page size and the per-document page cap
+def test_ocr_memory_limits(tmp_path, monkeypatch):
+    assert ocr_dpi(595, 842) == extraction.OCR_DPI  # A4
+    a0 = (2384, 3370)
+    assert ocr_dpi(*a0) < extraction.OCR_DPI
+    assert page_pixels(*a0, ocr_dpi(*a0)) <= extraction.OCR_MAX_PAGE_PIXELS
+
+    monkeypatch.setattr(extraction, "OCR_MAX_PAGES", 2)
+    make_scanned_pdf(tmp_path / "scan.pdf", report_pages(3))
+    calls = []
+    def fake_ocr(pdf_path, page_number, dpi):
+        calls.append(dpi)
+        return "TOTAL CHOLESTEROL 165 mg/dL 130 - 239"
+    monkeypatch.setattr(extraction, "ocr_page", fake_ocr)
+    limit_hits = extraction.OCR_LIMIT_HITS.value()
+    docs = load_documents(str(tmp_path / "scan.pdf"), "scan.pdf")
+    assert len(calls) == 2
+    assert extraction.OCR_LIMIT_HITS.value() == limit_hits + 1
+    assert sum(1 for d in docs if d.metadata["extraction"] == "ocr") == 2
+    assert extraction.EXTRACTION_PEAK_RSS.value() > 0
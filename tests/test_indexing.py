@@ -0,0 +1,149 @@
+import asyncio
+import hashlib
+
+import pytest
+from langchain_core.documents import Document
+
+from benchmarks.fakes import FakeCollection, FakeEmbeddings, LocalIndex
+from server.config import services
+from server.reports import chunk_store, indexing, text_cache, vectorstore
+from server.reports.storage import LocalStorage, report_key
+
+REPORT = ("LIPID PROFILE\nTotal Cholesterol 165 mg/dL (< 200)\nHDL Cholesterol 38 mg/dL (> 40)\n"
+          "Triglycerides 120 mg/dL (< 150)\nLDL Cholesterol 103 mg/dL (< 130)")
+CURRENT = services.PINECONE_INDEX_NAME
+OLD = "medragnosis-old-index"
+
+
+class RecordingIndex(LocalIndex):
+    """Notes, for every delete, which of the ids a `reports` record still points queries at here."""
+
+    def __init__(self, name, reports):
+        super().__init__()
+        self.name, self.reports = name, reports
+        self.deleted_live = []
+
+    def delete(self, ids=None, **kwargs):
+        live = {vid for report in self.reports.find() if services.index_name_for(report) == self.name
+                for vid in indexing.vector_ids_for(report)}
+        self.deleted_live.append(set(ids) & live)
+        super().delete(ids=ids, **kwargs)
+
+
+@pytest.fixture
+def env(monkeypatch, tmp_path):
+    reports = FakeCollection("reports")
+    lab_results = FakeCollection("lab_results")
+    digests = FakeCollection("report_digests")
+    monkeypatch.setattr(indexing, "reports_collection", reports)
+    monkeypatch.setattr(indexing, "lab_results_collection", lab_results)
+    monkeypatch.setattr(indexing, "digests_collection", digests)
+    monkeypatch.setattr(vectorstore, "lab_results_collection", lab_results)
+    monkeypatch.setattr(chunk_store, "CHUNK_STORE_BACKEND", "sqlite")
+    monkeypatch.setattr(chunk_store, "CHUNK_STORE_PATH", str(tmp_path / "chunks.sqlite"))
+    monkeypatch.setattr(text_cache, "TEXT_CACHE_PATH", str(tmp_path / "extracted_text.sqlite"))
+
+    indexes = {name: RecordingIndex(name, reports) for name in (CURRENT, OLD)}
+    for name, index in indexes.items():
+        monkeypatch.setitem(services._indexes, name, index)
+
+    storage = LocalStorage(str(tmp_path / "reports"))
+    monkeypatch.setattr(indexing, "get_storage", lambda: storage)
+
+    async def extract_documents(path, filename):
+        return [Document(page_content=REPORT, metadata={"page": 1, "source": filename})]
+    monkeypatch.setattr(indexing, "extract_documents", extract_documents)
+    digest_jobs = []
+    monkeypatch.setattr(indexing, "enqueue_digest", digest_jobs.append)
+
+    return {"reports": reports, "lab_results": lab_results, "digests": digests,
+            "indexes": indexes, "storage": storage, "digest_jobs": digest_jobs}
+
+
+def seed(env, doc_id: str, filename: str, index_name: str, ids: list, **record):
+    """A stored file and its cached text, `reports` record, vectors, chunk text, lab row and digest."""
+    content = f"{REPORT}\n{filename}".encode()
+    asyncio.run(env["storage"].save(report_key(doc_id, filename), content))
+    text_cache.put(hashlib.sha256(content).hexdigest(), "pdf", "", 300, [Document(page_content=REPORT)])
+    env["reports"].insert_one({"doc_id": doc_id, "filename": filename, "uploader": "p",
+                               "uploaded_at": 1, "vector_index": index_name, **record})
+    env["indexes"][index_name].upsert([(vid, [1.0, 0.0], {"doc_id": doc_id}) for vid in ids])
+    chunk_store.put_many(ids, [f"old text {vid}" for vid in ids])
+    env["lab_results"].insert_one({"doc_id": doc_id, "source": filename, "test": "hdl cholesterol"})
+    env["digests"].update_one({"doc_id": doc_id}, {"$set": {"findings": "- old"}}, upsert=True)
+
+
+# 1. Test deleting a report removes legacy and versioned vectors, chunk text, files, records, lab results and digest
+def test_delete_report(env):
+    seed(env, "doc-1", "a.pdf", OLD, ["doc-1-0", "doc-1-1"], num_chunks=2)
+    seed(env, "doc-1", "b.pdf", CURRENT, ["doc-1-v3-1-0"], vector_ids=["doc-1-v3-1-0"], index_version=3,
+         sha256=hashlib.sha256(f"{REPORT}\nb.pdf".encode()).hexdigest())
+    seed(env, "doc-2", "c.pdf", CURRENT, ["doc-2-v3-0-0"], vector_ids=["doc-2-v3-0-0"], index_version=3)
+
+    result = asyncio.run(indexing.delete_report("doc-1"))
+    assert result == {"doc_id": "doc-1", "vectors_deleted": 3, "files_deleted": 2, "lab_results_deleted": 2}
+
+    assert len(env["indexes"][OLD]) == 0 and len(env["indexes"][CURRENT]) == 1
+    assert list(chunk_store.get_many(["doc-1-0", "doc-1-1", "doc-1-v3-1-0", "doc-2-v3-0-0"])) == ["doc-2-v3-0-0"]
+    assert not asyncio.run(env["storage"].exists(report_key("doc-1", "a.pdf")))
+    assert asyncio.run(env["storage"].exists(report_key("doc-2", "c.pdf")))
+    # Forgotten by the record's stored hash, or by hashing the file for older records
+    assert text_cache.stats()["entries"] == 1
+    for name in ("reports", "lab_results", "digests"):
+        assert [d["doc_id"] for d in env[name].find()] == ["doc-2"]
+
+
+# 2. Test reindexing flips each record before its old vectors go, and keeps text of ids that moved index
+def test_reindex_report(env):
+    seed(env, "doc-1", "a.pdf", OLD, ["doc-1-0", "doc-1-1"], num_chunks=2)
+    # Same version in another index (e.g. before a dimension change): the ids move with it
+    seed(env, "doc-1", "b.pdf", OLD, ["doc-1-v3-1-0", "doc-1-v3-1-99"], file_index=1,
+         vector_ids=["doc-1-v3-1-0", "doc-1-v3-1-99"], index_version=3)
+
+    result = asyncio.run(indexing.reindex_report("doc-1", version=3, embed_model=FakeEmbeddings(dimension=2)))
+    assert result == {"doc_id": "doc-1", "index_version": 3, "files_reindexed": 2}
+
+    records = {r["filename"]: r for r in env["reports"].find()}
+    assert all(r["index_version"] == 3 and r["vector_index"] == CURRENT for r in records.values())
+    assert records["a.pdf"]["vector_ids"][0] == "doc-1-v3-0-0"
+    assert "doc-1-v3-1-0" in records["b.pdf"]["vector_ids"]
+
+    # No vector was deleted while a record still pointed at it
+    deleted = [live for index in env["indexes"].values() for live in index.deleted_live]
+    assert deleted and not any(deleted)
+    assert len(env["indexes"][OLD]) == 0
+    live_ids = records["a.pdf"]["vector_ids"] + records["b.pdf"]["vector_ids"]
+    assert len(env["indexes"][CURRENT]) == len(live_ids)
+    texts = chunk_store.get_many(["doc-1-0", "doc-1-v3-1-99", *live_ids])
+    assert sorted(texts) == sorted(live_ids) and "LIPID PROFILE" in texts["doc-1-v3-1-0"]
+    assert env["digest_jobs"] == ["doc-1"]  # the digest is rebuilt from the new extraction
+
+
+# 3. Test a failure between the upsert and the flip leaves the old vectors, text and record serving queries
+def test_reindex_failure_before_flip(env, monkeypatch):
+    seed(env, "doc-1", "a.pdf", OLD, ["doc-1-0", "doc-1-1"], num_chunks=2)
+    update_one, failures = env["reports"].update_one, []
+
+    def fail_once(*args, **kwargs):
+        if not failures:
+            failures.append(args)
+            raise RuntimeError("mongo unavailable")
+        return update_one(*args, **kwargs)
+    monkeypatch.setattr(env["reports"], "update_one", fail_once)
+
+    embed_model = FakeEmbeddings(dimension=2)
+    with pytest.raises(RuntimeError):
+        asyncio.run(indexing.reindex_report("doc-1", version=3, embed_model=embed_model))
+
+    record = env["reports"].find_one({"doc_id": "doc-1"})
+    assert "index_version" not in record and indexing.vector_ids_for(record) == ["doc-1-0", "doc-1-1"]
+    assert len(env["indexes"][OLD]) == 2 and not env["indexes"][OLD].deleted_live
+    assert sorted(chunk_store.get_many(["doc-1-0", "doc-1-1"])) == ["doc-1-0", "doc-1-1"]
+    assert not env["digest_jobs"]
+
+    # A retry overwrites what the failed attempt wrote and completes the cutover
+    asyncio.run(indexing.reindex_report("doc-1", version=3, embed_model=embed_model))
+    record = env["reports"].find_one({"doc_id": "doc-1"})
+    assert record["index_version"] == 3 and len(env["indexes"][OLD]) == 0
+    assert len(env["indexes"][CURRENT]) == len(record["vector_ids"])
+    assert env["digest_jobs"] == ["doc-1"]
@@ -0,0 +1,48 @@
+import asyncio
+
+from server.config.llm_dispatcher import LLMDispatcher
+
+
+# 1. Test waiting calls are released by priority class, then round-robin across users
+def test_priority_and_fair_order():
+    async def scenario():
+        dispatcher = LLMDispatcher(slots=1, interactive_reserved=0)
+        await dispatcher.acquire("interactive", "first", 10)
+        order = []
+
+        async def waiter(priority, user):
+            await dispatcher.acquire(priority, user, 10)
+            order.append((priority, user))
+            dispatcher.release()
+        tasks = [asyncio.create_task(waiter(p, u)) for p, u in (
+            ("batch", "eval"), ("batch", "eval"), ("batch", "bulk"),
+            ("longitudinal", "ann"), ("interactive", "bob"), ("interactive", "bob"), ("interactive", "cat"),
+        )]
+        await asyncio.sleep(0)
+        dispatcher.release()
+        await asyncio.gather(*tasks)
+        assert order == [
+            ("interactive", "bob"), ("interactive", "cat"), ("interactive", "bob"),
+            ("longitudinal", "ann"), ("batch", "eval"), ("batch", "bulk"), ("batch", "eval"),
+        ]
+    asyncio.run(scenario())
+
+
+# 2. Test reserved slots stay free for interactive calls and the token budget makes calls wait
+def test_reserved_slots_and_token_budget():
+    async def scenario():
+        dispatcher = LLMDispatcher(slots=2, interactive_reserved=1, tokens_per_minute=6000)
+        await dispatcher.acquire("batch", "eval", 100)
+        blocked = asyncio.create_task(dispatcher.acquire("batch", "eval", 100))
+        await asyncio.sleep(0.01)
+        assert not blocked.done()
+        await dispatcher.acquire("interactive", "bob", 100)
+        dispatcher.release()
+        dispatcher.release()
+        await blocked
+        dispatcher.release(reserved=100, used=5600)  # the real usage drains the budget
+
+        start = asyncio.get_running_loop().time()
+        await dispatcher.acquire("interactive", "bob", 300)  # 100 tokens refill per second
+        assert asyncio.get_running_loop().time() - start > 0.5
+    asyncio.run(scenario())
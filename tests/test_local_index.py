@@ -0,0 +1,58 @@
+import numpy as np
+from server.reports.local_index import LocalVectorIndex
+
+def _vectors(n=300, dim=64, seed=0):
+    rng = np.random.default_rng(seed)
+    x = rng.normal(size=(n, dim)).astype(np.float32)
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+# 1. Test quantized scans return the exact top results with exact scores after rescoring
+def test_quantized_matches_exact():
+    x = _vectors()
+    query = x[7] + 0.05 * _vectors(1, seed=1)[0]
+    exact = np.argsort(-(x @ query))[:5]
+    for storage in ("float32", "int8", "binary"):
+        index = LocalVectorIndex(":memory:", storage=storage, rescore_factor=20)
+        index.upsert([(str(i), v.tolist(), {"doc_id": f"d{i % 3}"}) for i, v in enumerate(x)])
+        matches = index.query(vector=query, top_k=5)["matches"]
+        assert [m["id"] for m in matches][0] == "7"
+        assert abs(matches[0]["score"] - float(x[7] @ query)) < 1e-4
+        if storage != "binary":
+            assert [int(m["id"]) for m in matches] == exact.tolist()
+    assert index.memory_bytes() == 300 * 64 // 8
+
+# 2. Test filters, deletes and upserts survive a reload from disk
+def test_persistence_and_filters(tmp_path):
+    x = _vectors(30)
+    path = str(tmp_path / "index.sqlite")
+    index = LocalVectorIndex(path, storage="int8")
+    index.upsert([(str(i), v.tolist(), {"doc_id": f"d{i % 3}"}) for i, v in enumerate(x)])
+    index.delete(ids=["3"])
+    index.upsert([("4", x[3].tolist(), {"doc_id": "d0"})])
+
+    reloaded = LocalVectorIndex(path, storage="int8")
+    assert len(reloaded) == 29
+    matches = reloaded.query(vector=x[3], top_k=3, include_metadata=True, filter={"doc_id": "d0"})["matches"]
+    assert matches[0]["id"] == "4"
+    assert all(m["metadata"]["doc_id"] == "d0" for m in matches)
+
+# 3. Test workers sharing an index file see each other's upserts and deletes without a restart
+def test_workers_share_changes(tmp_path, monkeypatch):
+    from server.reports import local_index
+    x = _vectors(20)
+    path = str(tmp_path / "index.sqlite")
+    first, second = LocalVectorIndex(path), LocalVectorIndex(path)
+    first.upsert([(str(i), v.tolist(), {"doc_id": f"d{i % 2}", "uploader": "u"}) for i, v in enumerate(x)])
+
+    matches = second.query(vector=x[5], top_k=1, filter={"doc_id": {"$in": ["d1"]}, "uploader": "u"})["matches"]
+    assert matches[0]["id"] == "5" and len(second) == 20
+
+    first.delete(ids=["5"])
+    first.upsert([("7", x[5].tolist(), {"doc_id": "d1"})])
+    assert second.query(vector=x[5], top_k=1, filter={"doc_id": "d1"})["matches"][0]["id"] == "7"
+    assert len(second) == 19
+
+    # A worker that missed pruned log entries reloads everything
+    monkeypatch.setattr(local_index, "CHANGE_LOG_ROWS", 1)
+    first.upsert([(str(i), v.tolist(), {"doc_id": "d2"}) for i, v in enumerate(x[:3])])
+    assert {m["id"] for m in second.query(vector=x[0], top_k=5, filter={"doc_id": "d2"})["matches"]} == {"0", "1", "2"}
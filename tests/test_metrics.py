@@ -0,0 +1,43 @@
+from fastapi.testclient import TestClient
+from server.main import app
+from server.metrics import Histogram, span, new_trace_id, route_var, STAGE_SECONDS
+
+client = TestClient(app)
+
+# 1. Test histogram exposition is cumulative
+def test_histogram_render():
+    h = Histogram("test_seconds", "Test histogram.", buckets=(0.1, 1.0))
+    h.observe(0.05, stage="a")
+    h.observe(0.5, stage="a")
+    h.observe(5.0, stage="a")
+    lines = h.render()
+    assert 'test_seconds_bucket{stage="a",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{stage="a",le="1.0"} 2' in lines
+    assert 'test_seconds_bucket{stage="a",le="+Inf"} 3' in lines
+    assert 'test_seconds_count{stage="a"} 3' in lines
+
+# 2. Test spans are labelled with the current route
+def test_span_records_stage():
+    token = route_var.set("/test/route")
+    try:
+        with span("embed"):
+            pass
+    finally:
+        route_var.reset(token)
+    assert 'medragnosis_stage_duration_seconds_count{route="/test/route",stage="embed"} 1' in STAGE_SECONDS.render()
+
+# 3. Test trace ids are propagated from W3C traceparent headers
+def test_trace_id_from_traceparent():
+    header = "00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01"
+    assert new_trace_id(header) == "4bf92f3577b34da6a3ce929d0e0e4736"
+    assert len(new_trace_id()) == 32
+
+# 4. Test the /metrics endpoint and X-Trace-Id header
+def test_metrics_endpoint():
+    response = client.get("/health", headers={"X-Trace-Id": "abc123"})
+    assert response.headers["X-Trace-Id"] == "abc123"
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert 'medragnosis_request_duration_seconds_count{method="GET",route="/health",status="200"}' in response.text
+    assert "# TYPE medragnosis_provider_queue_depth gauge" in response.text
@@ -0,0 +1,101 @@
+import asyncio
+import time
+
+import pytest
+
+from benchmarks.fakes import FakeChatModel
+from server.config import services
+from server.config.model_router import ModelRouter
+
+
+@pytest.fixture(autouse=True)
+def llm_registry(monkeypatch):
+    # The fakes _router installs are dropped again after each test
+    monkeypatch.setattr(services, "_llms", dict(services._llms))
+
+
+def _router(**models) -> ModelRouter:
+    services.use_clients(llms=models)
+    names = list(models)
+    return ModelRouter(primary=names[0], fast=names[1], fallbacks=names[2:], hedge=True, enabled=True)
+
+
+def _ask(router, simple=False):
+    async def scenario():
+        start = time.perf_counter()
+        result = await router.generate(lambda llm: llm, "What is the HDL level?", simple=simple)
+        return result.content, time.perf_counter() - start
+    return asyncio.run(scenario())
+
+
+# 1. Test simple turns prefer the fast model and errors fall back to the next model
+def test_simple_turns_and_fallback():
+    big, small = FakeChatModel(latency_ms=1), FakeChatModel(latency_ms=1, error_every=1)
+    router = _router(**{"test-big": big, "test-small": small})
+    assert router.candidates(simple=True) == ["test-small", "test-big"]
+    assert router.candidates(simple=False) == ["test-big", "test-small"]
+
+    content, _ = _ask(router, simple=True)
+    assert content == "What is the HDL level?" and (small.calls, big.calls) == (1, 1)
+    for _ in range(20):
+        _ask(router, simple=True)
+    # After enough failures the fast model stops being tried first
+    assert router.candidates(simple=True) == ["test-big", "test-small"]
+
+
+# 2. Test a call slower than the hedge delay is answered by the backup model
+def test_slow_calls_are_hedged(monkeypatch):
+    from server.config import model_router
+    monkeypatch.setattr(model_router, "LLM_HEDGE_DEFAULT_MS", 50)
+    slow, backup = FakeChatModel(latency_ms=600), FakeChatModel(latency_ms=10)
+    router = _router(**{"test-slow": slow, "test-backup": backup})
+    content, elapsed = _ask(router)
+    assert content == "What is the HDL level?" and elapsed < 0.4 and backup.calls == 1
+
+
+# 3. Test time queued in the dispatcher does not start the hedge clock, nor does a busy queue get a hedge
+def test_no_hedge_while_dispatcher_is_busy(monkeypatch):
+    from server.config import model_router, llm_dispatcher
+    monkeypatch.setattr(model_router, "LLM_HEDGE_DEFAULT_MS", 50)
+    busy = llm_dispatcher.LLMDispatcher(slots=2, interactive_reserved=0)
+    monkeypatch.setattr(llm_dispatcher, "dispatcher", busy)
+    monkeypatch.setattr(model_router, "dispatcher", busy)
+
+    async def scenario():
+        quick, backup = FakeChatModel(latency_ms=20), FakeChatModel(latency_ms=1)
+        router = _router(**{"test-quick": quick, "test-backup": backup})
+        await busy.acquire("interactive", "other", 10)
+        await busy.acquire("interactive", "other", 10)
+        call = asyncio.ensure_future(router.generate(lambda llm: llm, "queued"))
+        await asyncio.sleep(0.2)  # four hedge delays, all of it waiting for a slot
+        busy.release()
+        assert (await call).content == "queued" and backup.calls == 0
+        [(_, seconds, ok)] = router._stats("test-quick")._samples
+        assert ok and seconds < 0.2
+
+        # Slow, but other calls are waiting: no hedge to add to the queue
+        slow = FakeChatModel(latency_ms=300)
+        router = _router(**{"test-slow": slow, "test-backup": backup})
+        call = asyncio.ensure_future(router.generate(lambda llm: llm, "slow"))
+        await asyncio.sleep(0.01)
+        waiter = asyncio.ensure_future(busy.acquire("batch", "eval", 10))
+        assert (await call).content == "slow" and backup.calls == 0
+        await waiter
+    asyncio.run(scenario())
+
+
+# 4. Test a cancelled generate cancels its attempts, freeing their dispatcher slots
+def test_cancelled_generate_cancels_attempts(monkeypatch):
+    from server.config import llm_dispatcher
+    dispatcher = llm_dispatcher.LLMDispatcher(slots=1, interactive_reserved=0)
+    monkeypatch.setattr(llm_dispatcher, "dispatcher", dispatcher)
+
+    async def scenario():
+        router = _router(**{"test-slow": FakeChatModel(latency_ms=200), "test-backup": FakeChatModel()})
+        call = asyncio.ensure_future(router.generate(lambda llm: llm, "gone"))
+        await asyncio.sleep(0.05)
+        call.cancel()
+        await asyncio.gather(call, return_exceptions=True)
+        await asyncio.sleep(0)
+        assert dispatcher.in_flight == 0
+    asyncio.run(scenario())
@@ -0,0 +1,36 @@
+from server.diagnosis.rerank import dedupe, pack, select_passages
+from server.utils import estimate_tokens
+
+RESULTS_CHUNK = "TOTAL CHOLESTEROL 165 mg/dL 130 - 239\nTRIGLYCERIDES 244 mg/dL 10 - 200"
+HEADER_CHUNK = "Patient Name : Mrs. Priyani Almeda\nReferred Org : Kalubowila Hospital"
+FOOTER_CHUNK = "End of Report. The Largest Primary Healthcare Network in Sri Lanka"
+
+# 1. Test that the lexical reranker beats the raw vector order
+def test_select_passages_prefers_relevant_chunk():
+    """The results chunk should win even when the vector store ranked it last"""
+    matches = [
+        {"score": 0.9, "metadata": {"text": FOOTER_CHUNK, "source": "a.pdf"}},
+        {"score": 0.8, "metadata": {"text": HEADER_CHUNK, "source": "a.pdf"}},
+        {"score": 0.7, "metadata": {"text": RESULTS_CHUNK, "source": "a.pdf"}},
+    ]
+    passages = select_passages("What is the triglycerides level?", matches)
+    assert passages[0]["text"] == RESULTS_CHUNK
+
+# 2. Test overlap trimming and near-duplicate removal
+def test_dedupe_trims_overlap_and_drops_duplicates():
+    """Neighbouring chunks share their overlap once; repeated chunks are dropped"""
+    first = "LIPID PROFILE\nTOTAL CHOLESTEROL 165 mg/dL\nHDL CHOLESTEROL 45 mg/dL"
+    second = "HDL CHOLESTEROL 45 mg/dL\nLDL CHOLESTEROL 71.2 mg/dL"
+    candidates = [{"text": first}, {"text": second}, {"text": first}]
+
+    kept = dedupe(candidates)
+    assert len(kept) == 2
+    assert kept[1]["text"] == "LDL CHOLESTEROL 71.2 mg/dL"
+
+# 3. Test token budget packing
+def test_pack_respects_token_budget():
+    """Packed passages must never exceed the token budget"""
+    candidates = [{"text": "x" * 400}, {"text": "y" * 200}, {"text": "z" * 40}]
+    packed = pack(candidates, token_budget=60, max_passages=5)
+    assert sum(estimate_tokens(c["text"]) for c in packed) <= 60
+    assert [c["text"][0] for c in packed] == ["y", "z"]
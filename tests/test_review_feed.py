@@ -0,0 +1,66 @@
+import asyncio
+import time
+
+import pytest
+
+from benchmarks.fakes import FakeCollection
+from server.diagnosis import review_feed
+from server.reports import digest
+
+
+@pytest.fixture(autouse=True)
+def collections(monkeypatch):
+    diagnoses, reports = FakeCollection("diagnosis_history"), FakeCollection("reports")
+    reports.insert_one({"doc_id": "doc-1", "filename": "lipids.pdf"})
+    monkeypatch.setattr(review_feed, "diagnosis_collection", diagnoses)
+    monkeypatch.setattr(review_feed, "reports_collection", reports)
+    monkeypatch.setattr(digest, "digests_collection", FakeCollection("report_digests"))
+    return diagnoses
+
+
+def _record(doc_id: str, status: str = "pending", updated_at: float = None) -> dict:
+    now = updated_at or time.time()
+    return {"doc_id": doc_id, "requester": "patient", "question": "q", "answer": "a",
+            "timestamp": now, "updated_at": now, "verification_status": status}
+
+
+# 1. Test delta sync returns records that entered or left the queue, with filenames attached
+def test_changes_since(collections):
+    collections.insert_one(_record("doc-1", updated_at=time.time() - 3600))  # before the cursor
+    since = time.time() - 60
+    collections.insert_one(_record("doc-1"))
+    collections.insert_one(_record("all-reports"))
+    reviewed = collections.insert_one(_record("doc-1", status="approved")).inserted_id
+
+    changes = review_feed.changes_since(since)
+    assert changes["cursor"] >= since
+    assert [e["event"] for e in changes["events"]] == ["upsert", "upsert", "remove"]
+    assert [e["record"]["filename"] for e in changes["events"][:2]] == [
+        "lipids.pdf", review_feed.LONGITUDINAL_FILENAME
+    ]
+    assert changes["events"][2]["_id"] == str(reviewed)
+
+
+# 2. Test subscribers get this worker's writes at once and other workers' writes by polling, each once
+def test_feed_pushes_local_and_polled_changes(collections):
+    async def scenario():
+        feed = review_feed.ReviewFeed(source="poll", poll_seconds=0.01)
+        async with feed.subscribe() as queue:
+            local = _record("doc-1")
+            collections.insert_one(local)
+            feed.publish(local)
+            assert queue.get_nowait()["record"]["filename"] == "lipids.pdf"
+
+            # Async endpoints publish with the lookups in a thread; the event comes back on the loop
+            threaded = _record("doc-1")
+            collections.insert_one(threaded)
+            await feed.apublish(threaded)
+            assert (await asyncio.wait_for(queue.get(), 1))["record"]["_id"] == str(threaded["_id"])
+
+            collections.insert_one(_record("all-reports"))  # written by another worker
+            remote = await asyncio.wait_for(queue.get(), 1)
+            assert remote["record"]["doc_id"] == "all-reports"
+            await asyncio.sleep(0.05)
+            assert queue.empty()  # the polled copy of the local write was dropped
+        assert feed._task is None
+    asyncio.run(scenario())
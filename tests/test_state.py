@@ -0,0 +1,38 @@
+import time
+
+from server.config.state import MemoryState
+from server.config.jobs import JobQueue
+
+
+# 1. Test MemoryState follows the redis-py semantics the app relies on
+def test_memory_state_semantics():
+    state = MemoryState()
+    assert state.set("k", "v", nx=True) is True
+    assert state.set("k", "other", nx=True) is None and state.get("k") == b"v"
+    assert state.mget(["k", "missing"]) == [b"v", None]
+
+    state.set("short", 1, ex=0.01)
+    time.sleep(0.02)
+    assert state.get("short") is None and state.set("short", 2, nx=True)
+
+    assert state.incrby("n", 3) == 3 and state.decrby("n", 1) == 2 and state.get("n") == b"2"
+    state.lpush("q", "a", "b")
+    assert state.llen("q") == 2 and state.rpop("q") == b"a" and state.rpop("q") == b"b"
+    assert state.rpop("q") is None
+    assert state.delete("k", "n", "missing") == 2
+
+
+# 2. Test jobs pushed by one worker are popped in order and their status is shared
+def test_job_queue(monkeypatch):
+    monkeypatch.setattr("server.config.state._state", MemoryState())
+    producer, consumer = JobQueue("digest"), JobQueue("digest")
+    first = producer.push("report_digest", doc_id="a")
+    producer.push("report_digest", doc_id="b")
+    assert len(consumer) == 2 and producer.status(first)["status"] == "queued"
+
+    job = consumer.pop()
+    assert job["id"] == first and job["payload"] == {"doc_id": "a"}
+    assert producer.status(first)["status"] == "running"
+    consumer.finish(job, error="llm down")
+    assert producer.status(first)["status"] == "failed" and producer.status(first)["error"] == "llm down"
+    assert consumer.pop()["payload"] == {"doc_id": "b"} and consumer.pop() is None
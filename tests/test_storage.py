@@ -0,0 +1,60 @@
+import asyncio
+import os
+
+import pytest
+
+from benchmarks.fakes import FakeS3Client
+from server.reports.storage import LocalStorage, S3Storage, shard
+
+TEXT = b"%PDF-1.4 TOTAL CHOLESTEROL 165 mg/dL " * 200
+SCANNED = os.urandom(50_000)  # incompressible, like image-only PDFs
+
+
+def _stores(tmp_path):
+    return [
+        LocalStorage(str(tmp_path / "plain"), compression="none"),
+        LocalStorage(str(tmp_path / "gzip"), compression="gzip"),
+        S3Storage("reports", client=FakeS3Client(page_size=2), compression="gzip"),
+    ]
+
+
+# 1. Test every backend round-trips files, compressing only where it pays, and lists them across pages
+def test_round_trip(tmp_path):
+    async def scenario(storage):
+        await storage.save("a_report.pdf", TEXT)
+        await storage.save("b_scan.pdf", SCANNED)
+        await storage.save("c_other.pdf", b"x")
+        assert await storage.read("a_report.pdf") == TEXT
+        assert b"".join([chunk async for chunk in storage.stream("b_scan.pdf")]) == SCANNED
+        async with storage.local_path("a_report.pdf") as path:
+            assert path.read_bytes() == TEXT
+        assert await storage.keys() == ["a_report.pdf", "b_scan.pdf", "c_other.pdf"]
+
+        stored = {name: gzipped for name, gzipped in
+                  (storage._find(k) for k in ("a_report.pdf", "b_scan.pdf"))}
+        assert list(stored.values()) == [storage.compression == "gzip", False]
+
+        assert await storage.delete("a_report.pdf") and not await storage.exists("a_report.pdf")
+        assert not await storage.delete("a_report.pdf")
+        with pytest.raises(FileNotFoundError):
+            await storage.read("a_report.pdf")
+    for storage in _stores(tmp_path):
+        asyncio.run(scenario(storage))
+
+
+# 2. Test files are sharded into hash-prefix directories and flat pre-sharding files still resolve
+def test_sharded_layout_and_legacy_files(tmp_path):
+    async def scenario():
+        storage = LocalStorage(str(tmp_path))
+        (tmp_path / "old_report.pdf").write_bytes(TEXT)
+        assert await storage.read("old_report.pdf") == TEXT
+
+        await storage.save("new_report.pdf", TEXT)
+        assert (tmp_path / shard("new_report.pdf")).is_file()
+        assert len(shard("new_report.pdf").split("/")) == 3
+
+        # Re-saving a legacy file moves it into the sharded layout
+        await storage.save("old_report.pdf", TEXT)
+        assert not (tmp_path / "old_report.pdf").exists()
+        assert await storage.keys() == ["new_report.pdf", "old_report.pdf"]
+    asyncio.run(scenario())
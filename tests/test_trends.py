@@ -0,0 +1,37 @@
+from server.diagnosis.trends import compute_trends, select_trends, format_trend_summary
+
+DAY = 86400.0
+
+def _row(test, value, day, low=None, high=None):
+    return {"test": test, "name": test.upper(), "value": value, "unit": "mg/dL",
+            "ref_low": low, "ref_high": high, "report_date": 1_700_000_000 + day * DAY,
+            "source": f"report_{day}.pdf"}
+
+ROWS = [
+    _row("triglycerides", 180, 0, 10, 200),
+    _row("triglycerides", 210, 30, 10, 200),
+    _row("triglycerides", 244, 60, 10, 200),
+    _row("hdl cholesterol", 45, 0, 35, 85),
+    _row("hdl cholesterol", 46, 60, 35, 85),
+]
+
+# 1. Test per-test statistics
+def test_compute_trends_delta_slope_and_flags():
+    trends = compute_trends(ROWS)
+    tg = trends["triglycerides"]
+    assert tg["n"] == 3
+    assert tg["delta"] == 64
+    assert round(tg["slope_per_30d"]) == 32
+    assert tg["direction"] == "rising"
+    assert tg["out_of_range"] == 2
+    assert tg["latest_flag"] == "high"
+    assert trends["hdl cholesterol"]["direction"] == "stable"
+
+# 2. Test that the prompt stays bounded as history grows
+def test_summary_is_bounded_and_question_first():
+    rows = ROWS + [_row(f"test {i}", i, 0) for i in range(50)]
+    trends = compute_trends(rows)
+    tests = select_trends(trends, "How is my HDL cholesterol doing?", limit=5)
+    assert tests[0] == "hdl cholesterol"
+    assert tests[1] == "triglycerides"
+    assert len(format_trend_summary(trends, tests).splitlines()) == 5